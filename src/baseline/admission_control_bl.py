@@ -1,9 +1,6 @@
-import gurobipy as gp
-from gurobipy import GRB
 from dataclasses import dataclass
 import numpy as np
 from typing import Optional
-import copy
 import sys
 import os
 from job.job_info import JobInfo
@@ -13,6 +10,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"
 
 from network.graph import Graph, Link
 from network.path_finder import PathFinder
+from network.residual import ResidualCapacity
 from params import SCHEDULE_INTERVAL
 
 # 基于 BATE 中的准入控制策略实现
@@ -29,7 +27,8 @@ class FCFS():
 
         self.network: Graph = network
         self.path_finder: PathFinder = PathFinder(network)
-        self.link_alloc: dict[int, float] = {}
+        # 链路剩余容量，Graph 保持不变，可以被其他策略共享
+        self.residual: ResidualCapacity = ResidualCapacity(network)
 
     def get_demand(self, job: JobInfo) -> list[Demand]:
         # 获取任务的需求，相同 (src, dst) 的带宽取最大值
@@ -55,9 +54,7 @@ class FCFS():
 
             # 检查路径上的链路是否有足够的剩余容量
             for link in path:
-                if link.link_id not in self.link_alloc:
-                    self.link_alloc[link.link_id] = 0
-                if (link.capacity - self.link_alloc[link.link_id]) < bw:
+                if self.residual[link.link_id] < bw:
                     return 0  # 链路容量不足，直接拒绝
                 
                 if link.link_id not in job_link_alloc:
@@ -65,9 +62,8 @@ class FCFS():
                 job_link_alloc[link.link_id] = max(job_link_alloc[link.link_id], bw)
 
         for link_id, bw in job_link_alloc.items():
-            if link_id not in self.link_alloc:
-                self.link_alloc[link_id] = 0
-            self.link_alloc[link_id] += bw
+            self.residual.consume(link_id, bw)
+        self.residual.commit()
 
         return 1  # 成功部署需求
 
@@ -77,26 +73,25 @@ class FCFS():
 
         # 重编排已接受的需求以适应新需求
 
-        # 备份当前网络状态
-        original_edges = copy.deepcopy(self.network.edges)
+        # 记录检查点，失败时回滚剩余容量
+        checkpoint = self.residual.checkpoint()
 
         # 遍历需求列表
         for demand in demands:
             src, dst, bw = demand.src, demand.dst, demand.bw
 
             # 贪心算法：优先选择剩余容量和可用性乘积较小的隧道
-            path = self.path_finder.find_path(src, dst)
+            path = self.path_finder.find_path(src, dst, self.residual.residual)
             if not path:
-                self.network.edges = original_edges  # 恢复网络状态
+                self.residual.rollback(checkpoint)  # 恢复网络状态
                 return 0
 
             # 检查路径上的链路是否有足够的剩余容量
-            for link in path:
-                if link.capacity < bw:
-                    self.network.edges = original_edges  # 恢复网络状态
-                    return 0  # 链路容量不足，拒绝
+            if not self.residual.fits(path, bw):
+                self.residual.rollback(checkpoint)  # 恢复网络状态
+                return 0  # 链路容量不足，拒绝
 
-            for link in path:
-                link.capacity -= bw
+            self.residual.consume_path(path, bw)
 
+        self.residual.commit()
         return 1  # 成功重编排需求
\ No newline at end of file
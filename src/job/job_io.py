@@ -0,0 +1,23 @@
+import json
+from job.job_info import JobInfo, EPOCH
+from job.workload import Workload
+
+# 任务文件的读取：时间按 epoch 取整，周期和结束时间向上取整，开始时间向下取整
+
+def load_jobs(jobs_file: str) -> list[JobInfo]:
+    with open(jobs_file, 'r') as f:
+        jobs_data = json.load(f)
+    jobs: list[JobInfo] = []
+    for job in jobs_data:
+        job_id = job['job_id']
+        cycle = (job['cycle(ms)'] + EPOCH - 1) // EPOCH # 向上取整
+        workloads = []
+        for workload in job['workloads']:
+            src = workload['src_rank']
+            dst = workload['dst_rank']
+            t_s = workload['start_timestamp(ms)'] // EPOCH # 向下取整
+            t_e = (workload['end_timestamp(ms)'] + EPOCH - 1) // EPOCH # 向上取整
+            bw = workload['bandwidth(Gbps)']
+            workloads.append(Workload(src, dst, t_s, t_e, bw))
+        jobs.append(JobInfo(job_id, cycle, workloads))
+    return jobs
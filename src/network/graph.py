@@ -13,11 +13,15 @@ class Graph:
         self.link_num = 0
         self.nodes: set[int] = set() # node_id
         self.edges: dict[int, list[Link]] = {}  # src_id -> list[Link]
+        self.links: list[Link] = [] # link_id -> Link
+        self.node_types: dict[int, str] = {} # node_id -> HOST / LEAF / SPINE / CORE
         
-    def add_node(self, node_id: int) -> None:
+    def add_node(self, node_id: int, node_type: str = None) -> None:
         if node_id not in self.nodes:
             self.nodes.add(node_id)
             self.edges[node_id] = []
+        if node_type is not None:
+            self.node_types[node_id] = node_type
 
     def add_edge(self, src: int, dst: int, capacity: float) -> None:
         self.add_node(src)
@@ -26,6 +30,10 @@ class Graph:
         link = Link(self.link_num, src, dst, capacity)
         self.link_num += 1
         self.edges[src].append(link)
+        self.links.append(link)
+
+    def get_link(self, link_id: int) -> Link:
+        return self.links[link_id]
 
     @classmethod
     def from_dataframe(cls, df: pd.DataFrame) -> 'Graph':
@@ -37,6 +45,9 @@ class Graph:
             dst = int(row['z_node_id'])
             capacity = float(row['bw(GBps)'])
             
+            if 'a_node_type' in row and 'z_node_type' in row:
+                graph.add_node(src, row['a_node_type'])
+                graph.add_node(dst, row['z_node_type'])
             graph.add_edge(src, dst, capacity)
             
         return graph
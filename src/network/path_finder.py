@@ -1,12 +1,17 @@
 from .graph import Graph, Link
+from typing import AbstractSet, Optional, Sequence
 import heapq
+import itertools
 
 class PathFinder:
     def __init__(self, graph: Graph):
         self.graph = graph
 
-    def find_path(self, src: int, dst: int) -> list[Link]:
+    def find_path(self, src: int, dst: int, capacity: Optional[Sequence[float]] = None,
+                  excluded: Optional[AbstractSet[int]] = None) -> list[Link]:
         # 寻找一条最短路
+        # capacity 非空时用其中的链路剩余容量（link_id -> 容量）代替 Link.capacity 作为优先级
+        # excluded 中的链路（如故障链路）不参与寻路
         path: list[Link] = []
 
         pq = []  # 优先队列，存储 (优先级, 当前节点, 路径)
@@ -23,11 +28,40 @@ class PathFinder:
                 return path
 
             for link in self.graph.edges.get(node, []):
+                if excluded is not None and link.link_id in excluded:
+                    continue
                 if link.dst not in visited:
-                    heapq.heappush(pq, (link.capacity, link.dst, path + [link]))
+                    priority = link.capacity if capacity is None else capacity[link.link_id]
+                    heapq.heappush(pq, (priority, link.dst, path + [link]))
 
         return []
     
+    def find_backup_path(self, src: int, dst: int, avoid: AbstractSet[int],
+                         excluded: Optional[AbstractSet[int]] = None) -> list[Link]:
+        # 寻找与 avoid 中的链路（主隧道）重叠最少的路径，重叠数相同时跳数最少，用于备份隧道
+        # 接入链路等无法绕开的链路允许重叠，能完全不相交时返回的路径与主隧道链路不相交
+        pq = []  # 优先队列，存储 (重叠链路数, 跳数, 序号, 当前节点, 路径)
+        counter = itertools.count()
+        heapq.heappush(pq, (0, 0, next(counter), src, []))
+        visited = set()
+
+        while pq:
+            shared, hops, _, node, path = heapq.heappop(pq)
+            if node in visited:
+                continue
+            visited.add(node)
+
+            if node == dst:
+                return path
+
+            for link in self.graph.edges.get(node, []):
+                if excluded is not None and link.link_id in excluded:
+                    continue
+                if link.dst not in visited:
+                    heapq.heappush(pq, (shared + (link.link_id in avoid), hops + 1, next(counter), link.dst, path + [link]))
+
+        return []
+
     def find_multi_path(self, src: int, dst: int, num_paths: int = 3) -> list[list[Link]]:
         paths: list[list[Link]] = []
         visited = set()
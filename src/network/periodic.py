@@ -0,0 +1,72 @@
+import math
+import numpy as np
+from params import HYPERPERIOD_LIMIT
+
+class PeriodicLoad:
+    # 链路上周期流量的负载
+    # 相同周期的流量合并为一个余数剖面：长度为 cycle 的数组，第 r 个元素为余数 r 处的总带宽
+    # 查询结果按 (cycle, t_s, t_e, offset) 缓存，负载变化时失效
+
+    def __init__(self):
+        self.profiles: dict[int, np.ndarray] = {} # cycle -> 余数剖面
+        self.groups: list[tuple[int, np.ndarray]] = None # 合并后的剖面 (重叠周期, 剖面)，负载变化时失效
+        self.cache: dict[tuple[int, int, int, int], float] = {}
+
+    def update(self, cycle: int, offset: int, t_s: int, t_e: int, bw: float) -> None:
+        # 流量在 (t - offset) % cycle ∈ [t_s, t_e) 时活跃
+        profile = self.profiles.setdefault(cycle, np.zeros(cycle))
+        np.add.at(profile, (np.arange(t_s, t_e) + offset) % cycle, bw)
+        # 该周期的流量全部移除后删除剖面，避免无谓地增大重叠周期
+        if bw < 0 and np.all(np.abs(profile) < 1e-9):
+            del self.profiles[cycle]
+        self.groups = None
+        self.cache.clear()
+
+    def add(self, cycle: int, offset: int, t_s: int, t_e: int, bw: float) -> None:
+        self.update(cycle, offset, t_s, t_e, bw)
+
+    def remove(self, cycle: int, offset: int, t_s: int, t_e: int, bw: float) -> None:
+        self.update(cycle, offset, t_s, t_e, -bw)
+
+    def merged_groups(self) -> list[tuple[int, np.ndarray]]:
+        # 将余数剖面合并为若干组，每组的重叠周期不超过 HYPERPERIOD_LIMIT，组内剖面按重叠周期展开后相加
+        if self.groups is None:
+            self.groups = []
+            for cycle, profile in sorted(self.profiles.items()):
+                for index, (group_cycle, group_profile) in enumerate(self.groups):
+                    merged_cycle = math.lcm(group_cycle, cycle)
+                    if merged_cycle <= HYPERPERIOD_LIMIT:
+                        self.groups[index] = (
+                            merged_cycle,
+                            np.tile(group_profile, merged_cycle // group_cycle) + np.tile(profile, merged_cycle // cycle)
+                        )
+                        break
+                else:
+                    self.groups.append((cycle, profile))
+        return self.groups
+
+    def window_peak(self, cycle: int, t_s: int, t_e: int, offset: int = 0) -> float:
+        # 满足 (t - offset) % cycle ∈ [t_s, t_e) 的所有时刻 t 上的最大负载
+        if t_s >= t_e or not self.profiles:
+            return 0.0
+        key = (cycle, t_s, t_e, offset)
+        if key not in self.cache:
+            self.cache[key] = sum(
+                self.group_window_peak(group_cycle, group_profile, cycle, t_s, t_e, offset)
+                for group_cycle, group_profile in self.merged_groups()
+            )
+        return self.cache[key]
+
+    def group_window_peak(self, group_cycle: int, profile: np.ndarray, cycle: int, t_s: int, t_e: int, offset: int) -> float:
+        hyperperiod = math.lcm(cycle, group_cycle)
+        if hyperperiod <= HYPERPERIOD_LIMIT:
+            # 重叠周期有界：在一个重叠周期内逐 epoch 精确计算
+            times = ((np.arange(t_s, t_e) + offset)[None, :] + cycle * np.arange(hyperperiod // cycle)[:, None]).ravel()
+            return float(profile[times % group_cycle].max())
+
+        # 重叠周期过大：t % cycle 落在窗口内时，t % group_cycle 只能取与窗口内余数模 gcd 同余的值
+        # 在这些余数上取最大值，不展开重叠周期；多个组的结果之和是峰值的上界
+        g = math.gcd(cycle, group_cycle)
+        reachable = np.zeros(g, dtype=bool)
+        reachable[(np.arange(t_s, t_e) + offset) % g] = True
+        return float(profile[reachable[np.arange(group_cycle) % g]].max())
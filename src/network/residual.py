@@ -0,0 +1,36 @@
+import numpy as np
+from network.graph import Graph, Link
+
+class ResidualCapacity:
+    # 链路剩余容量向量，覆盖在只读的 Graph 之上，调度过程中不修改 Link.capacity
+    # 每次修改记录到撤销日志中，回滚到检查点只需撤销其后的修改，开销与修改的链路数成正比
+
+    def __init__(self, network: Graph):
+        self.residual = np.array([link.capacity for link in network.links], dtype=float) # link_id -> 剩余容量
+        self.undo_log: list[tuple[int, float]] = [] # (link_id, 修改量)
+
+    def __getitem__(self, link_id: int) -> float:
+        return self.residual[link_id]
+
+    def fits(self, path: list[Link], bw: float) -> bool:
+        return all(self.residual[link.link_id] >= bw for link in path)
+
+    def consume(self, link_id: int, bw: float) -> None:
+        self.residual[link_id] -= bw
+        self.undo_log.append((link_id, bw))
+
+    def consume_path(self, path: list[Link], bw: float) -> None:
+        for link in path:
+            self.consume(link.link_id, bw)
+
+    def checkpoint(self) -> int:
+        return len(self.undo_log)
+
+    def rollback(self, checkpoint: int) -> None:
+        while len(self.undo_log) > checkpoint:
+            link_id, bw = self.undo_log.pop()
+            self.residual[link_id] += bw
+
+    def commit(self) -> None:
+        # 提交后不能再回滚到之前的检查点
+        self.undo_log.clear()
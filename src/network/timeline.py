@@ -0,0 +1,22 @@
+import numpy as np
+from functools import lru_cache
+from params import SCHEDULE_INTERVAL
+
+# 每隔 SCHEDULE_INTERVAL 进行一次流量调度，因此时间线只需覆盖 [0, SCHEDULE_INTERVAL) 内的每个 epoch
+HORIZON = SCHEDULE_INTERVAL
+
+@lru_cache(maxsize=65536)
+def active_mask(cycle: int, start_time: int, t_s: int, t_e: int) -> np.ndarray:
+    # 周期流量在时间线上的活跃 epoch：(t - start_time) % cycle ∈ [t_s, t_e)
+    # 返回只读数组，多个调用方共享同一份缓存
+    time_in_circle = (np.arange(HORIZON) - start_time) % cycle
+    mask = (time_in_circle >= t_s) & (time_in_circle < t_e)
+    mask.setflags(write=False)
+    return mask
+
+@lru_cache(maxsize=65536)
+def active_epochs(cycle: int, start_time: int, t_s: int, t_e: int) -> np.ndarray:
+    # active_mask 对应的 epoch 下标，用于按列批量索引时间线矩阵
+    epochs = np.flatnonzero(active_mask(cycle, start_time, t_s, t_e))
+    epochs.setflags(write=False)
+    return epochs
@@ -1,2 +1,8 @@
 # Phase 2 流量调度的时间间隔
-SCHEDULE_INTERVAL = 1000 # (epoch)
\ No newline at end of file
+SCHEDULE_INTERVAL = 1000 # (epoch)
+
+# 周期流量重叠周期（各周期的最小公倍数）的上限，超过时按周期余数分组估计峰值
+HYPERPERIOD_LIMIT = 1 << 16 # (epoch)
+
+# Phase 2 链路瓶颈查询缓存的容量（条目数）
+BOTTLENECK_CACHE_SIZE = 4096
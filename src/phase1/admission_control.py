@@ -1,8 +1,8 @@
-import gurobipy as gp
-from gurobipy import GRB
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import numpy as np
-from typing import Optional
+import bisect
+import time
+from typing import Iterable, Optional
 import copy
 import sys
 import os
@@ -13,6 +13,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"
 
 from network.graph import Graph, Link
 from network.path_finder import PathFinder
+from network.timeline import HORIZON, active_mask
 from params import SCHEDULE_INTERVAL
 # 每隔 SCHEDULE_INTERVAL 进行一次流量调度，因此最多考虑 SCHEDULE_INTERVAL 个 epoch 的重叠周期即可
 
@@ -36,9 +37,72 @@ class JobSchedule:
     bw_alloc: list[float] # 每个负载在隧道上分配的带宽
     # TODO: 这里只考虑每个负载单条流的情况，bw_alloc 一定等于负载的 bw，后续输入多条隧道时再进行修改
 
+# 局部调整的统计
+@dataclass
+class AdjustStats:
+    calls: int = 0 # 局部调整的任务数
+    admissions: int = 0 # 局部调整成功准入的任务数
+    budget_exhausted: int = 0 # 时间预算耗尽的次数
+    budget_admissions: int = 0 # 预算耗尽时按已找到的启动时间准入的任务数
+    time: float = 0.0 # (s)
+
+    def report(self) -> str:
+        exhausted_rate = self.budget_exhausted / self.calls if self.calls > 0 else 0.0
+        per_call = self.time / self.calls if self.calls > 0 else 0.0
+        return (f"Local adjust: calls = {self.calls}, admissions = {self.admissions}, "
+                f"budget exhausted = {self.budget_exhausted} ({exhausted_rate:.2%}, {self.budget_admissions} admitted), "
+                f"time = {self.time * 1000:.2f} ms ({per_call * 1000:.2f} ms per call)")
+
+# 准入决策缓存的统计
+@dataclass
+class DecisionCacheStats:
+    hits: int = 0
+    misses: int = 0
+
+    def report(self) -> str:
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total > 0 else 0.0
+        return f"Decision cache: hits = {self.hits}, misses = {self.misses}, hit rate = {hit_rate:.2%}"
+
+# 任务签名：(cycle, 每个负载的 (src, dst, t_s, t_e, bw), 优先级)
+JobSignature = tuple[int, tuple[tuple[int, int, int, int, float], ...], Optional[float]]
+
+# 抢占准入的统计
+@dataclass
+class PreemptionStats:
+    attempts: int = 0 # 尝试抢占的次数
+    admissions: int = 0 # 抢占成功准入的任务数
+    rollbacks: int = 0 # 提交后校验失败而回滚的次数
+    evictions: list[int] = field(default_factory=list) # 每次抢占准入驱逐的任务数
+    time: float = 0.0 # (s)
+
+    def report(self) -> str:
+        evicted = sum(self.evictions)
+        per_admission = evicted / self.admissions if self.admissions > 0 else 0.0
+        return (f"Preemption: attempts = {self.attempts}, admissions = {self.admissions}, "
+                f"evicted jobs = {evicted} ({per_admission:.2f} per admission), rollbacks = {self.rollbacks}, "
+                f"time = {self.time * 1000:.2f} ms")
+
+# 链路容量变化后的恢复结果
+@dataclass
+class LinkRecovery:
+    link_id: int
+    capacity: float # (Gbps)
+    affected: int = 0 # 隧道经过该链路的负载数
+    failover: int = 0 # 切换到备份隧道的负载数
+    rerouted: int = 0 # 成功重新选路的负载数
+    dropped: list[int] = field(default_factory=list) # 无法重新选路而被撤销准入的任务
+    latency: float = 0.0 # (s)
+
+    def report(self) -> str:
+        return (f"Link {self.link_id} capacity -> {self.capacity}: affected workloads = {self.affected}, "
+                f"failover = {self.failover}, rerouted = {self.rerouted}, dropped jobs = {len(self.dropped)}, "
+                f"recovery latency = {self.latency * 1000:.2f} ms")
+
 class AdmissionController():
 
-    def __init__(self, network: Graph):
+    def __init__(self, network: Graph, preemption: bool = False, backup: bool = False, adjust_budget: Optional[float] = None,
+                 decision_cache: bool = False):
 
         self.network: Graph = network
 
@@ -58,9 +122,52 @@ class AdmissionController():
         self.link_peak_bw_points: dict[int, int] = {} # link_id -> peak_bandwidth_time_point
         # 任务调度
         self.job_schedules: dict[int, JobSchedule] = {} # job_id -> JobSchedule
+        # 任务的流量在链路流量列表中的位置，用于按任务删除流量
+        self.job_flows: dict[int, set[tuple[int, int]]] = {} # job_id -> {(link_id, 流量下标)}
+        # 删除流量后峰值带宽和变化时间点待更新的链路，在下一次准入前统一更新
+        self.stale_links: set[int] = set()
         
         # 参数设置
         self.strat_time_step = 10 # 枚举启动时间的步长
+        # 每个任务局部调整的时间预算（秒），为空时不限制
+        self.adjust_budget = adjust_budget
+        # 预算模式下计算链路负载时间线的累计耗时（秒）和累计流量数，按每条流量的平均耗时为收尾时检查尚未计算的链路预留时间
+        self.timeline_time = 0.0
+        self.timeline_flows = 0
+        self.adjust_stats = AdjustStats()
+
+        # 抢占准入：高优先级任务准入失败时驱逐低优先级的已准入任务
+        self.preemption = preemption
+        # 任务优先级，数值越小优先级越高
+        self.job_priority: dict[int, float] = {} # job_id -> priority
+        # 链路上已准入的任务，按 (-优先级, -带宽, job_id) 排序，靠前的任务优先被驱逐
+        self.link_jobs: dict[int, list[tuple[float, float, int]]] = {} # link_id -> [(-priority, -bw, job_id)]
+        self.preemption_stats = PreemptionStats()
+
+        # 链路容量，覆盖在只读的 Graph 之上，链路故障或降速时由 set_link_capacity 修改
+        self.capacity = np.array([link.capacity for link in network.links], dtype=float) # link_id -> 容量
+        # 容量为 0 的故障链路，寻路时排除
+        self.down_links: set[int] = set()
+        # 链路上已准入的负载，链路容量变化时只处理这些负载
+        self.link_workloads: dict[int, set[tuple[int, int]]] = {} # link_id -> {(job_id, workload_id)}
+
+        # 链路版本号：链路上的流量、流量所属任务的启动时间或链路容量变化时递增，只增不减
+        self.link_version = np.zeros(network.link_num, dtype=np.int64)
+        # 链路内容标识栈：添加流量时压入新的标识，回滚（pop_traffic）时弹出，恢复为添加前的标识
+        # 其他变化（删除流量、启动时间或容量变化）清空栈并换成新的标识，标识从不重复使用
+        self.link_states: list[list[int]] = [[0] for _ in range(network.link_num)]
+        self.state_clock = 0 # 最近分配的内容标识
+        # 准入决策缓存：被拒绝的任务签名 -> (隧道链路编号, 拒绝时各链路的内容标识)
+        # 相同签名的任务再次提交且这些链路的内容都没有变化时，直接返回拒绝
+        self.decision_cache_enabled = decision_cache
+        self.decision_cache: dict[JobSignature, tuple[list[tuple[int, ...]], tuple[int, ...]]] = {}
+        self.decision_cache_stats = DecisionCacheStats()
+        # 最近一次局部调整耗尽时间预算的任务，其拒绝结果与链路状态无关，不缓存
+        self.expired_job: Optional[int] = None
+
+        # 备份隧道：准入时为每个负载预留一条与主隧道链路不相交的隧道，故障时直接切换
+        self.backup = backup
+        self.backup_tunnels: dict[tuple[int, int], tuple[int, ...]] = {} # (job_id, workload_id) -> 链路编号
 
     def update_peak_bw(self, link_id: int) -> None:
         
@@ -87,6 +194,8 @@ class AdmissionController():
         
         # 添加流量
         self.link_traffic[link_id].append(traffic)
+        self.job_flows.setdefault(traffic.job_id, set()).add((link_id, len(self.link_traffic[link_id]) - 1))
+        self.push_state(link_id)
 
         # 重叠流量周期
         # circle_list = []
@@ -106,11 +215,154 @@ class AdmissionController():
 
         # 更新链路峰值带宽
         self.update_peak_bw(link_id)
+
+    def append_traffic(self, link_id: int, traffic: Traffic) -> None:
+        # 添加流量但不更新变化时间点和峰值带宽，链路标记为待更新（局部调整的预算模式使用）
+        self.link_traffic[link_id].append(traffic)
+        self.job_flows.setdefault(traffic.job_id, set()).add((link_id, len(self.link_traffic[link_id]) - 1))
+        self.push_state(link_id)
+        self.stale_links.add(link_id)
+
+    def pop_traffic(self, link_id: int) -> None:
+        # 删除链路上最后添加的流量（回滚用）
+        traffic = self.link_traffic[link_id].pop()
+        self.job_flows[traffic.job_id].discard((link_id, len(self.link_traffic[link_id])))
+        self.pop_state(link_id)
+        self.stale_links.add(link_id)
+
+    def remove_flow(self, link_id: int, index: int) -> None:
+        # 删除链路上的一条流量：将最后一条流量移到被删除的位置
+        flows = self.link_traffic[link_id]
+        self.job_flows[flows[index].job_id].discard((link_id, index))
+        last = flows.pop()
+        if index < len(flows):
+            flows[index] = last
+            self.job_flows[last.job_id].discard((link_id, len(flows)))
+            self.job_flows[last.job_id].add((link_id, index))
+        self.renew_state(link_id)
+        self.stale_links.add(link_id)
+
+    def touch_job(self, job_id: int) -> None:
+        # 任务启动时间变化，其经过的所有链路的负载都发生变化
+        for link_id in {link_id for link_id, _ in self.job_flows.get(job_id, ())}:
+            self.renew_state(link_id)
+
+    def push_state(self, link_id: int) -> None:
+        # 链路添加了一条流量
+        self.link_version[link_id] += 1
+        self.state_clock += 1
+        self.link_states[link_id].append(self.state_clock)
+
+    def pop_state(self, link_id: int) -> None:
+        # 链路删除了最后添加的流量：此前没有其他变化时恢复为添加前的内容标识
+        self.link_version[link_id] += 1
+        if len(self.link_states[link_id]) > 1:
+            self.link_states[link_id].pop()
+        else:
+            self.renew_state(link_id)
+
+    def renew_state(self, link_id: int) -> None:
+        # 链路内容发生不可回滚的变化
+        self.link_version[link_id] += 1
+        self.state_clock += 1
+        self.link_states[link_id] = [self.state_clock]
+
+    def remove_flows(self, job_id: int) -> None:
+        # 删除任务的所有流量，开销与任务经过的链路数成正比
+        # 同一链路上按下标从大到小删除，保证被移动的流量不是本任务待删除的流量
+        for link_id, index in sorted(self.job_flows.get(job_id, ()), key=lambda flow: -flow[1]):
+            self.remove_flow(link_id, index)
+        self.job_flows.pop(job_id, None)
+
+    def remove_workload_flows(self, job_id: int, workload_id: int) -> None:
+        # 删除单个负载在其隧道上的流量，同一任务在同一链路上时间窗口和带宽相同的流量可以互换
+        workload = self.jobs[job_id].workloads[workload_id]
+        for link in self.job_schedules[job_id].tunnels[workload_id]:
+            for link_id, index in self.job_flows[job_id]:
+                traffic = self.link_traffic[link_id][index]
+                if link_id == link.link_id and (traffic.t_s, traffic.t_e, traffic.bw) == (workload.t_s, workload.t_e, workload.bw):
+                    self.remove_flow(link_id, index)
+                    break
+
+    def refresh_links(self, link_ids: Optional[Iterable[int]] = None) -> None:
+        # 重建待更新链路（或其中 link_ids 的部分）的变化时间点和峰值带宽
+        refresh = self.stale_links if link_ids is None else self.stale_links.intersection(link_ids)
+        for link_id in refresh:
+            self.change_points[link_id] = set()
+            for traffic in self.link_traffic[link_id]:
+                for circle_offset in range(0, SCHEDULE_INTERVAL, traffic.cycle):
+                    start = (traffic.t_s + circle_offset + self.job_schedules[traffic.job_id].start_time) % SCHEDULE_INTERVAL
+                    end = (traffic.t_e + circle_offset + self.job_schedules[traffic.job_id].start_time) % SCHEDULE_INTERVAL
+                    self.change_points[link_id].add(start)
+                    self.change_points[link_id].add(end)
+            self.update_peak_bw(link_id)
+        self.stale_links -= refresh
+
+    def remove_job(self, job_id: int) -> None:
+        # 任务结束，释放其占用的链路带宽并删除任务记录
+        if job_id not in self.job_schedules:
+            return
+        if self.job_schedules[job_id].admit == 1:
+            self.unindex_job(job_id)
+        self.remove_flows(job_id)
+        for workload_id in range(len(self.jobs[job_id].workloads)):
+            self.backup_tunnels.pop((job_id, workload_id), None)
+        del self.job_schedules[job_id]
+        del self.jobs[job_id]
+        self.job_priority.pop(job_id, None)
+
+    def job_link_bw(self, job_id: int) -> dict[int, float]:
+        # 任务在其经过的每条链路上的带宽之和
+        link_bw: dict[int, float] = {}
+        for workload_id, tunnel in enumerate(self.job_schedules[job_id].tunnels):
+            for link in tunnel:
+                link_bw[link.link_id] = link_bw.get(link.link_id, 0.0) + self.jobs[job_id].workloads[workload_id].bw
+        return link_bw
+
+    def index_job(self, job_id: int) -> None:
+        # 将已准入的任务加入链路索引
+        for link_id, bw in self.job_link_bw(job_id).items():
+            bisect.insort(self.link_jobs.setdefault(link_id, []), (-self.job_priority[job_id], -bw, job_id))
+        for workload_id, tunnel in enumerate(self.job_schedules[job_id].tunnels):
+            for link in tunnel:
+                self.link_workloads.setdefault(link.link_id, set()).add((job_id, workload_id))
+
+    def unindex_job(self, job_id: int) -> None:
+        for link_id, bw in self.job_link_bw(job_id).items():
+            self.link_jobs[link_id].remove((-self.job_priority[job_id], -bw, job_id))
+        for workload_id, tunnel in enumerate(self.job_schedules[job_id].tunnels):
+            for link in tunnel:
+                self.link_workloads[link.link_id].discard((job_id, workload_id))
+
+    def routable(self, job_id: int) -> bool:
+        # 故障链路切断负载的源和目的时 find_path 返回空隧道，这样的任务不能准入
+        job = self.jobs[job_id]
+        return all(tunnel or workload.src == workload.dst
+                   for workload, tunnel in zip(job.workloads, self.job_schedules[job_id].tunnels))
+
+    def job_load(self, job_id: int, link_id: int) -> np.ndarray:
+        # 任务在链路上的负载时间线
+        load = np.zeros(HORIZON)
+        start_time = self.job_schedules[job_id].start_time
+        for flow_link_id, index in self.job_flows.get(job_id, ()):
+            if flow_link_id == link_id:
+                traffic = self.link_traffic[link_id][index]
+                load += traffic.bw * active_mask(traffic.cycle, start_time, traffic.t_s, traffic.t_e)
+        return load
+
+    def link_load(self, link_id: int) -> np.ndarray:
+        # 链路上所有流量的负载时间线
+        load = np.zeros(HORIZON)
+        for traffic in self.link_traffic.get(link_id, []):
+            load += traffic.bw * active_mask(traffic.cycle, self.job_schedules[traffic.job_id].start_time, traffic.t_s, traffic.t_e)
+        return load
     
-    def direct_deploy(self, job: JobInfo) -> int:
+    def direct_deploy(self, job: JobInfo, priority: float = 0.0) -> int:
         
         job_id = job.job_id
+        self.refresh_links()
         self.jobs[job_id] = job
+        self.job_priority[job_id] = priority
         self.job_schedules[job_id] = JobSchedule(
             admit = 0,
             start_time = 0,
@@ -121,7 +373,7 @@ class AdmissionController():
         # 基于贪心策略，尝试直接部署任务
         alloc_success = True
         for workload in job.workloads:
-            tunnel: Tunnel = self.path_finder.find_path(workload.src, workload.dst)
+            tunnel: Tunnel = self.path_finder.find_path(workload.src, workload.dst, excluded=self.down_links)
             self.job_schedules[job_id].tunnels.append(tunnel)
 
             # TODO: 如果后续改为每个负载多条流，则这里需要遍历所有隧道依次分配带宽
@@ -133,9 +385,9 @@ class AdmissionController():
                     self.link_traffic[link.link_id] = []
                     self.change_points[link.link_id] = set()
 
-                if (link.capacity - self.link_peak_bw[link.link_id]) < workload.bw: # 链路剩余容量小于所需带宽
+                if (self.capacity[link.link_id] - self.link_peak_bw[link.link_id]) < workload.bw: # 链路剩余容量小于所需带宽
                     alloc_success = False
-        if not alloc_success:
+        if not alloc_success or not self.routable(job_id):
             # 直接部署失败
             return 0
                 
@@ -161,6 +413,9 @@ class AdmissionController():
                     self.link_traffic[link_id] = []
                 # 添加流量
                 self.add_traffic(link_id, traffic)
+        self.index_job(job_id)
+        if self.backup:
+            self.reserve_backups(job_id)
         return 1
 
     def link_adjust(self, link_id: int, link_capacity: float) -> bool:
@@ -187,23 +442,72 @@ class AdmissionController():
                 if self.link_peak_bw[link_id] <= link_capacity:
                     # 该链路的局部调整成功（使总带宽没有超出链路容量）
                     # TODO: 还需要检查该任务经过的其他链路是否溢出
+                    self.touch_job(job_id)
                     return True
             # 回退当前任务启动时间
             self.job_schedules[job_id].start_time = original_start_time
                 
         return False
-            
 
-    def local_adjust(self, job: JobInfo) -> int:
+    def timeline_adjust(self, link_id: int, link_capacity: float, loads: dict[int, np.ndarray], job_id: int, deadline: float) -> bool:
+        # 预算模式下的 link_adjust：按负载时间线调整峰值时刻活跃任务（不包括正在准入的任务 job_id）的启动时间
+        # 带宽大的任务优先，一次向量化评估任务的所有候选启动时间，接受第一个使链路不超出容量的启动时间
+        # loads 为本次局部调整已计算的链路负载时间线，移动任务后增量更新
+        load = loads[link_id]
+        peak_point = int(load.argmax())
+        job_bw: dict[int, float] = {}
+        for traffic in self.link_traffic[link_id]:
+            other_id = traffic.job_id
+            if other_id != job_id and active_mask(traffic.cycle, self.job_schedules[other_id].start_time, traffic.t_s, traffic.t_e)[peak_point]:
+                job_bw[other_id] = max(job_bw.get(other_id, 0.0), traffic.bw)
+
+        for other_id in sorted(job_bw, key=lambda other_id: -job_bw[other_id]):
+            if time.time() > deadline:
+                return False
+            base = load - self.job_load(other_id, link_id)
+            flows = [self.link_traffic[link_id][index] for flow_link_id, index in self.job_flows[other_id] if flow_link_id == link_id]
+            start_times = list(range(0, self.jobs[other_id].cycle, self.strat_time_step))
+            shifted = np.stack([
+                sum(traffic.bw * active_mask(traffic.cycle, start_time, traffic.t_s, traffic.t_e) for traffic in flows)
+                for start_time in start_times
+            ])
+            fits = (base + shifted).max(axis=1) <= link_capacity + 1e-9
+            if fits.any():
+                # 启动时间变化后，任务经过的链路的变化时间点和峰值带宽在下一次准入前更新
+                moved_links = {flow_link_id for flow_link_id, _ in self.job_flows[other_id]}
+                old_loads = {flow_link_id: self.job_load(other_id, flow_link_id) for flow_link_id in moved_links if flow_link_id in loads}
+                self.job_schedules[other_id].start_time = start_times[int(fits.argmax())]
+                for flow_link_id, old_load in old_loads.items():
+                    loads[flow_link_id] += self.job_load(other_id, flow_link_id) - old_load
+                self.touch_job(other_id)
+                self.stale_links.update(moved_links)
+                return True
+        return False
 
-        # 为了节约时间，仅调整限制次数
-        # max_call_time = 99999
+    def local_adjust(self, job: JobInfo, budget: Optional[float] = None) -> int:
+
+        # 为了节约时间，限制局部调整的时间（秒），默认使用 self.adjust_budget
+        # 设置了预算时按负载时间线检查和调整，不重新计算峰值带宽（涉及的链路标记为待更新，在下一次准入前更新）
+        # 预算耗尽时保留已完成的启动时间调整，本任务按当前调度可行则准入，否则回退本任务的流量
+        self.expired_job = None
+        if not self.routable(job.job_id):
+            return 0
+        budget = self.adjust_budget if budget is None else budget
+        timer = time.time()
+        deadline = None if budget is None else timer + budget
+        self.adjust_stats.calls += 1
 
         job_id = job.job_id
+        if deadline is None:
+            self.refresh_links()
         # 记录分配到了第几个负载，用于后续无法准入时回退
         rollback_count = 0
+        # 预算模式下本次调用已计算的链路负载时间线 link_id -> load
+        loads: dict[int, np.ndarray] = {}
+        job_links = {link.link_id for tunnel in self.job_schedules[job_id].tunnels for link in tunnel}
         
         tag = True
+        expired = False
         for workload_id, workload in enumerate(job.workloads):
 
             tunnel: Tunnel = self.job_schedules[job_id].tunnels[workload_id]
@@ -216,22 +520,48 @@ class AdmissionController():
                     bw = workload.bw
                 )
             for link in tunnel:
+                # 预留收尾时计算其余链路负载时间线的时间
+                if deadline is not None and time.time() + self.timeline_reserve(job_links, loads) > deadline:
+                    expired = True
+                    break
                 rollback_count += 1
-                self.add_traffic(link.link_id, traffic)
-                if self.link_peak_bw[link.link_id] > link.capacity:
+                if deadline is None:
+                    self.add_traffic(link.link_id, traffic)
+                    overloaded = self.link_peak_bw[link.link_id] > self.capacity[link.link_id]
+                else:
+                    self.append_timeline(link.link_id, traffic, loads)
+                    overloaded = loads[link.link_id].max() > self.capacity[link.link_id] + 1e-9
+                if overloaded:
                     # 负载分配失败，尝试局部调整
                     # if max_call_time > 0:
                     #     adjust_success = self.link_adjust(link.link_id, link.capacity)
                     # else:
                     #     adjust_success = False
-                    adjust_success = self.link_adjust(link.link_id, link.capacity)
+                    if deadline is None:
+                        adjust_success = self.link_adjust(link.link_id, self.capacity[link.link_id])
+                    else:
+                        adjust_success = self.timeline_adjust(link.link_id, self.capacity[link.link_id], loads, job_id, deadline)
 
                     # max_call_time -= 1
                     if adjust_success == False:
-                        tag = False
+                        if deadline is not None and time.time() + self.timeline_reserve(job_links, loads) > deadline:
+                            expired = True
+                        else:
+                            tag = False
                         break
-            if tag == False:
+            if tag == False or expired:
                 break
+
+        if deadline is not None and tag:
+            # 预算模式收尾：预算耗尽时加入本任务剩余的流量，再按负载时间线检查本任务经过的所有链路
+            # （后面的调整可能移动了经过前面链路的任务）
+            if expired:
+                self.adjust_stats.budget_exhausted += 1
+                self.expired_job = job_id
+                rollback_count = self.finish_deploy(job, rollback_count, loads)
+            tag = self.fits_timeline(job, loads)
+            if expired and tag:
+                self.adjust_stats.budget_admissions += 1
         
         if tag == False:
             # 回退已分配流量
@@ -241,10 +571,14 @@ class AdmissionController():
 
                     rollback_count -= 1
                     if rollback_count < 0:
-                        return 0
+                        break
                     
                     # 删除最后一个元素（即当前任务的流量）
-                    self.link_traffic[link.link_id].pop()
+                    self.pop_traffic(link.link_id)
+                if rollback_count < 0:
+                    break
+            self.adjust_stats.time += time.time() - timer
+            return 0
 
         else:
             # 任务准入
@@ -254,7 +588,322 @@ class AdmissionController():
             # 分配带宽
             for workload_id, workload in enumerate(job.workloads):
                 self.job_schedules[job_id].bw_alloc.append(workload.bw)
+            self.index_job(job_id)
+            if self.backup:
+                self.reserve_backups(job_id)
+            self.adjust_stats.admissions += 1
+            self.adjust_stats.time += time.time() - timer
             return 1
+
+    def timeline(self, link_id: int, loads: dict[int, np.ndarray]) -> np.ndarray:
+        # 预算模式下取链路负载时间线，首次计算时累计耗时
+        if link_id not in loads:
+            timer = time.time()
+            loads[link_id] = self.link_load(link_id)
+            self.timeline_time += time.time() - timer
+            self.timeline_flows += len(self.link_traffic.get(link_id, []))
+        return loads[link_id]
+
+    def timeline_reserve(self, link_ids: set[int], loads: dict[int, np.ndarray]) -> float:
+        # 估计计算其余链路负载时间线的耗时（秒）
+        if self.timeline_flows == 0:
+            return 0.0
+        flows = sum(len(self.link_traffic.get(link_id, [])) for link_id in link_ids if link_id not in loads)
+        return flows * self.timeline_time / self.timeline_flows
+
+    def append_timeline(self, link_id: int, traffic: Traffic, loads: dict[int, np.ndarray]) -> None:
+        # 预算模式下添加流量，同时更新链路负载时间线
+        self.timeline(link_id, loads)
+        self.append_traffic(link_id, traffic)
+        loads[link_id] += traffic.bw * active_mask(traffic.cycle, self.job_schedules[traffic.job_id].start_time, traffic.t_s, traffic.t_e)
+
+    def finish_deploy(self, job: JobInfo, added: int, loads: dict[int, np.ndarray]) -> int:
+        # 预算耗尽后把本任务剩余的流量直接加入链路，返回已加入的流量数
+        # 不再查询负载时间线的链路只添加流量，时间线在检查时计算
+        job_id = job.job_id
+        count = 0
+        for workload_id, workload in enumerate(job.workloads):
+            traffic = Traffic(job_id, job.cycle, workload.t_s, workload.t_e, workload.bw)
+            for link in self.job_schedules[job_id].tunnels[workload_id]:
+                count += 1
+                if count > added:
+                    if link.link_id in loads:
+                        self.append_timeline(link.link_id, traffic, loads)
+                    else:
+                        self.append_traffic(link.link_id, traffic)
+        return count
+
+    def fits_timeline(self, job: JobInfo, loads: dict[int, np.ndarray]) -> bool:
+        # 用负载时间线检查本任务经过的所有链路是否超出容量，不依赖（可能待更新的）峰值带宽
+        link_ids = {link.link_id for tunnel in self.job_schedules[job.job_id].tunnels for link in tunnel}
+        for link_id in link_ids:
+            if self.timeline(link_id, loads).max() > self.capacity[link_id] + 1e-9:
+                return False
+        return True
+
+    def eviction_set(self, job: JobInfo) -> Optional[list[int]]:
+        # 计算使任务可以按当前隧道、启动时间 0 准入的最小驱逐集合，无法准入时返回 None
+        job_id = job.job_id
+        priority = self.job_priority[job_id]
+
+        # 各链路上准入该任务后的超出容量的带宽时间线（正值为过载 epoch）
+        excess: dict[int, np.ndarray] = {}
+        for workload_id, workload in enumerate(job.workloads):
+            demand = workload.bw * active_mask(job.cycle, 0, workload.t_s, workload.t_e)
+            for link in self.job_schedules[job_id].tunnels[workload_id]:
+                if link.link_id not in excess:
+                    excess[link.link_id] = self.link_load(link.link_id) - self.capacity[link.link_id]
+                excess[link.link_id] += demand
+        overloaded = [link_id for link_id, over in excess.items() if np.any(over > 1e-9)]
+        if not overloaded:
+            return []
+
+        # 候选任务：过载链路上优先级更低的任务，按链路索引的顺序（优先级低、带宽大的在前）
+        candidates: dict[int, tuple[float, float]] = {}
+        for link_id in overloaded:
+            for neg_priority, neg_bw, other_id in self.link_jobs.get(link_id, []):
+                if -neg_priority <= priority:
+                    break
+                key = candidates.get(other_id, (neg_priority, 0.0))
+                candidates[other_id] = (neg_priority, key[1] + neg_bw)
+        order = sorted(candidates, key=lambda other_id: candidates[other_id])
+
+        # 候选任务在各过载链路上的负载时间线
+        loads: dict[int, dict[int, np.ndarray]] = {
+            other_id: {link_id: self.job_load(other_id, link_id) for link_id in overloaded}
+            for other_id in order
+        }
+
+        # 贪心驱逐：只驱逐能降低某个过载 epoch 负载的任务，直到所有链路不再过载
+        evicted: list[int] = []
+        for other_id in order:
+            if all(np.all(excess[link_id] <= 1e-9) for link_id in overloaded):
+                break
+            if not any(np.any(load[excess[link_id] > 1e-9] > 0) for link_id, load in loads[other_id].items()):
+                continue
+            evicted.append(other_id)
+            for link_id, load in loads[other_id].items():
+                excess[link_id] -= load
+        if any(np.any(excess[link_id] > 1e-9) for link_id in overloaded):
+            return None
+
+        # 逆序尝试放回已驱逐的任务，去掉多余的驱逐，得到极小驱逐集合
+        for other_id in reversed(list(evicted)):
+            if all(np.all(excess[link_id] + load <= 1e-9) for link_id, load in loads[other_id].items()):
+                evicted.remove(other_id)
+                for link_id, load in loads[other_id].items():
+                    excess[link_id] += load
+        return evicted
+
+    def evict_job(self, job_id: int) -> None:
+        # 驱逐已准入的任务，释放其所有链路上的流量和备份隧道
+        self.unindex_job(job_id)
+        self.remove_flows(job_id)
+        for workload_id in range(len(self.jobs[job_id].workloads)):
+            self.backup_tunnels.pop((job_id, workload_id), None)
+        self.job_schedules[job_id].admit = 0
+        self.job_schedules[job_id].bw_alloc = []
+
+    def restore_job(self, job_id: int, start_time: int) -> None:
+        # 恢复被驱逐的任务（回滚用）
+        job = self.jobs[job_id]
+        self.job_schedules[job_id].admit = 1
+        self.job_schedules[job_id].start_time = start_time
+        self.job_schedules[job_id].bw_alloc = [workload.bw for workload in job.workloads]
+        for workload_id, workload in enumerate(job.workloads):
+            traffic = Traffic(job_id, job.cycle, workload.t_s, workload.t_e, workload.bw)
+            for link in self.job_schedules[job_id].tunnels[workload_id]:
+                self.add_traffic(link.link_id, traffic)
+        self.index_job(job_id)
+        if self.backup:
+            self.reserve_backups(job_id)
+
+    def preempt_deploy(self, job: JobInfo) -> int:
+        # 驱逐低优先级任务后准入，驱逐和准入作为一个事务提交：校验失败时全部回滚
+        # 需要先调用 direct_deploy 确定任务的隧道和优先级
+        if not self.preemption or not self.routable(job.job_id):
+            return 0
+        timer = time.time()
+        self.preemption_stats.attempts += 1
+        job_id = job.job_id
+        self.refresh_links()
+
+        evicted = self.eviction_set(job)
+        if evicted is None:
+            self.preemption_stats.time += time.time() - timer
+            return 0
+
+        # 提交：驱逐任务并添加本任务的流量
+        start_times = {other_id: self.job_schedules[other_id].start_time for other_id in evicted}
+        for other_id in evicted:
+            self.evict_job(other_id)
+        self.restore_job(job_id, 0)
+
+        # 用链路峰值带宽校验，未通过则回滚
+        links = self.job_link_bw(job_id)
+        if any(self.link_peak_bw[link_id] > self.capacity[link_id] for link_id in links):
+            self.evict_job(job_id)
+            for other_id in evicted:
+                self.restore_job(other_id, start_times[other_id])
+            self.preemption_stats.rollbacks += 1
+            self.preemption_stats.time += time.time() - timer
+            return 0
+
+        self.preemption_stats.admissions += 1
+        self.preemption_stats.evictions.append(len(evicted))
+        self.preemption_stats.time += time.time() - timer
+        return 1
         
 
-# TODO: 把峰值带宽实现改成瓶颈带宽实现
\ No newline at end of file
+    def reserve_backups(self, job_id: int) -> None:
+        # 为任务的所有负载批量计算与主隧道重叠最少的备份隧道，只保存链路编号；相同 (src, dst, 主隧道) 的负载共用一次寻路
+        # 拓扑允许时备份隧道与主隧道链路不相交，否则只共享无法绕开的链路（如主机接入链路）
+        # 备份隧道按直接部署的方式检查剩余容量，但不占用带宽，检查未通过的负载没有备份隧道
+        paths: dict[tuple[int, int, tuple[int, ...]], tuple[int, ...]] = {}
+        for workload_id, workload in enumerate(self.jobs[job_id].workloads):
+            primary = tuple(link.link_id for link in self.job_schedules[job_id].tunnels[workload_id])
+            key = (workload.src, workload.dst, primary)
+            if key not in paths:
+                backup = self.path_finder.find_backup_path(workload.src, workload.dst, set(primary), excluded=self.down_links)
+                # 与主隧道完全重合的路径不能作为备份
+                paths[key] = tuple(link.link_id for link in backup) if set(link.link_id for link in backup) != set(primary) else ()
+            backup = paths[key]
+            self.refresh_links(backup)
+            if backup and all(self.capacity[link_id] - self.link_peak_bw.get(link_id, 0.0) >= workload.bw for link_id in backup):
+                self.backup_tunnels[(job_id, workload_id)] = backup
+            else:
+                self.backup_tunnels.pop((job_id, workload_id), None)
+
+    def failover_workload(self, job_id: int, workload_id: int, link_id: int) -> bool:
+        # 切换到备份隧道：查表得到隧道，不需要寻路
+        # 备份隧道经过容量变化的链路 link_id、已故障或剩余容量不足时返回 False
+        backup = self.backup_tunnels.pop((job_id, workload_id), None)
+        if backup is None or link_id in backup or any(backup_link_id in self.down_links for backup_link_id in backup):
+            return False
+        return self.move_workload(job_id, workload_id, [self.network.get_link(link_id) for link_id in backup])
+
+    def reroute_workload(self, job_id: int, workload_id: int) -> bool:
+        # 为负载重新选路（启动时间不变），绕开故障链路和容量不足的链路，失败时保持原隧道
+        workload = self.jobs[job_id].workloads[workload_id]
+        old_tunnel = self.job_schedules[job_id].tunnels[workload_id]
+        excluded = self.down_links | {link.link_id for link in old_tunnel if self.link_peak_bw[link.link_id] > self.capacity[link.link_id]}
+        tunnel: Tunnel = self.path_finder.find_path(workload.src, workload.dst, excluded=excluded)
+        if not tunnel:
+            return False
+        return self.move_workload(job_id, workload_id, tunnel)
+
+    def move_workload(self, job_id: int, workload_id: int, tunnel: Tunnel) -> bool:
+        # 将负载的流量移到新隧道，新链路剩余容量不足时保持原隧道
+        workload = self.jobs[job_id].workloads[workload_id]
+        old_tunnel = self.job_schedules[job_id].tunnels[workload_id]
+        if not tunnel and workload.src != workload.dst:
+            return False
+
+        # 暂时删除本负载的流量，检查新隧道所有链路（包括与原隧道共享的链路）的剩余容量
+        self.unindex_job(job_id)
+        self.remove_workload_flows(job_id, workload_id)
+        self.refresh_links([link.link_id for link in tunnel])
+        if any(self.capacity[link.link_id] - self.link_peak_bw.get(link.link_id, 0.0) < workload.bw for link in tunnel):
+            tunnel = old_tunnel
+        else:
+            self.job_schedules[job_id].tunnels[workload_id] = tunnel
+
+        traffic = Traffic(job_id, self.jobs[job_id].cycle, workload.t_s, workload.t_e, workload.bw)
+        for link in tunnel:
+            if link.link_id not in self.link_traffic:
+                self.link_peak_bw[link.link_id] = 0.0
+                self.link_peak_bw_points[link.link_id] = 0
+                self.link_traffic[link.link_id] = []
+                self.change_points[link.link_id] = set()
+            self.add_traffic(link.link_id, traffic)
+        self.index_job(job_id)
+        return tunnel is not old_tunnel
+
+    def set_link_capacity(self, link_id: int, capacity: float) -> LinkRecovery:
+        # 链路故障（capacity = 0）或降速：只为隧道经过该链路的负载切换到备份隧道或重新选路，带宽大的负载优先
+        # 无法重新选路且链路仍然过载时撤销该负载所属任务的准入，恢复时间与受影响的负载数有关，与任务总数无关
+        timer = time.time()
+        self.refresh_links()
+        self.capacity[link_id] = capacity
+        self.renew_state(link_id)
+        if (capacity <= 0) != (link_id in self.down_links):
+            # 故障链路集合变化后所有任务的寻路结果都可能变化，缓存的拒绝全部失效
+            self.decision_cache.clear()
+        if capacity <= 0:
+            self.down_links.add(link_id)
+        else:
+            self.down_links.discard(link_id)
+        recovery = LinkRecovery(link_id, capacity)
+
+        affected = sorted(self.link_workloads.get(link_id, ()),
+                          key=lambda key: -self.jobs[key[0]].workloads[key[1]].bw)
+        recovery.affected = len(affected)
+        for job_id, workload_id in affected:
+            if capacity > 0:
+                self.refresh_links([link_id])
+                if self.link_peak_bw.get(link_id, 0.0) <= capacity:
+                    break
+            if self.job_schedules[job_id].admit == 0:
+                continue
+            if self.failover_workload(job_id, workload_id, link_id):
+                recovery.failover += 1
+            elif self.reroute_workload(job_id, workload_id):
+                recovery.rerouted += 1
+            else:
+                self.evict_job(job_id)
+                recovery.dropped.append(job_id)
+
+        # 切换和重新选路后链路仍然过载时，按驱逐顺序（优先级低、带宽大的在前）撤销链路上任务的准入
+        self.refresh_links([link_id])
+        while self.link_peak_bw.get(link_id, 0.0) > capacity and self.link_jobs.get(link_id):
+            job_id = self.link_jobs[link_id][0][2]
+            self.evict_job(job_id)
+            recovery.dropped.append(job_id)
+            self.refresh_links([link_id])
+
+        recovery.latency = time.time() - timer
+        return recovery
+
+    def job_signature(self, job: JobInfo) -> JobSignature:
+        # 周期和负载列表相同的任务签名相同；开启抢占时准入结果还与优先级有关
+        workloads = tuple((workload.src, workload.dst, workload.t_s, workload.t_e, workload.bw) for workload in job.workloads)
+        return (job.cycle, workloads, self.job_priority.get(job.job_id) if self.preemption else None)
+
+    def lookup_decision(self, job: JobInfo, priority: float = 0.0) -> Optional[int]:
+        # 查询准入决策缓存，命中时按拒绝记录任务并返回 0，未命中返回 None
+        if not self.decision_cache_enabled:
+            return None
+        job_id = job.job_id
+        self.job_priority[job_id] = priority
+        entry = self.decision_cache.get(self.job_signature(job))
+        if entry is None or self.tunnel_states(entry[0]) != entry[1]:
+            self.decision_cache_stats.misses += 1
+            return None
+        self.decision_cache_stats.hits += 1
+        self.jobs[job_id] = job
+        self.job_schedules[job_id] = JobSchedule(
+            admit = 0,
+            start_time = 0,
+            tunnels = [[self.network.get_link(link_id) for link_id in tunnel] for tunnel in entry[0]],
+            bw_alloc = []
+        )
+        return 0
+
+    def record_decision(self, job: JobInfo, admit: int) -> None:
+        # 记录准入流程（直接部署、局部调整、抢占）的结果
+        # 只缓存拒绝：准入会改变任务经过的链路，相同签名的任务下次提交时面对的链路状态必然不同
+        if not self.decision_cache_enabled:
+            return
+        # 局部调整耗尽时间预算导致的拒绝不缓存：预算更充裕时同样的链路状态可能准入
+        signature = self.job_signature(job)
+        if admit == 1 or self.expired_job == job.job_id:
+            self.decision_cache.pop(signature, None)
+            return
+        tunnels = [tuple(link.link_id for link in tunnel) for tunnel in self.job_schedules[job.job_id].tunnels]
+        self.decision_cache[signature] = (tunnels, self.tunnel_states(tunnels))
+
+    def tunnel_states(self, tunnels: list[tuple[int, ...]]) -> tuple[int, ...]:
+        # 隧道经过的链路（按链路编号排序）当前的内容标识
+        return tuple(self.link_states[link_id][-1] for link_id in sorted({link_id for tunnel in tunnels for link_id in tunnel}))
+
+# TODO: 把峰值带宽实现改成瓶颈带宽实现
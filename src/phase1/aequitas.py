@@ -1,5 +1,3 @@
-import gurobipy as gp
-from gurobipy import GRB
 from dataclasses import dataclass
 import numpy as np
 from typing import Optional
@@ -15,6 +13,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"
 
 from network.graph import Graph, Link
 from network.path_finder import PathFinder
+from network.timeline import HORIZON, active_epochs
 from params import SCHEDULE_INTERVAL
 # 每隔 SCHEDULE_INTERVAL 进行一次流量调度，因此最多考虑 SCHEDULE_INTERVAL 个 epoch 的重叠周期即可
 
@@ -48,9 +47,11 @@ class Priority:
     NC = 1
     BE = 2
 
+PRIORITIES = (Priority.PC, Priority.NC, Priority.BE)
+
 class Aequitas():
 
-    def __init__(self, network: Graph):
+    def __init__(self, network: Graph, class_aware: bool = False):
 
         self.network: Graph = network
 
@@ -66,11 +67,25 @@ class Aequitas():
         self.link_traffic: dict[int, list[Traffic]] = {} # 链路上经过的流量模式 link_id -> list[Traffic]
         # 任务调度
         self.job_schedules: dict[int, JobSchedule] = {} # job_id -> JobSchedule
-        # 链路准入概率
-        self.link_admit_prob: list[float] = [] 
-
-        self.link_peak_bw: dict[int, float] = {} # 链路上已经分配的带宽
-        self.link_peak_bw_to_update: dict[int, bool] = {} # 需要更新的链路
+        # 链路准入概率，按对数空间累加：log_admit_prob 为各次 (1 - bw / capacity) 的对数之和，
+        # 带宽占满（因子 <= 0）的次数单独计数，回滚时精确相减
+        # 末尾多一个哨兵项（概率恒为 1），用于补齐长度不同的隧道
+        self.capacity = np.array([link.capacity for link in network.links] + [np.inf])
+        self.log_admit_prob = np.zeros(network.link_num + 1)
+        self.saturated_cnt = np.zeros(network.link_num + 1, dtype=np.int64)
+
+        # 按优先级分层的链路负载时间线 [priority, link_id, epoch]
+        self.link_class_load = np.zeros((len(PRIORITIES), network.link_num, HORIZON))
+        # 是否按优先级准入：开启时优先级为 p 的负载只与优先级不低于 p 的负载竞争带宽
+        self.class_aware = class_aware
+
+        self.link_peak_bw: dict[int, float] = {} # 链路上已经分配的带宽（所有优先级）
+        # 任务的流量在链路流量列表中的位置，用于按任务删除流量
+        self.job_flows: dict[int, set[tuple[int, int]]] = {} # job_id -> {(link_id, 流量下标)}
+
+    def update_class_load(self, link_id: int, traffic: Traffic, sign: int) -> None:
+        epochs = active_epochs(traffic.cycle, self.job_schedules[traffic.job_id].start_time, traffic.t_s, traffic.t_e)
+        self.link_class_load[self.jobs_pri[traffic.job_id], link_id, epochs] += sign * traffic.bw
 
     def add_traffic(self, link_id: int, traffic: Traffic) -> None:
         
@@ -79,70 +94,94 @@ class Aequitas():
         
         # 添加流量
         self.link_traffic[link_id].append(traffic)
+        self.job_flows.setdefault(traffic.job_id, set()).add((link_id, len(self.link_traffic[link_id]) - 1))
+        self.update_class_load(link_id, traffic, 1)
+
+    def pop_traffic(self, link_id: int) -> None:
+        # 回滚链路上最后添加的流量
+        traffic = self.link_traffic[link_id].pop()
+        self.job_flows[traffic.job_id].discard((link_id, len(self.link_traffic[link_id])))
+        self.update_class_load(link_id, traffic, -1)
+
+    def remove_flows(self, job_id: int) -> set[int]:
+        # 删除任务的所有流量：将链路上最后一条流量移到被删除的位置，开销与任务经过的链路数成正比
+        # 同一链路上按下标从大到小删除，保证被移动的流量不是本任务待删除的流量，返回受影响的链路
+        link_ids: set[int] = set()
+        for link_id, index in sorted(self.job_flows.pop(job_id, set()), key=lambda flow: -flow[1]):
+            flows = self.link_traffic[link_id]
+            traffic = flows[index]
+            last = flows.pop()
+            if index < len(flows):
+                flows[index] = last
+                self.job_flows[last.job_id].discard((link_id, len(flows)))
+                self.job_flows[last.job_id].add((link_id, index))
+            self.update_class_load(link_id, traffic, -1)
+            link_ids.add(link_id)
+        return link_ids
+
+    def remove_job(self, job_id: int) -> None:
+        # 任务结束，释放其占用的链路带宽并删除任务记录
+        if job_id not in self.job_schedules:
+            return
+        schedule = self.job_schedules[job_id]
+        # 准入失败的任务已在 deploy 中回滚了准入概率
+        if schedule.admit == 1:
+            for tunnel, bw in zip(schedule.tunnels, schedule.bw_alloc):
+                self.update_admit_prob(tunnel, bw, -1)
+        link_ids = list(self.remove_flows(job_id))
+        if link_ids:
+            self.link_peak_bw.update(zip(link_ids, self.class_peak_bw(link_ids, Priority.BE).tolist()))
+        del self.job_schedules[job_id]
+        del self.jobs_pri[job_id]
+
+    @property
+    def link_admit_prob(self) -> np.ndarray:
+        # 链路准入概率 link_id -> prob
+        return self.admit_prob()[:-1]
+
+    def admit_prob(self) -> np.ndarray:
+        # 含哨兵项的链路准入概率向量
+        return np.where(self.saturated_cnt > 0, 0.0, np.exp(self.log_admit_prob))
+
+    def tunnel_index(self, tunnels: list[Tunnel]) -> np.ndarray:
+        # 候选隧道的链路编号矩阵（隧道 × 链路），不足的位置用哨兵项补齐
+        index = np.full((len(tunnels), max(len(tunnel) for tunnel in tunnels)), self.network.link_num)
+        for i, tunnel in enumerate(tunnels):
+            index[i, :len(tunnel)] = [link.link_id for link in tunnel]
+        return index
+
+    def select_tunnel(self, tunnels: list[Tunnel]) -> Tunnel:
+        # 选择瓶颈链路准入概率最大的隧道，概率相同时取靠前的隧道
+        if not tunnels:
+            return []
+        tunnel_admit_prob = self.admit_prob()[self.tunnel_index(tunnels)].min(axis=1)
+        return tunnels[int(np.argmax(tunnel_admit_prob))]
+
+    def update_admit_prob(self, tunnel: Tunnel, bw: float, sign: int) -> None:
+        # sign = 1 表示负载准入，sign = -1 表示回滚
+        link_ids = np.array([link.link_id for link in tunnel], dtype=np.int64)
+        ratio = bw / self.capacity[link_ids]
+        saturated = ratio >= 1.0
+        np.add.at(self.saturated_cnt, link_ids[saturated], sign)
+        np.add.at(self.log_admit_prob, link_ids[~saturated], sign * np.log1p(-ratio[~saturated]))
+
+    def class_peak_bw(self, link_ids: list[int], priority: int) -> np.ndarray:
+        # 优先级不低于 priority 的负载在各链路上的峰值带宽，只需累加至多三层时间线
+        return self.link_class_load[:priority + 1, link_ids].sum(axis=0).max(axis=1)
+
+    def calculate_remaining_bw(self, tunnel: Tunnel, workload: Workload, cycle: int, priority: int = Priority.BE) -> float:
+        # 优先级为 priority 的负载可用的剩余带宽：容量减去 PC, ..., priority 各层负载之和的峰值
+        # priority = BE 时即所有负载合并后的峰值
+        if not tunnel:
+            return float('inf')
+        link_ids = [link.link_id for link in tunnel]
+        return float((self.capacity[link_ids] - self.class_peak_bw(link_ids, priority)).min())
+
+    def update_peak_bw(self) -> None:
+        # 刷新所有有流量的链路的峰值带宽
+        link_ids = [link_id for link_id, traffic in self.link_traffic.items() if traffic]
+        self.link_peak_bw = dict(zip(link_ids, self.class_peak_bw(link_ids, Priority.BE).tolist()))
 
-        self.link_peak_bw_to_update[link_id] = True
-
-    def calculate_remaining_bw(self, tunnel: Tunnel, workload: Workload, cycle: int) -> float:
-
-        remaining_bw = float('inf')
-        for link in tunnel:
-
-            change_points: list[int] = []
-
-            if link.link_id not in self.link_traffic:
-                self.link_traffic[link.link_id] = []
-                continue
-
-            if self.link_traffic[link.link_id] == []:
-                continue
-
-            if link.link_id not in self.link_peak_bw:
-                self.link_peak_bw[link.link_id] = 0.0
-                self.link_peak_bw_to_update[link.link_id] = True
-
-            link_alloc_bw = 0.0
-
-            if self.link_peak_bw_to_update[link.link_id] == False:
-                link_alloc_bw = self.link_peak_bw[link.link_id]
-                remaining_bw = min(remaining_bw, link.capacity - link_alloc_bw)
-                continue
-
-            # 重叠流量周期
-            # circle_list: list[int] = []
-            # for traffic in self.link_traffic[link.link_id]:
-            #     circle_list.append(traffic.cycle // 30 * 30)
-            # overlap_circle = np.lcm.reduce(circle_list) # 重叠流量周期
-            overlap_circle = SCHEDULE_INTERVAL
-
-            for traffic in self.link_traffic[link.link_id]:
-                # 添加新流量的变化时间点
-                for circle_offset in range(0, overlap_circle, traffic.cycle):
-                    start = (traffic.t_s + circle_offset + self.job_schedules[traffic.job_id].start_time) % overlap_circle
-                    end = (traffic.t_e + circle_offset + self.job_schedules[traffic.job_id].start_time) % overlap_circle
-                                
-                    change_points.append(start)
-                    change_points.append(end)
-
-            # 计算链路上已经分配的带宽
-            for time in sorted(list(change_points)):
-                # 注释掉就是计算峰值带宽
-                # if time % cycle >= workload.t_s and time % cycle < workload.t_e:
-                #     None
-                # else:
-                #     continue
-                bw_now = 0.0
-                for traffic in self.link_traffic[link.link_id]:
-                    time_in_circle = time % traffic.cycle
-                    if time_in_circle >= traffic.t_s and time_in_circle < traffic.t_e:
-                        bw_now += traffic.bw
-                link_alloc_bw = max(link_alloc_bw, bw_now)
-
-            self.link_peak_bw[link.link_id] = link_alloc_bw
-            self.link_peak_bw_to_update[link.link_id] = False
-
-            remaining_bw = min(remaining_bw, link.capacity - link_alloc_bw)
-        return remaining_bw
-    
     def deploy(self, jobs: list[JobInfo]) -> list[int]:
 
         # a[j]={0, 1} 表示任务是否准入
@@ -169,36 +208,25 @@ class Aequitas():
                 bw_alloc = []
             )
 
-        for link_id in range(self.network.link_num):
-            self.link_admit_prob.append(1.0) # 初始准入概率为 100%
+        # 初始准入概率为 100%
+        self.log_admit_prob[:] = 0.0
+        self.saturated_cnt[:] = 0
 
         job_cnt = -1
         for job in jobs:
             job_cnt += 1
             print(f"Processing: {job_cnt}/{len(jobs)}")
             job_id = job.job_id
-            rollback_workload_tag = -1
             for workload in job.workloads:
-                rollback_workload_tag += 1
                 tunnels: list[Tunnel] = self.path_finder.find_multi_path(workload.src, workload.dst)
-                selected_tunnel: Tunnel = []
-                max_admit_prob = 0.0
-                for tunnel in tunnels:
-                    # 计算隧道准入概率
-                    tunnel_admit_prob = 1.0
-                    for link in tunnel:
-                        link_admit_prob = self.link_admit_prob[link.link_id]
-                        if link_admit_prob < tunnel_admit_prob:
-                            tunnel_admit_prob = link_admit_prob
-                    if tunnel_admit_prob > max_admit_prob:
-                        max_admit_prob = tunnel_admit_prob
-                        selected_tunnel = tunnel
+                selected_tunnel: Tunnel = self.select_tunnel(tunnels)
                 self.job_schedules[job_id].tunnels.append(selected_tunnel)
-                remaining_bw = self.calculate_remaining_bw(selected_tunnel, workload, job.cycle)
+                priority = self.jobs_pri[job_id] if self.class_aware else Priority.BE
+                remaining_bw = self.calculate_remaining_bw(selected_tunnel, workload, job.cycle, priority)
                 if remaining_bw >= workload.bw:
                     self.job_schedules[job_id].bw_alloc.append(workload.bw)
+                    self.update_admit_prob(selected_tunnel, workload.bw, 1)
                     for link in selected_tunnel:
-                        self.link_admit_prob[link.link_id] *= 1.0 - (workload.bw / link.capacity)
                         # 更新链路流量模式
                         traffic = Traffic(
                             job_id = job_id,
@@ -213,15 +241,17 @@ class Aequitas():
                     self.job_schedules[job_id].admit = 0
                     break
             # 如果准入失败则回滚
+            # 只回滚已经准入的负载，准入失败的负载没有更新准入概率和链路流量
             if a[job_cnt] == 0:
-                for workload_id in range(rollback_workload_tag + 1):
+                for workload_id in range(len(self.job_schedules[job_id].bw_alloc)):
                     workload = job.workloads[workload_id]
                     selected_tunnel = self.job_schedules[job_id].tunnels[workload_id]
+                    self.update_admit_prob(selected_tunnel, workload.bw, -1)
                     for link in selected_tunnel:
-                        self.link_admit_prob[link.link_id] /= 1.0 - (workload.bw / link.capacity)
                         if self.link_traffic[link.link_id] == []:
                             continue
                         if self.link_traffic[link.link_id][-1].job_id == job_id:
-                            self.link_traffic[link.link_id].pop()
-        
+                            self.pop_traffic(link.link_id)
+
+        self.update_peak_bw()
         return a
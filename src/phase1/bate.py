@@ -1,11 +1,10 @@
-import gurobipy as gp
-from gurobipy import GRB
 from dataclasses import dataclass
 import numpy as np
 from typing import Optional
 import copy
 import sys
 import os
+import time
 from job.job_info import JobInfo
 
 # 动态添加项目根目录到 sys.path
@@ -13,6 +12,8 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"
 
 from network.graph import Graph, Link
 from network.path_finder import PathFinder
+from phase1.admission_control import AdjustStats
+from network.timeline import HORIZON, active_mask
 from params import SCHEDULE_INTERVAL
 # 每隔 SCHEDULE_INTERVAL 进行一次流量调度，因此最多考虑 SCHEDULE_INTERVAL 个 epoch 的重叠周期即可
 
@@ -38,7 +39,7 @@ class JobSchedule:
 
 class Bate():
 
-    def __init__(self, network: Graph):
+    def __init__(self, network: Graph, adjust_budget: Optional[float] = None):
 
         self.network: Graph = network
 
@@ -58,9 +59,19 @@ class Bate():
         self.link_peak_bw_points: dict[int, int] = {} # link_id -> peak_bandwidth_time_point
         # 任务调度
         self.job_schedules: dict[int, JobSchedule] = {} # job_id -> JobSchedule
+        # 任务的流量在链路流量列表中的位置，用于按任务删除流量
+        self.job_flows: dict[int, set[tuple[int, int]]] = {} # job_id -> {(link_id, 流量下标)}
+        # 删除流量后峰值带宽和变化时间点待更新的链路，在下一次准入前统一更新
+        self.stale_links: set[int] = set()
         
         # 参数设置
         self.strat_time_step = 10 # 枚举启动时间的步长
+        # 每个任务局部调整的时间预算（秒），为空时按调整次数限制
+        self.adjust_budget = adjust_budget
+        # 预算模式下计算链路负载时间线的累计耗时（秒）和累计流量数，按每条流量的平均耗时为收尾时检查尚未计算的链路预留时间
+        self.timeline_time = 0.0
+        self.timeline_flows = 0
+        self.adjust_stats = AdjustStats()
 
     def update_peak_bw(self, link_id: int) -> None:
         
@@ -87,6 +98,7 @@ class Bate():
         
         # 添加流量
         self.link_traffic[link_id].append(traffic)
+        self.job_flows.setdefault(traffic.job_id, set()).add((link_id, len(self.link_traffic[link_id]) - 1))
 
         # 重叠流量周期
         # circle_list = []
@@ -106,10 +118,73 @@ class Bate():
 
         # 更新链路峰值带宽
         self.update_peak_bw(link_id)
+
+    def append_traffic(self, link_id: int, traffic: Traffic) -> None:
+        # 添加流量但不更新变化时间点和峰值带宽，链路标记为待更新（局部调整的预算模式使用）
+        self.link_traffic[link_id].append(traffic)
+        self.job_flows.setdefault(traffic.job_id, set()).add((link_id, len(self.link_traffic[link_id]) - 1))
+        self.stale_links.add(link_id)
+
+    def pop_traffic(self, link_id: int) -> None:
+        # 删除链路上最后添加的流量（回滚用）
+        traffic = self.link_traffic[link_id].pop()
+        self.job_flows[traffic.job_id].discard((link_id, len(self.link_traffic[link_id])))
+        self.stale_links.add(link_id)
+
+    def remove_flows(self, job_id: int) -> None:
+        # 删除任务的所有流量：将链路上最后一条流量移到被删除的位置，开销与任务经过的链路数成正比
+        # 同一链路上按下标从大到小删除，保证被移动的流量不是本任务待删除的流量
+        for link_id, index in sorted(self.job_flows.pop(job_id, set()), key=lambda flow: -flow[1]):
+            flows = self.link_traffic[link_id]
+            last = flows.pop()
+            if index < len(flows):
+                flows[index] = last
+                self.job_flows[last.job_id].discard((link_id, len(flows)))
+                self.job_flows[last.job_id].add((link_id, index))
+            self.stale_links.add(link_id)
+
+    def refresh_links(self) -> None:
+        # 重建待更新链路的变化时间点和峰值带宽
+        for link_id in self.stale_links:
+            self.change_points[link_id] = set()
+            for traffic in self.link_traffic[link_id]:
+                for circle_offset in range(0, SCHEDULE_INTERVAL, traffic.cycle):
+                    start = (traffic.t_s + circle_offset + self.job_schedules[traffic.job_id].start_time) % SCHEDULE_INTERVAL
+                    end = (traffic.t_e + circle_offset + self.job_schedules[traffic.job_id].start_time) % SCHEDULE_INTERVAL
+                    self.change_points[link_id].add(start)
+                    self.change_points[link_id].add(end)
+            self.update_peak_bw(link_id)
+        self.stale_links.clear()
+
+    def remove_job(self, job_id: int) -> None:
+        # 任务结束，释放其占用的链路带宽并删除任务记录
+        if job_id not in self.job_schedules:
+            return
+        self.remove_flows(job_id)
+        del self.job_schedules[job_id]
+        del self.jobs[job_id]
     
+    def job_load(self, job_id: int, link_id: int) -> np.ndarray:
+        # 任务在链路上的负载时间线
+        load = np.zeros(HORIZON)
+        start_time = self.job_schedules[job_id].start_time
+        for flow_link_id, index in self.job_flows.get(job_id, ()):
+            if flow_link_id == link_id:
+                traffic = self.link_traffic[link_id][index]
+                load += traffic.bw * active_mask(traffic.cycle, start_time, traffic.t_s, traffic.t_e)
+        return load
+
+    def link_load(self, link_id: int) -> np.ndarray:
+        # 链路上所有流量的负载时间线
+        load = np.zeros(HORIZON)
+        for traffic in self.link_traffic.get(link_id, []):
+            load += traffic.bw * active_mask(traffic.cycle, self.job_schedules[traffic.job_id].start_time, traffic.t_s, traffic.t_e)
+        return load
+
     def direct_deploy(self, job: JobInfo) -> int:
         
         job_id = job.job_id
+        self.refresh_links()
         self.jobs[job_id] = job
         self.job_schedules[job_id] = JobSchedule(
             admit = 0,
@@ -192,18 +267,63 @@ class Bate():
             self.job_schedules[job_id].start_time = original_start_time
                 
         return False
-            
 
-    def local_adjust(self, job: JobInfo) -> int:
+    def timeline_adjust(self, link_id: int, link_capacity: float, loads: dict[int, np.ndarray], job_id: int, deadline: float) -> bool:
+        # 预算模式下的 link_adjust：按负载时间线调整峰值时刻活跃任务（不包括正在准入的任务 job_id）的启动时间
+        # 带宽大的任务优先，一次向量化评估任务的所有候选启动时间，接受第一个使链路不超出容量的启动时间
+        # loads 为本次局部调整已计算的链路负载时间线，移动任务后增量更新
+        load = loads[link_id]
+        peak_point = int(load.argmax())
+        job_bw: dict[int, float] = {}
+        for traffic in self.link_traffic[link_id]:
+            other_id = traffic.job_id
+            if other_id != job_id and active_mask(traffic.cycle, self.job_schedules[other_id].start_time, traffic.t_s, traffic.t_e)[peak_point]:
+                job_bw[other_id] = max(job_bw.get(other_id, 0.0), traffic.bw)
+
+        for other_id in sorted(job_bw, key=lambda other_id: -job_bw[other_id]):
+            if time.time() > deadline:
+                return False
+            base = load - self.job_load(other_id, link_id)
+            flows = [self.link_traffic[link_id][index] for flow_link_id, index in self.job_flows[other_id] if flow_link_id == link_id]
+            start_times = list(range(0, self.jobs[other_id].cycle, self.strat_time_step))
+            shifted = np.stack([
+                sum(traffic.bw * active_mask(traffic.cycle, start_time, traffic.t_s, traffic.t_e) for traffic in flows)
+                for start_time in start_times
+            ])
+            fits = (base + shifted).max(axis=1) <= link_capacity + 1e-9
+            if fits.any():
+                # 启动时间变化后，任务经过的链路的变化时间点和峰值带宽在下一次准入前更新
+                moved_links = {flow_link_id for flow_link_id, _ in self.job_flows[other_id]}
+                old_loads = {flow_link_id: self.job_load(other_id, flow_link_id) for flow_link_id in moved_links if flow_link_id in loads}
+                self.job_schedules[other_id].start_time = start_times[int(fits.argmax())]
+                for flow_link_id, old_load in old_loads.items():
+                    loads[flow_link_id] += self.job_load(other_id, flow_link_id) - old_load
+                self.stale_links.update(moved_links)
+                return True
+        return False
+
+    def local_adjust(self, job: JobInfo, budget: Optional[float] = None) -> int:
 
-        # 为了节约时间，仅调整限制次数
-        max_call_time = 10
+        # 为了节约时间，仅调整限制次数；设置了时间预算（秒，默认 self.adjust_budget）时改为限制调整时间
+        # 设置了预算时按负载时间线检查和调整，不重新计算峰值带宽（涉及的链路标记为待更新，在下一次准入前更新）
+        # 预算耗尽时保留已完成的启动时间调整，本任务按当前调度可行则准入，否则回退本任务的流量
+        budget = self.adjust_budget if budget is None else budget
+        max_call_time = 10 if budget is None else float('inf')
+        timer = time.time()
+        deadline = None if budget is None else timer + budget
+        self.adjust_stats.calls += 1
 
         job_id = job.job_id
+        if deadline is None:
+            self.refresh_links()
         # 记录分配到了第几个负载，用于后续无法准入时回退
         rollback_count = 0
+        # 预算模式下本次调用已计算的链路负载时间线 link_id -> load
+        loads: dict[int, np.ndarray] = {}
+        job_links = {link.link_id for tunnel in self.job_schedules[job_id].tunnels for link in tunnel}
         
         tag = True
+        expired = False
         for workload_id, workload in enumerate(job.workloads):
 
             tunnel: Tunnel = self.job_schedules[job_id].tunnels[workload_id]
@@ -216,21 +336,45 @@ class Bate():
                     bw = workload.bw
                 )
             for link in tunnel:
+                # 预留收尾时计算其余链路负载时间线的时间
+                if deadline is not None and time.time() + self.timeline_reserve(job_links, loads) > deadline:
+                    expired = True
+                    break
                 rollback_count += 1
-                self.add_traffic(link.link_id, traffic)
-                if self.link_peak_bw[link.link_id] > link.capacity:
+                if deadline is None:
+                    self.add_traffic(link.link_id, traffic)
+                    overloaded = self.link_peak_bw[link.link_id] > link.capacity
+                else:
+                    self.append_timeline(link.link_id, traffic, loads)
+                    overloaded = loads[link.link_id].max() > link.capacity + 1e-9
+                if overloaded:
                     # 负载分配失败，尝试局部调整
-                    if max_call_time > 0:
+                    if deadline is not None:
+                        adjust_success = self.timeline_adjust(link.link_id, link.capacity, loads, job_id, deadline)
+                    elif max_call_time > 0:
                         adjust_success = self.link_adjust(link.link_id, link.capacity)
                     else:
                         adjust_success = False
 
                     max_call_time -= 1
                     if adjust_success == False:
-                        tag = False
+                        if deadline is not None and time.time() + self.timeline_reserve(job_links, loads) > deadline:
+                            expired = True
+                        else:
+                            tag = False
                         break
-            if tag == False:
+            if tag == False or expired:
                 break
+
+        if deadline is not None and tag:
+            # 预算模式收尾：预算耗尽时加入本任务剩余的流量，再按负载时间线检查本任务经过的所有链路
+            # （后面的调整可能移动了经过前面链路的任务）
+            if expired:
+                self.adjust_stats.budget_exhausted += 1
+                rollback_count = self.finish_deploy(job, rollback_count, loads)
+            tag = self.fits_timeline(job, loads)
+            if expired and tag:
+                self.adjust_stats.budget_admissions += 1
         
         if tag == False:
             # 回退已分配流量
@@ -240,10 +384,14 @@ class Bate():
 
                     rollback_count -= 1
                     if rollback_count < 0:
+                        self.adjust_stats.time += time.time() - timer
                         return 0
                     
                     # 删除最后一个元素（即当前任务的流量）
-                    self.link_traffic[link.link_id].pop()
+                    self.pop_traffic(link.link_id)
+            # 失败发生在最后一条链路上时，回退完所有流量后循环正常结束
+            self.adjust_stats.time += time.time() - timer
+            return 0
 
         else:
             # 任务准入
@@ -253,5 +401,52 @@ class Bate():
             # 分配带宽
             for workload_id, workload in enumerate(job.workloads):
                 self.job_schedules[job_id].bw_alloc.append(workload.bw)
+            self.adjust_stats.admissions += 1
+            self.adjust_stats.time += time.time() - timer
             return 1
-        
\ No newline at end of file
+        
+
+    def timeline(self, link_id: int, loads: dict[int, np.ndarray]) -> np.ndarray:
+        # 预算模式下取链路负载时间线，首次计算时累计耗时
+        if link_id not in loads:
+            timer = time.time()
+            loads[link_id] = self.link_load(link_id)
+            self.timeline_time += time.time() - timer
+            self.timeline_flows += len(self.link_traffic.get(link_id, []))
+        return loads[link_id]
+
+    def timeline_reserve(self, link_ids: set[int], loads: dict[int, np.ndarray]) -> float:
+        # 估计计算其余链路负载时间线的耗时（秒）
+        if self.timeline_flows == 0:
+            return 0.0
+        flows = sum(len(self.link_traffic.get(link_id, [])) for link_id in link_ids if link_id not in loads)
+        return flows * self.timeline_time / self.timeline_flows
+
+    def append_timeline(self, link_id: int, traffic: Traffic, loads: dict[int, np.ndarray]) -> None:
+        # 预算模式下添加流量，同时更新链路负载时间线
+        self.timeline(link_id, loads)
+        self.append_traffic(link_id, traffic)
+        loads[link_id] += traffic.bw * active_mask(traffic.cycle, self.job_schedules[traffic.job_id].start_time, traffic.t_s, traffic.t_e)
+
+    def finish_deploy(self, job: JobInfo, added: int, loads: dict[int, np.ndarray]) -> int:
+        # 预算耗尽后把本任务剩余的流量直接加入链路，返回已加入的流量数
+        job_id = job.job_id
+        count = 0
+        for workload_id, workload in enumerate(job.workloads):
+            traffic = Traffic(job_id, job.cycle, workload.t_s, workload.t_e, workload.bw)
+            for link in self.job_schedules[job_id].tunnels[workload_id]:
+                count += 1
+                if count > added:
+                    if link.link_id in loads:
+                        self.append_timeline(link.link_id, traffic, loads)
+                    else:
+                        self.append_traffic(link.link_id, traffic)
+        return count
+
+    def fits_timeline(self, job: JobInfo, loads: dict[int, np.ndarray]) -> bool:
+        # 用负载时间线检查本任务经过的所有链路是否超出容量，不依赖（可能待更新的）峰值带宽
+        for tunnel in self.job_schedules[job.job_id].tunnels:
+            for link in tunnel:
+                if self.timeline(link.link_id, loads).max() > link.capacity + 1e-9:
+                    return False
+        return True
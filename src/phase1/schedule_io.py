@@ -0,0 +1,40 @@
+import json
+from network.graph import Graph, Link
+from phase1.admission_control import JobSchedule
+
+# Phase 1 调度结果的持久化
+# 紧凑格式中隧道只保存链路编号数组，读取时直接引用拓扑中的 Link 对象
+
+def save_job_schedules(path: str, schedules: dict[int, JobSchedule]) -> None:
+    schedules_data = {}
+    for job_id, schedule in schedules.items():
+        schedules_data[job_id] = {
+            'admit': schedule.admit,
+            'start_time': schedule.start_time,
+            'tunnels': [[link.link_id for link in tunnel] for tunnel in schedule.tunnels],
+            'bw_alloc': schedule.bw_alloc
+        }
+    with open(path, 'w') as f:
+        json.dump(schedules_data, f)
+
+def load_job_schedules(path: str, network: Graph) -> dict[int, JobSchedule]:
+    # 兼容旧格式：隧道中每条链路保存为完整的 Link 字典
+    with open(path, 'r') as f:
+        schedules_data = json.load(f)
+
+    schedules: dict[int, JobSchedule] = {}
+    for job_id, schedule in schedules_data.items():
+        tunnels: list[list[Link]] = []
+        for tunnel_data in schedule['tunnels']:
+            tunnel: list[Link] = []
+            for link_data in tunnel_data:
+                link_id = link_data['link_id'] if isinstance(link_data, dict) else link_data
+                tunnel.append(network.get_link(int(link_id)))
+            tunnels.append(tunnel)
+        schedules[int(job_id)] = JobSchedule(
+            admit = int(schedule['admit']),
+            start_time = int(schedule['start_time']),
+            tunnels = tunnels,
+            bw_alloc = list(map(float, schedule['bw_alloc']))
+        )
+    return schedules
@@ -1,5 +1,3 @@
-import gurobipy as gp
-from gurobipy import GRB
 from dataclasses import dataclass
 import numpy as np
 from typing import Optional
@@ -15,6 +13,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"
 
 from network.graph import Graph, Link
 from network.path_finder import PathFinder
+from network.periodic import PeriodicLoad
 from params import SCHEDULE_INTERVAL
 # 每隔 SCHEDULE_INTERVAL 进行一次流量调度，因此最多考虑 SCHEDULE_INTERVAL 个 epoch 的重叠周期即可
 
@@ -70,6 +69,13 @@ class Seawall():
         self.link_peak_bw: dict[int, float] = {} # 链路上已经分配的带宽
         self.link_peak_bw_to_update: dict[int, bool] = {} # 需要更新的链路
 
+        # 链路上所有流量所属任务的配额之和，随流量添加和回滚增量维护
+        self.link_quota_sum: dict[int, int] = {} # link_id -> quota sum
+        # 链路上按周期分组的负载，缓存窗口峰值查询结果
+        self.link_load: dict[int, PeriodicLoad] = {} # link_id -> PeriodicLoad
+        # 任务的流量在链路流量列表中的位置，用于按任务删除流量
+        self.job_flows: dict[int, set[tuple[int, int]]] = {} # job_id -> {(link_id, 流量下标)}
+
     def add_traffic(self, link_id: int, traffic: Traffic) -> None:
         
         if link_id not in self.link_traffic:
@@ -77,6 +83,47 @@ class Seawall():
         
         # 添加流量
         self.link_traffic[link_id].append(traffic)
+        self.job_flows.setdefault(traffic.job_id, set()).add((link_id, len(self.link_traffic[link_id]) - 1))
+        self.link_quota_sum[link_id] = self.link_quota_sum.get(link_id, 0) + self.jobs_quota[traffic.job_id]
+        self.link_load.setdefault(link_id, PeriodicLoad()).add(
+            traffic.cycle, self.job_schedules[traffic.job_id].start_time, traffic.t_s, traffic.t_e, traffic.bw
+        )
+
+        self.link_peak_bw_to_update[link_id] = True
+
+    def pop_traffic(self, link_id: int) -> None:
+        # 回滚链路上最后添加的流量
+        traffic = self.link_traffic[link_id].pop()
+        self.job_flows[traffic.job_id].discard((link_id, len(self.link_traffic[link_id])))
+        self.release_traffic(link_id, traffic)
+
+    def remove_flows(self, job_id: int) -> None:
+        # 删除任务的所有流量：将链路上最后一条流量移到被删除的位置，开销与任务经过的链路数成正比
+        # 同一链路上按下标从大到小删除，保证被移动的流量不是本任务待删除的流量
+        for link_id, index in sorted(self.job_flows.pop(job_id, set()), key=lambda flow: -flow[1]):
+            flows = self.link_traffic[link_id]
+            traffic = flows[index]
+            last = flows.pop()
+            if index < len(flows):
+                flows[index] = last
+                self.job_flows[last.job_id].discard((link_id, len(flows)))
+                self.job_flows[last.job_id].add((link_id, index))
+            self.release_traffic(link_id, traffic)
+
+    def remove_job(self, job_id: int) -> None:
+        # 任务结束，释放其占用的链路带宽并删除任务记录
+        if job_id not in self.job_schedules:
+            return
+        self.remove_flows(job_id)
+        del self.job_schedules[job_id]
+        del self.jobs_quota[job_id]
+
+    def release_traffic(self, link_id: int, traffic: Traffic) -> None:
+        # 与 add_traffic 对称地更新配额之和和链路负载
+        self.link_quota_sum[link_id] -= self.jobs_quota[traffic.job_id]
+        self.link_load[link_id].remove(
+            traffic.cycle, self.job_schedules[traffic.job_id].start_time, traffic.t_s, traffic.t_e, traffic.bw
+        )
 
         self.link_peak_bw_to_update[link_id] = True
 
@@ -85,8 +132,6 @@ class Seawall():
         remaining_bw = float('inf')
         for link in tunnel:
 
-            change_points: list[int] = []
-
             if link.link_id not in self.link_traffic:
                 self.link_traffic[link.link_id] = []
                 continue
@@ -94,47 +139,9 @@ class Seawall():
             if self.link_traffic[link.link_id] == []:
                 continue
 
-            if link.link_id not in self.link_peak_bw:
-                self.link_peak_bw[link.link_id] = 0.0
-                self.link_peak_bw_to_update[link.link_id] = True
-
-            link_alloc_bw = 0.0
-
-            # 计算瓶颈带宽时注释掉
-            # if self.link_peak_bw_to_update[link.link_id] == False:
-            #     link_alloc_bw = self.link_peak_bw[link.link_id]
-            #     remaining_bw = min(remaining_bw, link.capacity - link_alloc_bw)
-            #     continue
-
-            # 重叠流量周期
-            circle_list: list[int] = []
-            for traffic in self.link_traffic[link.link_id]:
-                circle_list.append(traffic.cycle // 25 * 25)
-            overlap_circle = np.lcm.reduce(circle_list) # 重叠流量周期
-            # overlap_circle = SCHEDULE_INTERVAL
-
-            for traffic in self.link_traffic[link.link_id]:
-                # 添加新流量的变化时间点
-                for circle_offset in range(0, overlap_circle, traffic.cycle):
-                    start = (traffic.t_s + circle_offset + self.job_schedules[traffic.job_id].start_time) % overlap_circle
-                    end = (traffic.t_e + circle_offset + self.job_schedules[traffic.job_id].start_time) % overlap_circle
-                                
-                    change_points.append(start)
-                    change_points.append(end)
-
-            # 计算链路上已经分配的带宽
-            for time in sorted(list(change_points)):
-                # 注释掉就是计算峰值带宽
-                if time % cycle >= workload.t_s and time % cycle < workload.t_e:
-                    None
-                else:
-                    continue
-                bw_now = 0.0
-                for traffic in self.link_traffic[link.link_id]:
-                    time_in_circle = time % traffic.cycle
-                    if time_in_circle >= traffic.t_s and time_in_circle < traffic.t_e:
-                        bw_now += traffic.bw
-                link_alloc_bw = max(link_alloc_bw, bw_now)
+            # 新负载活跃时间窗口内链路上已经分配的带宽
+            # 重叠周期有界时精确计算，否则按周期余数分组给出上界，结果在链路流量变化前一直缓存
+            link_alloc_bw = self.link_load[link.link_id].window_peak(cycle, workload.t_s, workload.t_e)
 
             self.link_peak_bw[link.link_id] = link_alloc_bw
             self.link_peak_bw_to_update[link.link_id] = False
@@ -179,9 +186,7 @@ class Seawall():
                             self.link_traffic[link.link_id] = []
                             tunnel_quota_bw = min(tunnel_quota_bw, link.capacity)
                             continue
-                        link_quota_sum = 0
-                        for traffic in self.link_traffic[link.link_id]:
-                            link_quota_sum += self.jobs_quota[traffic.job_id]
+                        link_quota_sum = self.link_quota_sum.get(link.link_id, 0)
                         tunnel_quota_bw += link.capacity * self.jobs_quota[job_id] / (link_quota_sum + self.jobs_quota[job_id])
                         
                     if tunnel_quota_bw > max_quota_bw:
@@ -211,10 +216,9 @@ class Seawall():
                     workload = job.workloads[workload_id]
                     selected_tunnel = self.job_schedules[job_id].tunnels[workload_id]
                     for link in selected_tunnel:
-                        if self.link_traffic[link.link_id] == []:
-                            continue
-                        if self.link_traffic[link.link_id][-1].job_id == job_id:
-                            self.link_traffic[link.link_id].pop()
+                        # 本任务的流量都在链路流量列表的末尾
+                        if self.link_traffic[link.link_id] and self.link_traffic[link.link_id][-1].job_id == job_id:
+                            self.pop_traffic(link.link_id)
             print(f"{job_cnt}/{len(jobs)} admit = {a[job_cnt]}")
         
         return a
@@ -0,0 +1,234 @@
+from dataclasses import dataclass
+import numpy as np
+from typing import Optional
+import time
+import sys
+import os
+
+# 动态添加项目根目录到 sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
+
+from network.timeline import HORIZON, active_mask
+from phase1.admission_control import AdmissionController
+
+# 全局启动时间优化：在两次准入之间重新选择所有已准入任务的启动时间，最小化最大链路利用率
+# 链路负载按时间线矩阵维护，每次移动只重新计算被移动任务经过的链路（增量评估）
+# 负载矩阵和任务足迹在多次优化之间保留，每次优化前按控制器的链路版本号只同步发生变化的链路上的任务
+
+@dataclass
+class OptimizeResult:
+    initial: float # 优化前的最大链路利用率（按负载矩阵）
+    final: float # 优化后的最大链路利用率
+    moves: int = 0 # 接受的移动次数
+    evaluations: int = 0 # 评估的候选启动时间数
+    committed: bool = False # 是否提交
+    time: float = 0.0 # (s)，包括同步、提交和刷新控制器峰值带宽的时间
+
+class StartTimeOptimizer:
+
+    def __init__(self, controller: AdmissionController, time_limit: float = 0.05):
+        self.controller = controller
+        self.time_limit = time_limit # 每次优化的时间上限（秒）
+
+        link_num = controller.network.link_num
+        self.capacity: np.ndarray = controller.capacity # link_id -> 容量（与控制器共享，链路容量变化时同步变化）
+        self.load = np.zeros((link_num, HORIZON)) # 链路负载时间线 [link_id, epoch]
+        self.util = np.zeros(link_num) # link_id -> 利用率
+        self.link_jobs: list[set[int]] = [set() for _ in range(link_num)] # link_id -> 负载矩阵中经过该链路的任务
+        self.versions = np.full(link_num, -1, dtype=np.int64) # 负载矩阵同步到的控制器链路版本号
+        # 任务经过的链路及每条链路上的流量 (cycle, t_s, t_e, bw)
+        self.job_links: dict[int, tuple[np.ndarray, list[list[tuple[int, int, int, float]]]]] = {}
+        self.start_times: dict[int, int] = {} # 负载矩阵中任务的启动时间
+        # 任务在各启动时间下的负载时间线（行与 job_links 中的链路对应），任务的流量变化时删除
+        self.footprints: dict[int, dict[int, np.ndarray]] = {} # job_id -> start_time -> [链路, epoch]
+        # 提交时刷新控制器峰值带宽的累计耗时（秒）和累计工作量（变化时间点数 × 流量数），用于为提交预留时间
+        self.refresh_time = 0.0
+        self.refresh_work = 0
+        # 评估一个任务所有候选启动时间的累计耗时（秒）和次数，剩余时间不足一次评估时停止搜索
+        self.move_time = 0.0
+        self.move_count = 0
+
+    def sync(self) -> None:
+        # 同步控制器自上次优化以来的变化：只处理版本号变化的链路上（原有或现有）的任务
+        controller = self.controller
+        changed = np.flatnonzero(controller.link_version != self.versions)
+        if not changed.size:
+            return
+        self.versions[changed] = controller.link_version[changed]
+        jobs: set[int] = set()
+        for link_id in changed:
+            jobs |= self.link_jobs[link_id]
+            jobs.update(traffic.job_id for traffic in controller.link_traffic.get(link_id, ()))
+        # 负载或容量变化的链路重新计算利用率，故障链路（容量为 0）的利用率记为 0
+        rows = set(changed.tolist())
+        for job_id in jobs:
+            rows |= self.sync_job(job_id)
+        rows = list(rows)
+        capacity = self.capacity[rows]
+        self.util[rows] = np.divide(self.load[rows].max(axis=1), capacity, out=np.zeros(len(rows)), where=capacity > 0)
+
+    def sync_job(self, job_id: int) -> set[int]:
+        # 按控制器的流量和启动时间更新任务在负载矩阵中的贡献，返回负载变化的链路
+        controller = self.controller
+        links: dict[int, list[tuple[int, int, int, float]]] = {}
+        for link_id, index in controller.job_flows.get(job_id, ()):
+            traffic = controller.link_traffic[link_id][index]
+            links.setdefault(link_id, []).append((traffic.cycle, traffic.t_s, traffic.t_e, traffic.bw))
+        link_ids = sorted(links)
+        flows = [sorted(links[link_id]) for link_id in link_ids]
+        start_time = controller.job_schedules[job_id].start_time if flows else None
+
+        old = self.job_links.get(job_id)
+        same_flows = old is not None and old[0].tolist() == link_ids and old[1] == flows
+        if same_flows and self.start_times[job_id] == start_time:
+            return set()
+        touched = set(link_ids)
+        if old is not None:
+            self.load[old[0]] -= self.footprint(job_id, self.start_times[job_id])
+            for link_id in old[0].tolist():
+                self.link_jobs[link_id].discard(job_id)
+                touched.add(link_id)
+            if not same_flows:
+                self.footprints.pop(job_id, None)
+        if not flows:
+            self.job_links.pop(job_id, None)
+            self.start_times.pop(job_id, None)
+            return touched
+        self.job_links[job_id] = (np.array(link_ids, dtype=np.int64), flows)
+        self.start_times[job_id] = start_time
+        self.load[link_ids] += self.footprint(job_id, start_time)
+        for link_id in link_ids:
+            self.link_jobs[link_id].add(job_id)
+        return touched
+
+    def footprint(self, job_id: int, start_time: int) -> np.ndarray:
+        footprints = self.footprints.setdefault(job_id, {})
+        if start_time not in footprints:
+            rows, flows = self.job_links[job_id]
+            footprint = np.zeros((len(rows), HORIZON))
+            for row, link_flows in enumerate(flows):
+                for cycle, t_s, t_e, bw in link_flows:
+                    footprint[row] += bw * active_mask(cycle, start_time, t_s, t_e)
+            footprints[start_time] = footprint
+        return footprints[start_time]
+
+    def best_move(self, job_id: int, start_time: int, util: np.ndarray) -> tuple[Optional[int], tuple[float, float], int]:
+        # 增量评估任务的所有候选启动时间：只重新计算其经过的链路，目标为 (最大利用率, 利用率之和) 的字典序
+        rows = self.job_links[job_id][0]
+        candidates = [s for s in range(0, self.controller.jobs[job_id].cycle, self.controller.strat_time_step) if s != start_time]
+        if not candidates:
+            return None, (util.max(), util.sum()), 0
+        others = util.copy()
+        others[rows] = 0.0
+        others_max = others.max()
+        others_sum = others.sum()
+
+        base = self.load[rows] - self.footprint(job_id, start_time)
+        stacked = base[None, :, :] + np.stack([self.footprint(job_id, s) for s in candidates])
+        peaks = stacked.max(axis=2) / self.capacity[rows] # [候选, 链路]
+        max_util = np.maximum(peaks.max(axis=1), others_max)
+        sum_util = peaks.sum(axis=1) + others_sum
+        best = int(np.lexsort((sum_util, max_util))[0])
+        return candidates[best], (max_util[best], sum_util[best]), len(candidates)
+
+    def link_work(self, link_id: int) -> int:
+        # 刷新链路峰值带宽的工作量：update_peak_bw 在每个变化时间点遍历所有流量
+        controller = self.controller
+        return len(controller.change_points.get(link_id, ())) * len(controller.link_traffic.get(link_id, ()))
+
+    def refresh_reserve(self, work: int) -> float:
+        # 估计提交时刷新峰值带宽的耗时（秒）
+        if self.refresh_work == 0:
+            return 0.0
+        return work * self.refresh_time / self.refresh_work
+
+    def optimize(self, time_limit: Optional[float] = None) -> OptimizeResult:
+        # 局部搜索：按利用率从高到低遍历链路，在链路上带宽大的任务中寻找使目标下降的启动时间，
+        # 接受第一个改进并重新开始，直到没有改进或超时；所有修改在结束时一次性提交
+        # 同步、提交和刷新控制器峰值带宽的时间都计入时间上限：接受移动前为提交预留刷新其链路的时间
+        timer = time.time()
+        deadline = timer + (self.time_limit if time_limit is None else time_limit)
+        controller = self.controller
+        self.sync()
+        util = self.util.copy()
+        result = OptimizeResult(initial=util.max(), final=util.max())
+
+        original = dict(self.start_times)
+        objective = (util.max(), util.sum())
+        touched: set[int] = set() # 被移动任务经过的链路
+        work = 0 # 刷新 touched 的工作量
+
+        improved = True
+        while improved and time.time() < deadline:
+            improved = False
+            for row in np.argsort(-util):
+                if util[row] <= 0.0:
+                    break
+                link_id = int(row)
+                jobs = sorted(self.link_jobs[link_id],
+                              key=lambda job_id: -sum(traffic.bw for traffic in controller.link_traffic[link_id] if traffic.job_id == job_id))
+                for job_id in jobs:
+                    move_reserve = self.move_time / self.move_count if self.move_count > 0 else 0.0
+                    if time.time() + move_reserve + self.refresh_reserve(work) >= deadline:
+                        break
+                    move_timer = time.time()
+                    start_time, value, evaluations = self.best_move(job_id, self.start_times[job_id], util)
+                    self.move_time += time.time() - move_timer
+                    self.move_count += 1
+                    result.evaluations += evaluations
+                    if start_time is not None and (value[0] < objective[0] - 1e-9 or
+                                                   (value[0] <= objective[0] + 1e-9 and value[1] < objective[1] - 1e-9)):
+                        rows = self.job_links[job_id][0]
+                        added = set(rows.tolist()) - touched
+                        added_work = sum(self.link_work(link_id) for link_id in added)
+                        if time.time() + self.refresh_reserve(work + added_work) >= deadline:
+                            break
+                        self.load[rows] += self.footprint(job_id, start_time) - self.footprint(job_id, self.start_times[job_id])
+                        util[rows] = self.load[rows].max(axis=1) / self.capacity[rows]
+                        objective = (util.max(), util.sum())
+                        self.start_times[job_id] = start_time
+                        touched |= added
+                        work += added_work
+                        result.moves += 1
+                        improved = True
+                        break
+                if improved or time.time() + self.refresh_reserve(work) >= deadline:
+                    break
+
+        moved = [job_id for job_id in self.job_links if self.start_times[job_id] != original[job_id]]
+        if moved:
+            result.committed = self.commit(moved, original, touched, result.initial)
+        self.util = util if result.committed else self.util
+        result.final = self.util.max()
+        result.time = time.time() - timer
+        return result
+
+    def commit(self, moved: list[int], original: dict[int, int], touched: set[int], initial: float) -> bool:
+        # 一次性修改所有被移动任务的启动时间，刷新控制器上这些链路的峰值带宽并校验，最大利用率上升时全部回滚
+        # 负载矩阵已按新的启动时间更新，回滚时恢复矩阵
+        controller = self.controller
+        for job_id in moved:
+            controller.job_schedules[job_id].start_time = self.start_times[job_id]
+            controller.touch_job(job_id)
+        # 本次修改的链路版本号变化已反映在负载矩阵中
+        rows = list(touched)
+        self.versions[rows] = controller.link_version[rows]
+        controller.stale_links |= touched
+        work = sum(self.link_work(link_id) for link_id in touched)
+        timer = time.time()
+        controller.refresh_links(touched)
+        self.refresh_time += time.time() - timer
+        self.refresh_work += work
+        if max(controller.link_peak_bw[link_id] / self.capacity[link_id] for link_id in touched) <= initial + 1e-9:
+            return True
+        for job_id in moved:
+            rows = self.job_links[job_id][0]
+            self.load[rows] += self.footprint(job_id, original[job_id]) - self.footprint(job_id, self.start_times[job_id])
+            self.start_times[job_id] = original[job_id]
+            controller.job_schedules[job_id].start_time = original[job_id]
+            controller.touch_job(job_id)
+        rows = list(touched)
+        self.versions[rows] = controller.link_version[rows]
+        controller.stale_links |= touched
+        controller.refresh_links(touched)
+        return False
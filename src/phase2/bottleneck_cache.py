@@ -0,0 +1,57 @@
+from collections import OrderedDict
+from typing import Optional
+from params import BOTTLENECK_CACHE_SIZE
+
+# 时间窗口：(cycle, t_s, t_e)，t_s 和 t_e 已按任务启动时间平移并对周期取余
+Window = tuple[int, int, int]
+
+# 链路瓶颈查询缓存：每条链路带一个单调递增的版本号，链路流量变化时版本号递增
+# 查询结果按 (link_id, 时间窗口, 版本号) 存放在有界 LRU 中，流量未变化的链路不再重新扫描变化时间点
+# 旧版本号的条目不会再被命中，由 LRU 淘汰
+class BottleneckCache:
+
+    def __init__(self, maxsize: int = BOTTLENECK_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[tuple[int, Window, int], float] = OrderedDict() # (link_id, window, version) -> 已分配带宽
+        self.link_version: dict[int, int] = {} # link_id -> 版本号
+        self.clock = 0 # 最近分配的版本号
+        self.base = 0 # 整体重置时的版本号，重置后未修改过的链路取该值
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, link_id: int) -> int:
+        return self.link_version.get(link_id, self.base)
+
+    def bump(self, link_id: int) -> None:
+        # 链路流量发生变化
+        self.clock += 1
+        self.link_version[link_id] = self.clock
+
+    def reset(self) -> None:
+        # 所有链路的流量被整体替换：新的版本号大于此前任何链路的版本号
+        self.clock += 1
+        self.base = self.clock
+        self.link_version.clear()
+        self.entries.clear()
+
+    def get(self, link_id: int, window: Window) -> Optional[float]:
+        key = (link_id, window, self.version(link_id))
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, link_id: int, window: Window, alloc_bw: float) -> None:
+        key = (link_id, window, self.version(link_id))
+        self.entries[key] = alloc_bw
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def report(self) -> str:
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total > 0 else 0.0
+        return f"Bottleneck cache: hits = {self.hits}, misses = {self.misses}, hit rate = {hit_rate:.2%}"
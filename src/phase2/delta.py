@@ -0,0 +1,45 @@
+from dataclasses import dataclass, field
+from job.job_info import JobInfo
+from phase1.admission_control import JobSchedule
+
+# 负载键：(job_id, workload_id)
+WorkloadKey = tuple[int, int]
+
+# 负载签名：(cycle, start_time, t_s, t_e, bw, 隧道链路编号)
+WorkloadSignature = tuple[int, int, int, int, float, tuple[int, ...]]
+
+@dataclass
+class WorkloadDelta:
+    added: set[WorkloadKey] = field(default_factory=set) # 新增的负载
+    removed: set[WorkloadKey] = field(default_factory=set) # 删除的负载
+    changed: set[WorkloadKey] = field(default_factory=set) # 时间窗口、带宽或隧道发生变化的负载
+    touched_links: set[int] = field(default_factory=set) # 上述负载新旧隧道经过的链路
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.changed)
+
+def workload_signatures(jobs: dict[int, JobInfo], schedules: dict[int, JobSchedule]) -> dict[WorkloadKey, WorkloadSignature]:
+    # 记录每个负载的签名快照，避免依赖调用方是否原地修改 JobInfo
+    signatures: dict[WorkloadKey, WorkloadSignature] = {}
+    for job_id, job in jobs.items():
+        start_time = schedules[job_id].start_time
+        for workload_id, workload in enumerate(job.workloads):
+            link_ids = tuple(link.link_id for link in schedules[job_id].tunnels[workload_id])
+            signatures[(job_id, workload_id)] = (job.cycle, start_time, workload.t_s, workload.t_e, workload.bw, link_ids)
+    return signatures
+
+def diff_workloads(old: dict[WorkloadKey, WorkloadSignature], new: dict[WorkloadKey, WorkloadSignature]) -> WorkloadDelta:
+    delta = WorkloadDelta()
+    for key, signature in new.items():
+        if key not in old:
+            delta.added.add(key)
+            delta.touched_links.update(signature[5])
+        elif old[key] != signature:
+            delta.changed.add(key)
+            delta.touched_links.update(signature[5])
+            delta.touched_links.update(old[key][5])
+    for key, signature in old.items():
+        if key not in new:
+            delta.removed.add(key)
+            delta.touched_links.update(signature[5])
+    return delta
@@ -1,12 +1,23 @@
+import numpy as np
+from scipy.sparse import csr_matrix
 from network.graph import Graph
+from network.timeline import HORIZON, active_epochs
 from job.job_info import JobInfo
-from job.workload import Workload
-from phase1.admission_control import JobSchedule, Traffic, Tunnel
-from gurobipy import Model, GRB
-from params import SCHEDULE_INTERVAL
+from phase1.admission_control import JobSchedule
 
-# TODO: 这里为了方便直接设置成 SCHEDULE_INTERVAL，因为算出来的最小公倍数可能远远大于这个数。具体如何处理后续再考虑
-overlap_circle = SCHEDULE_INTERVAL
+def greedy_fill(capacity: np.ndarray, tunnels: list[np.ndarray], epochs: list[np.ndarray],
+                demand: np.ndarray, load: np.ndarray) -> np.ndarray:
+    # 按顺序为每个负载分配 min(需求, 隧道各链路在活跃 epoch 内的最小剩余带宽)
+    # load 为 链路 × epoch 的负载矩阵，原地更新；每个负载的所有链路、所有活跃 epoch 一次批量更新
+    alloc = np.zeros(len(demand))
+    for index, (links, cols) in enumerate(zip(tunnels, epochs)):
+        window = np.ix_(links, cols)
+        window_load = load[window]
+        residual = capacity[links] - window_load.max(axis=1, initial=0.0)
+        alloc[index] = min(demand[index], max(0.0, residual.min(initial=np.inf)))
+        if alloc[index] > 0:
+            load[window] = window_load + alloc[index]
+    return alloc
 
 class Greedy:
     def __init__(self, network: Graph, jobs: dict[int, JobInfo], schedules: dict[int, JobSchedule]):
@@ -14,81 +25,50 @@ class Greedy:
         self.jobs = jobs
         self.schedules = schedules
 
-        self.link_traffic: dict[int, list[Traffic]] = {} # 链路上经过的流量模式 link_id -> list[Traffic]
-        # 链路所有流量变化的时间点
-        self.change_points: dict[int, set[int]] = {} # link_id -> set[int]
+        # 负载按任务、负载顺序编号，下标 -> (job_id, workload_id)
+        self.keys: list[tuple[int, int]] = [
+            (job_id, workload_id) for job_id, job in jobs.items() for workload_id in range(len(job.workloads))
+        ]
+        # 负载 × 链路关联矩阵，第 i 行的非零列即负载 i 的隧道
+        self.incidence = self.build_incidence()
+        self.capacity = np.array([link.capacity for link in network.links], dtype=float)
+        # 链路 × epoch 的已分配带宽
+        self.link_load = np.zeros((network.link_num, HORIZON))
         # 链路峰值带宽
         self.link_peak_bw: dict[int, float] = {} # link_id -> peak_bandwidth
+        # 负载分配带宽
+        self.allocation: dict[tuple[int, int], float] = {} # (job_id, workload_id) -> bw
 
-    def update_traffic_pattern(self, job_id: int, workload_id: int, new_bw: float):
+    def build_incidence(self) -> csr_matrix:
+        indptr = [0]
+        indices: list[int] = []
+        for job_id, workload_id in self.keys:
+            indices.extend(link.link_id for link in self.schedules[job_id].tunnels[workload_id])
+            indptr.append(len(indices))
+        return csr_matrix(
+            (np.ones(len(indices)), np.array(indices, dtype=int), np.array(indptr, dtype=int)),
+            shape=(len(self.keys), self.network.link_num)
+        )
+
+    def tunnel_links(self, index: int) -> np.ndarray:
+        return self.incidence.indices[self.incidence.indptr[index]:self.incidence.indptr[index + 1]]
 
-        tunnel: Tunnel = self.schedules[job_id].tunnels[workload_id]
-        for link in tunnel:
-            if link.link_id not in self.link_traffic:
-                self.link_traffic[link.link_id] = []
-                self.change_points[link.link_id] = set()
-            self.link_traffic[link.link_id].append(
-                Traffic(
-                    job_id = job_id,
-                    cycle = self.jobs[job_id].cycle,
-                    t_s = self.jobs[job_id].workloads[workload_id].t_s,
-                    t_e = self.jobs[job_id].workloads[workload_id].t_e,
-                    bw = new_bw
-                )
-            )
-            # 添加新流量的变化时间点
-            for circle_offset in range(0, overlap_circle, self.jobs[job_id].cycle):
-                start = (self.jobs[job_id].workloads[workload_id].t_s + circle_offset + self.schedules[job_id].start_time) % overlap_circle
-                end = (self.jobs[job_id].workloads[workload_id].t_e + circle_offset + self.schedules[job_id].start_time) % overlap_circle
-                            
-                self.change_points[link.link_id].add(start)
-                self.change_points[link.link_id].add(end)
-    
     def calculate_peak_bw(self, link_id: int):
-        
-        if link_id not in self.link_traffic:
-            self.link_traffic[link_id] = []
-            self.change_points[link_id] = set()
+        self.link_peak_bw[link_id] = float(self.link_load[link_id].max())
 
-        peak_bw = 0.0
-        # 在每个流量变化时间点计算总带宽
-        for time in sorted(list(self.change_points[link_id])):
-            bw_now = 0.0
-            for traffic in self.link_traffic[link_id]:
-                time_in_circle = (time + traffic.cycle - self.schedules[traffic.job_id].start_time) % traffic.cycle
-                if time_in_circle >= traffic.t_s and time_in_circle < traffic.t_e:
-                    bw_now += traffic.bw
-            if bw_now >= peak_bw:
-                peak_bw = bw_now
-        self.link_peak_bw[link_id] = peak_bw
-        
     def greedy_alloc(self) -> tuple[float, float]:
 
-        total_flow = 0.0
-        total_workload_bw = 0.0
+        demand = np.array([self.jobs[job_id].workloads[workload_id].bw for job_id, workload_id in self.keys], dtype=float)
+        epochs = []
+        for job_id, workload_id in self.keys:
+            workload = self.jobs[job_id].workloads[workload_id]
+            epochs.append(active_epochs(self.jobs[job_id].cycle, self.schedules[job_id].start_time, workload.t_s, workload.t_e))
+        tunnels = [self.tunnel_links(index) for index in range(len(self.keys))]
+
+        alloc = greedy_fill(self.capacity, tunnels, epochs, demand, self.link_load)
 
+        self.allocation = dict(zip(self.keys, alloc.tolist()))
         for link_id in range(self.network.link_num):
             self.calculate_peak_bw(link_id)
 
-        for job_id, job in self.jobs.items():
-
-            update_link_id: set[int] = set()
-            for workload_id, workload in enumerate(job.workloads):
-                tunnel: Tunnel = self.schedules[job_id].tunnels[workload_id]
-                bottleneck_bw = float("inf")
-                for link in tunnel:
-                    bottleneck_bw = min(bottleneck_bw, link.capacity - self.link_peak_bw[link.link_id])
-                alloc_bw = min(workload.bw, bottleneck_bw)
-                # print("job_id: ", job_id, " workload_id: ", workload_id, " alloc_bw: ", alloc_bw)
-                
-                for link in tunnel:
-                    self.update_traffic_pattern(job_id, workload_id, alloc_bw)
-                    self.link_peak_bw[link.link_id] += alloc_bw
-                    
-                total_flow += alloc_bw
-                total_workload_bw += workload.bw
-            
-            for link_id in update_link_id:
-                self.calculate_peak_bw(link_id)
-
-        return total_flow, total_workload_bw
\ No newline at end of file
+        return float(alloc.sum()), float(demand.sum())
@@ -2,14 +2,16 @@ from network.graph import Graph
 from job.job_info import JobInfo
 from job.workload import Workload
 from phase1.admission_control import JobSchedule, Traffic, Tunnel
-from gurobipy import Model, GRB
+from solver.lp_backend import LPSolver, build_lp
 from params import SCHEDULE_INTERVAL
 import numpy as np
 import time
-from typing import Dict, List, Tuple, Set, Any
+from typing import Dict, List, Tuple, Set, Any, Optional
 from collections import defaultdict, Counter
 import heapq
 import math
+import copy
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 
 # TODO: 这里为了方便直接设置成 SCHEDULE_INTERVAL，因为算出来的最小公倍数可能远远大于这个数。具体如何处理后续再考虑
@@ -32,12 +34,35 @@ class Group:
     demand: float  # 总需求带宽
     allocated_entries: int = 0  # 分配的表项数
 
+# 工作进程中用于减少流量组配置的 IGR 副本，由进程池的 initializer 设置
+_reducer: Optional['IGR'] = None
+
+def _init_reducer(reducer: 'IGR') -> None:
+    global _reducer
+    _reducer = reducer
+
+def _reduce_group(task: Tuple[Group, List[Path], float]) -> Tuple[List[Path], List[Path]]:
+    # 返回被原地修改后的当前路径和减少后的路径，两者在同一次序列化中保持对象共享关系
+    group, paths, theta = task
+    _reducer.path_groups = {group.job_id: {group.workload_id: paths}}
+    return paths, _reducer.reduce_single_group(group, theta)
+
 class IGR:
-    def __init__(self, network: Graph, jobs: dict[int, JobInfo], schedules: dict[int, JobSchedule]):
+    def __init__(self, network: Graph, jobs: dict[int, JobInfo], schedules: dict[int, JobSchedule], solver: Optional[LPSolver] = None,
+                 workers: int = 1, executor: str = "process"):
         self.network = network
         self.jobs = jobs
         self.schedules = schedules
 
+        # 每轮迭代中各流量组的配置减少可以并行计算：workers > 1 时使用进程池或线程池
+        if executor not in ("process", "thread"):
+            raise ValueError(f"Unknown executor: {executor}")
+        self.workers = workers
+        self.executor = executor
+
+        # LP 求解后端（Gurobi / HiGHS），用于 update_schedule
+        self.solver = solver if solver is not None else LPSolver()
+
         self.link_traffic: dict[int, list[Traffic]] = {} # 链路上经过的流量模式 link_id -> list[Traffic]
         # 链路所有流量变化的时间点
         self.change_points: dict[int, set[int]] = {} # link_id -> set[int]
@@ -66,6 +91,11 @@ class IGR:
         self.traffic_change_threshold = 0.05  # 降低阈值以更频繁地触发重新计算
         self.max_oversub_factor = 8.0  # 过度订阅上限，允许更积极地利用链路
         
+        # 链路容量向量 link_id -> capacity
+        self.capacity = np.array([link.capacity for link in network.links], dtype=float)
+        # 所有流量组的需求之和，在 initialize_groups 中计算
+        self.total_demand = 0.0
+
         # 链路利用率追踪
         self.link_utilization: Dict[int, float] = {}
         # 路径组表
@@ -142,28 +172,14 @@ class IGR:
 
         for job_id, job in self.jobs.items():
 
-            # 创建 Gurobi 模型
-            model = Model("TrafficScheduler")
-            model.setParam('OutputFlag', 0)  # 关闭输出日志
-
-            # 添加变量：updated_workload 中每个负载分配的流量大小
+            # 变量：每个负载分配的流量大小
             # TODO: 此时每个负载分配一条流，后续需要修改为多隧道
-            flow_vars = {}
-            for workload_id, workload in enumerate(job.workloads):
-                flow_vars[workload_id] = model.addVar(
-                    vtype=GRB.CONTINUOUS,
-                    name=f"flow_{workload_id}",
-                    lb=0.0,
-                    ub=float("inf")
-                )
+            rows: list[np.ndarray] = []
+            coefs: list[np.ndarray] = []
+            rhs: list[float] = []
+            for workload in job.workloads:
                 total_workload_bw += workload.bw
 
-            # 设置目标函数：最大化总流量
-            model.setObjective(
-                sum(flow_vars[workload_id] for workload_id in range(len(job.workloads))),
-                GRB.MAXIMIZE
-            )
-
             # 链路容量约束
             # TODO: 为了简化，不考虑更新流之间的重叠（即每个约束只有一个变量）
             # 可以通过减小数据集中更新的负载数来降低这个简化的负面效果，后续再修改
@@ -175,30 +191,31 @@ class IGR:
                 if bottleneck_bw < 0:
                     bottleneck_bw = 0
 
-                model.addConstr(
-                    flow_vars[workload_id] <= bottleneck_bw,
-                    name=f"link_capacity_{workload_id}"
-                )
+                rows.append(np.array([workload_id]))
+                coefs.append(np.ones(1))
+                rhs.append(bottleneck_bw)
 
-            # 带宽需求约束
-            for workload_id, workload in enumerate(job.workloads):
-                model.addConstr(
-                    flow_vars[workload_id] <= workload.bw,
-                    name=f"bw_demand_{workload_id}"
-                )
+            # 带宽需求约束作为变量上界，目标函数：最大化总流量
+            lp = build_lp(
+                c = np.ones(len(job.workloads)),
+                rows = rows,
+                coefs = coefs,
+                b_ub = rhs,
+                lb = np.zeros(len(job.workloads)),
+                ub = np.array([workload.bw for workload in job.workloads], dtype=float),
+                name = "TrafficScheduler"
+            )
 
             # 求解模型
-            model.optimize()
+            result = self.solver.solve(lp)
 
             # 检查是否找到可行解
-            if model.status in [GRB.OPTIMAL, GRB.SUBOPTIMAL, GRB.TIME_LIMIT, GRB.SOLUTION_LIMIT]:
+            if result.success:
                 for workload_id in range(len(job.workloads)):
-                    total_flow += flow_vars[workload_id].X
-                    self.update_traffic_pattern(job_id, workload_id, flow_vars[workload_id].X)
+                    total_flow += float(result.x[workload_id])
+                    self.update_traffic_pattern(job_id, workload_id, float(result.x[workload_id]))
             else:
-                raise ValueError("Gurobi failed to find a feasible solution.")
-            
-            model.dispose()
+                raise ValueError(f"LP solver ({result.backend}) failed to find a feasible solution.")
 
         return total_flow, total_workload_bw
     
@@ -222,15 +239,7 @@ class IGR:
         self.link_peak_bw[link_id] = peak_bw
         
         # 计算链路利用率
-        link_capacity = 0.0
-        for src_node, links in self.network.edges.items():
-            for link in links:
-                if link.link_id == link_id:
-                    link_capacity = link.capacity
-                    break
-            if link_capacity > 0:
-                break
-                
+        link_capacity = self.capacity[link_id]
         if link_capacity > 0:
             self.link_utilization[link_id] = peak_bw / link_capacity
             
@@ -270,10 +279,12 @@ class IGR:
                 self.path_groups[job_id][workload_id] = [default_path]
                 
                 group_id += 1
+
+        self.total_demand = sum(g.demand for g in self.groups)
                 
     def traffic_proportional_allocation(self, group: Group) -> int:
         """基于流量需求比例分配表项"""
-        total_demand = sum(g.demand for g in self.groups)
+        total_demand = self.total_demand
         if total_demand == 0:
             return self.min_ecmp_size
             
@@ -297,16 +308,7 @@ class IGR:
         
         max_ratio = 0.0
         for link_id, load in link_loads.items():
-            # 查找链路容量
-            capacity = 0.0
-            for src_node, links in self.network.edges.items():
-                for link in links:
-                    if link.link_id == link_id:
-                        capacity = link.capacity
-                        break
-                if capacity > 0:
-                    break
-                    
+            capacity = self.capacity[link_id]
             if capacity > 0:
                 ratio = load / capacity
                 max_ratio = max(max_ratio, ratio)
@@ -367,36 +369,26 @@ class IGR:
                     p.weight = max(1, int(p.weight * scale_factor))
                     new_total += p.weight
                     
-                # 调整到精确匹配
-                while new_total > group.allocated_entries:
-                    # 按权重和带宽比值排序，减少效率低的路径权重
-                    sorted_idx = sorted(
-                        range(len(result_paths)), 
-                        key=lambda i: result_paths[i].allocated_bw / max(1, result_paths[i].weight), 
-                        reverse=False
-                    )
-                    
-                    for idx in sorted_idx:
-                        if result_paths[idx].weight > 1:
-                            result_paths[idx].weight -= 1
-                            new_total -= 1
-                            break
-                    
-                    if all(p.weight <= 1 for p in result_paths):
-                        break  # 无法再减少
+                # 调整到精确匹配：按 带宽/权重 比值建堆，每次只更新被调整路径的键
+                # 比值相同时下标小的路径优先
+                # 减少效率低的路径权重，权重为 1 的路径不在堆中
+                heap = [(p.allocated_bw / max(1, p.weight), i) for i, p in enumerate(result_paths) if p.weight > 1]
+                heapq.heapify(heap)
+                while new_total > group.allocated_entries and heap:
+                    _, idx = heapq.heappop(heap)
+                    result_paths[idx].weight -= 1
+                    new_total -= 1
+                    if result_paths[idx].weight > 1:
+                        heapq.heappush(heap, (result_paths[idx].allocated_bw / result_paths[idx].weight, idx))
                         
+                # 增加效率高的路径权重
+                heap = [(-(p.allocated_bw / max(1, p.weight)), i) for i, p in enumerate(result_paths)]
+                heapq.heapify(heap)
                 while new_total < group.allocated_entries:
-                    # 按权重和带宽比值排序，增加效率高的路径权重
-                    sorted_idx = sorted(
-                        range(len(result_paths)), 
-                        key=lambda i: result_paths[i].allocated_bw / max(1, result_paths[i].weight),
-                        reverse=True
-                    )
-                    
-                    for idx in sorted_idx:
-                        result_paths[idx].weight += 1
-                        new_total += 1
-                        break
+                    _, idx = heapq.heappop(heap)
+                    result_paths[idx].weight += 1
+                    new_total += 1
+                    heapq.heappush(heap, (-(result_paths[idx].allocated_bw / result_paths[idx].weight), idx))
                     
                 break
                 
@@ -561,6 +553,48 @@ class IGR:
         
         return best_paths
         
+    def create_executor(self) -> Optional[Executor]:
+        """创建用于并行减少流量组配置的执行器，迭代期间链路利用率不变，工作进程只需在创建时获得一次快照"""
+        if self.workers <= 1:
+            return None
+        if self.executor == "thread":
+            return ThreadPoolExecutor(max_workers=self.workers)
+        reducer = copy.copy(self)
+        reducer.solver = None
+        reducer.groups = []
+        reducer.path_groups = {}
+        reducer.link_traffic = {}
+        reducer.change_points = {}
+        reducer.link_utilization = dict(self.link_utilization)
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_reducer, initargs=(reducer,))
+
+    def reduce_groups(self, groups: List[Group], theta: float, executor: Optional[Executor] = None) -> bool:
+        """按给定顺序减少各流量组的配置，返回是否有组发生变化"""
+        # 各组的计算只读取链路利用率并修改自身的路径，彼此独立，可以并行计算后按顺序应用
+        if executor is None:
+            results = ((self.path_groups.get(group.job_id, {}).get(group.workload_id, []), self.reduce_single_group(group, theta))
+                       for group in groups)
+        elif isinstance(executor, ThreadPoolExecutor):
+            results = executor.map(
+                lambda group: (self.path_groups.get(group.job_id, {}).get(group.workload_id, []), self.reduce_single_group(group, theta)),
+                groups
+            )
+        else:
+            tasks = [(group, self.path_groups.get(group.job_id, {}).get(group.workload_id, []), theta) for group in groups]
+            results = executor.map(_reduce_group, tasks, chunksize=max(1, len(tasks) // (self.workers * 4)))
+
+        changed = False
+        for group, (current_paths, reduced_paths) in zip(groups, results):
+            if group.job_id in self.path_groups:
+                # 进程池返回的是副本，需要写回被原地修改后的当前路径
+                self.path_groups[group.job_id][group.workload_id] = current_paths
+            # 如果配置有变化
+            if sum(p.weight for p in reduced_paths) < sum(p.weight for p in current_paths):
+                # 更新配置
+                self.path_groups[group.job_id][group.workload_id] = reduced_paths
+                changed = True
+        return changed
+
     def greedy_alloc(self) -> tuple[float, float]:
         """简单的贪心带宽分配方法"""
         total_flow = 0.0
@@ -624,7 +658,9 @@ class IGR:
         # 如果分配表项超过表大小，需要减少
         max_iterations = 15  # 增加迭代次数以找到更优解
         iteration_count = 0
-        best_allocation = None
+        # 最佳分配快照：(job_id, workload_id) -> [(path, weight, allocated_bw)]
+        # 路径对象会在后续迭代中被原地修改，因此只记录其权重和带宽
+        best_allocation: Optional[Dict[Tuple[int, int], List[Tuple[Path, int, float]]]] = None
         best_total_bw = 0
         
         # 优先处理高优先级的流量组，预留足够的表项
@@ -634,18 +670,17 @@ class IGR:
         
         # 根据需求和紧急程度将组分为高优先级和普通优先级
         for group in self.groups:
-            job_id = group.job_id
-            workload_id = group.workload_id
-            workload = self.jobs[job_id].workloads[workload_id]
-            
             # 简单启发式：如果需求占总需求比例大于10%，视为高优先级
-            if group.demand > 0.1 * sum(g.demand for g in self.groups):
+            if group.demand > 0.1 * self.total_demand:
                 high_priority_groups.append(group)
                 reserved_entries += min(self.min_ecmp_size * 2, int(self.table_size * 0.05))  # 为每个高优先级预留表项
             else:
                 normal_priority_groups.append(group)
         
         available_entries = max(0, self.table_size - reserved_entries)
+
+        # 迭代期间链路利用率保持不变，并行执行器在整个迭代过程中复用
+        executor = self.create_executor() if total_entries > self.table_size else None
         
         while total_entries > self.table_size and changed and iteration_count < max_iterations:
             changed = False
@@ -655,32 +690,16 @@ class IGR:
             # 按需求大小逆序排序流量组
             sorted_normal_groups = sorted(normal_priority_groups, key=lambda g: g.demand, reverse=True)
             
-            for group in sorted_normal_groups:
-                # 减少单个组的配置
-                reduced_paths = self.reduce_single_group(group, theta)
-                
-                # 如果配置有变化
-                current_paths = self.path_groups.get(group.job_id, {}).get(group.workload_id, [])
-                if sum(p.weight for p in reduced_paths) < sum(p.weight for p in current_paths):
-                    # 更新配置
-                    self.path_groups[group.job_id][group.workload_id] = reduced_paths
-                    changed = True
+            # 减少单个组的配置
+            changed = self.reduce_groups(sorted_normal_groups, theta, executor)
             
             # 然后处理高优先级组（更保守地减少它们的配置）
             sorted_high_groups = sorted(high_priority_groups, key=lambda g: g.demand, reverse=False)
             
             # 如果普通组的调整不足，才调整高优先级组
             if not changed and total_entries > self.table_size:
-                for group in sorted_high_groups:
-                    # 使用较小的theta值，使高优先级流量保持更稳定
-                    reduced_paths = self.reduce_single_group(group, max(1.0, theta * 0.8)) 
-                    
-                    # 如果配置有变化
-                    current_paths = self.path_groups.get(group.job_id, {}).get(group.workload_id, [])
-                    if sum(p.weight for p in reduced_paths) < sum(p.weight for p in current_paths):
-                        # 更新配置
-                        self.path_groups[group.job_id][group.workload_id] = reduced_paths
-                        changed = True
+                # 使用较小的theta值，使高优先级流量保持更稳定
+                changed = self.reduce_groups(sorted_high_groups, max(1.0, theta * 0.8), executor)
             
             # 保存当前最佳分配情况
             current_bw_estimate = 0
@@ -692,8 +711,10 @@ class IGR:
             
             if current_bw_estimate > best_total_bw:
                 best_total_bw = current_bw_estimate
-                best_allocation = {g.job_id: {g.workload_id: self.path_groups.get(g.job_id, {}).get(g.workload_id, [])[:] 
-                                  for g in self.groups}}
+                best_allocation = {
+                    (g.job_id, g.workload_id): [(p, p.weight, p.allocated_bw) for p in self.path_groups.get(g.job_id, {}).get(g.workload_id, [])]
+                    for g in self.groups
+                }
             
             # 如果无法进一步减少，放宽过度订阅限制
             if not changed and theta < self.max_oversub_factor:
@@ -706,23 +727,23 @@ class IGR:
                 total_entries = sum(sum(path.weight for path in 
                                     self.path_groups.get(group.job_id, {}).get(group.workload_id, [])) 
                                     for group in self.groups)
+
+        if executor is not None:
+            executor.shutdown()
         
         # 如果找到了更好的分配方案，恢复它
         if best_allocation and iteration_count >= max_iterations:
-            for group in self.groups:
-                job_id = group.job_id
-                workload_id = group.workload_id
-                if job_id in best_allocation and workload_id in best_allocation[job_id]:
-                    self.path_groups[job_id][workload_id] = best_allocation[job_id][workload_id]
+            for (job_id, workload_id), snapshot in best_allocation.items():
+                for path, weight, allocated_bw in snapshot:
+                    path.weight = weight
+                    path.allocated_bw = allocated_bw
+                self.path_groups[job_id][workload_id] = [path for path, _, _ in snapshot]
         
         # 步骤6：基于路径权重分配带宽
         # 先计算每条链路的可用带宽
-        link_available_bw = {}
         oversub_factor = min(1.2, theta if theta > 1.0 else 1.0)  # 安全过度订阅因子
-        for src_node, links in self.network.edges.items():
-            for link in links:
-                # 对容量进行轻微过度订阅，以提高利用率
-                link_available_bw[link.link_id] = link.capacity * oversub_factor
+        # 对容量进行轻微过度订阅，以提高利用率
+        link_available_bw = dict(enumerate((self.capacity * oversub_factor).tolist()))
         
         # 按优先级处理组，先处理高优先级小工作负载
         # 1. 小作业先满足其最低需求
@@ -824,6 +845,7 @@ class IGR:
             total_flow += group_additional_bw
         
         # 第三阶段：应用流量模式更新和链路利用率计算
+        touched_links: set[int] = set()
         for group in self.groups:
             job_id = group.job_id
             workload_id = group.workload_id
@@ -833,11 +855,11 @@ class IGR:
             for path in paths:
                 if path.allocated_bw > 0:
                     self.update_traffic_pattern(job_id, workload_id, path.allocated_bw)
-            
-            # 更新链路利用率
-            for path in paths:
-                for link_id in path.links:
-                    self.calculate_peak_bw(link_id)
+                touched_links.update(path.links)
+        
+        # 所有流量更新后，每条链路只需计算一次利用率
+        for link_id in touched_links:
+            self.calculate_peak_bw(link_id)
         
         # print(f"IGR allocated flow: {total_flow}, total workload demand: {total_workload_bw}")
         return total_flow, total_workload_bw
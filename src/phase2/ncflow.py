@@ -2,22 +2,105 @@ from network.graph import Graph
 from job.job_info import JobInfo
 from job.workload import Workload
 from phase1.admission_control import JobSchedule, Traffic, Tunnel
-from gurobipy import Model, GRB
+from network.timeline import HORIZON, active_mask, active_epochs
+from phase2.traffic_schedule import segment_capacity_rows
+from phase2.greedy import greedy_fill
+from solver.lp_backend import LPSolver, LPResult, build_lp
 from params import SCHEDULE_INTERVAL
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 import numpy as np
 import heapq
+import os
 from typing import List, Dict, Tuple, Set, Optional
 
 # TODO: 这里为了方便直接设置成 SCHEDULE_INTERVAL，因为算出来的最小公倍数可能远远大于这个数。具体如何处理后续再考虑
 overlap_circle = SCHEDULE_INTERVAL
 
+def cluster_topology(network: Graph) -> dict[int, int]:
+    """按核心交换机划分集群，返回 node_id -> cluster_id，CORE 节点不属于任何集群"""
+    # 去掉 CORE 节点后的每个连通分量（一个 SPINE 及其下的 LEAF、HOST）归属于与其相连的编号最小的 CORE
+    # 同一 CORE 下的分量组成一个集群；拓扑中没有节点类型时，所有节点同属一个集群
+    core_nodes = {node for node, node_type in network.node_types.items() if node_type == "CORE"}
+    cluster_keys: dict[int, int] = {} # node_id -> 集群标识（所属 CORE 编号，或分量中最小节点编号的相反数）
+    for root in sorted(network.nodes - core_nodes):
+        if root in cluster_keys:
+            continue
+        component = [root]
+        parents: set[int] = set()
+        visited = {root}
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            for link in network.edges[node]:
+                if link.dst in core_nodes:
+                    parents.add(link.dst)
+                elif link.dst not in visited:
+                    visited.add(link.dst)
+                    component.append(link.dst)
+                    stack.append(link.dst)
+        cluster_key = min(parents) if parents else -root - 1
+        for node in component:
+            cluster_keys[node] = cluster_key
+
+    # 集群重新连续编号
+    cluster_ids: dict[int, int] = {}
+    return {node: cluster_ids.setdefault(key, len(cluster_ids)) for node, key in cluster_keys.items()}
+
+@dataclass
+class FlowSubproblem:
+    name: str
+    windows: list[tuple[int, int, int, int]] # 每个负载的 (cycle, start_time, t_s, t_e)
+    tunnels: list[tuple[int, ...]] # 每个负载在子问题中受约束的链路
+    link_capacity: dict[int, float] # link_id -> capacity
+    ub: np.ndarray # 每个负载的分配上界
+    backend: str = "auto"
+    time_limit: Optional[float] = None
+
+def solve_flow_subproblem(task: FlowSubproblem) -> tuple[np.ndarray, Optional[LPResult]]:
+    """最大化子问题内的总流量，可在工作进程中执行"""
+    link_members: dict[int, list[int]] = {}
+    for index, tunnel in enumerate(task.tunnels):
+        for link_id in tunnel:
+            link_members.setdefault(link_id, []).append(index)
+    if not link_members:
+        return task.ub.copy(), None
+
+    masks = np.stack([active_mask(*window) for window in task.windows])
+    _, rows, rhs = segment_capacity_rows(link_members, masks, task.link_capacity, task.ub)
+    if not rows:
+        # 没有可能超出容量的时间段，所有负载取上界
+        return task.ub.copy(), None
+
+    lp = build_lp(
+        c = np.ones(len(task.ub)),
+        rows = rows,
+        coefs = [np.ones(len(active)) for active in rows],
+        b_ub = rhs,
+        lb = np.zeros(len(task.ub)),
+        ub = task.ub,
+        name = task.name
+    )
+    result = LPSolver(task.backend, time_limit=task.time_limit).solve(lp)
+    if not result.success:
+        # 零分配总是可行，剩余容量由补充阶段利用
+        return np.zeros(len(task.ub)), result
+    return np.clip(result.x, 0.0, task.ub), result
+
 class NCFlow:
-    def __init__(self, network: Graph, jobs: dict[int, JobInfo], schedules: dict[int, JobSchedule]):
+    def __init__(self, network: Graph, jobs: dict[int, JobInfo], schedules: dict[int, JobSchedule], solver: Optional[LPSolver] = None):
         self.network = network
         self.jobs = jobs
         self.schedules = schedules
 
+        # LP 求解后端（Gurobi / HiGHS），设置求解时间限制，减少计算开销
+        self.solver = solver if solver is not None else LPSolver(time_limit=2)
+
         self.link_traffic: dict[int, list[Traffic]] = {} # 链路上经过的流量模式 link_id -> list[Traffic]
+        # 负载的流量模式，隧道上各链路共享同一个 Traffic 对象 (job_id, workload_id) -> Traffic
+        self.workload_traffic: dict[tuple[int, int], Traffic] = {}
+        # 经过链路的负载 link_id -> list[(job_id, workload_id)]，隧道在调度过程中不变，只需建立一次
+        self.link_workloads: dict[int, list[tuple[int, int]]] = self.build_link_index()
         # 链路所有流量变化的时间点
         self.change_points: dict[int, set[int]] = {} # link_id -> set[int]
         # 链路峰值带宽
@@ -32,12 +115,30 @@ class NCFlow:
         # TE调整阈值，用于减少不必要的调整
         self.te_adjust_threshold = 0.1  # 只有当链路利用率变化超过阈值时才进行TE调整
 
+    def build_link_index(self) -> dict[int, list[tuple[int, int]]]:
+        link_workloads: dict[int, list[tuple[int, int]]] = {}
+        for job_id, job_schedule in self.schedules.items():
+            for workload_id, tunnel in enumerate(job_schedule.tunnels):
+                for link in tunnel:
+                    link_workloads.setdefault(link.link_id, []).append((job_id, workload_id))
+        return link_workloads
+
+    def allocated_bw(self, job_id: int, workload_id: int) -> float:
+        traffic = self.workload_traffic.get((job_id, workload_id))
+        return traffic.bw if traffic is not None else 0.0
+
     def update_traffic_pattern(self, job_id: int, workload_id: int, new_bw: float):
         """更新链路流量模式，确保不重复添加相同的流量模式"""
         if new_bw <= 0:
             print(f"警告: 尝试添加零带宽流量 job_id={job_id}, workload_id={workload_id}")
             return
 
+        # 已有流量记录时只更新带宽，隧道上各链路共享该记录
+        existing_traffic = self.workload_traffic.get((job_id, workload_id))
+        if existing_traffic is not None:
+            existing_traffic.bw = new_bw
+            return
+
         tunnel: Tunnel = self.schedules[job_id].tunnels[workload_id]
         t_s = self.jobs[job_id].workloads[workload_id].t_s
         t_e = self.jobs[job_id].workloads[workload_id].t_e
@@ -51,6 +152,7 @@ class NCFlow:
             t_e=t_e,
             bw=new_bw
         )
+        self.workload_traffic[(job_id, workload_id)] = traffic
         
         # 为隧道中的每条链路添加流量模式
         for link in tunnel:
@@ -62,30 +164,16 @@ class NCFlow:
             if link_id not in self.change_points:
                 self.change_points[link_id] = set()
                 
-            # 检查是否已经存在相同的流量模式
-            duplicate_found = False
-            for existing_traffic in self.link_traffic[link_id]:
-                if (existing_traffic.job_id == job_id and 
-                    existing_traffic.t_s == t_s and 
-                    existing_traffic.t_e == t_e):
-                    # 找到重复记录，更新带宽而不是添加新记录
-                    # print(f"更新现有流量记录: job_id={job_id}, link_id={link_id}, old_bw={existing_traffic.bw:.2f}, new_bw={new_bw:.2f}")
-                    existing_traffic.bw = new_bw
-                    duplicate_found = True
-                    break
+            self.link_traffic[link_id].append(traffic)
+            # print(f"添加新流量记录: job_id={job_id}, link_id={link_id}, bw={new_bw:.2f}")
             
-            # 如果没有找到重复记录，添加新的流量记录
-            if not duplicate_found:
-                self.link_traffic[link_id].append(traffic)
-                # print(f"添加新流量记录: job_id={job_id}, link_id={link_id}, bw={new_bw:.2f}")
+            # 添加新流量的变化时间点
+            for circle_offset in range(0, overlap_circle, cycle):
+                start = (t_s + circle_offset + self.schedules[job_id].start_time) % overlap_circle
+                end = (t_e + circle_offset + self.schedules[job_id].start_time) % overlap_circle
                 
-                # 添加新流量的变化时间点
-                for circle_offset in range(0, overlap_circle, cycle):
-                    start = (t_s + circle_offset + self.schedules[job_id].start_time) % overlap_circle
-                    end = (t_e + circle_offset + self.schedules[job_id].start_time) % overlap_circle
-                    
-                    self.change_points[link_id].add(start)
-                    self.change_points[link_id].add(end)
+                self.change_points[link_id].add(start)
+                self.change_points[link_id].add(end)
 
     def calculate_bottleneck_bw(self, tunnel: Tunnel, job_id: int, workload_id: int) -> float:
         
@@ -127,6 +215,7 @@ class NCFlow:
         """改进版的流量调度算法，增加动态调整和负载均衡"""
         total_flow = 0.0
         self.link_traffic = {}
+        self.workload_traffic = {}
         self.change_points = {}
         self.link_peak_bw = {}
         self.link_utilization = {}
@@ -143,21 +232,8 @@ class NCFlow:
         
         # 第一阶段：为高优先级任务分配资源
         for job_id, job in sorted_jobs:
-            # 创建 Gurobi 模型
-            model = Model("TrafficScheduler")
-            model.setParam('OutputFlag', 0)  # 关闭输出日志
-            model.setParam('TimeLimit', 2)   # 设置求解时间限制，减少计算开销
+            num_workloads = len(job.workloads)
 
-            # 添加变量：每个负载分配的流量大小
-            flow_vars = {}
-            for workload_id, workload in enumerate(job.workloads):
-                flow_vars[workload_id] = model.addVar(
-                    vtype=GRB.CONTINUOUS,
-                    name=f"flow_{workload_id}",
-                    lb=0.0,
-                    ub=float("inf")
-                )
-            
             # 获取所有相关链路
             relevant_links = set()
             for workload_id, workload in enumerate(job.workloads):
@@ -169,19 +245,21 @@ class NCFlow:
             link_balance_factors = {link_id: self.get_link_balance_factor(link_id) for link_id in relevant_links}
             
             # 构建目标函数：最大化总流量，同时考虑负载均衡
-            obj_expr = 0
+            obj_coefs = np.zeros(num_workloads)
             for workload_id, workload in enumerate(job.workloads):
                 # 基础流量目标
-                obj_expr += flow_vars[workload_id]
+                obj_coefs[workload_id] += 1.0
                 
                 # 考虑链路负载均衡的惩罚项
                 tunnel: Tunnel = self.schedules[job_id].tunnels[workload_id]
                 for link in tunnel:
                     balance_factor = link_balance_factors.get(link.link_id, 0.0)
                     # 负载不均衡的链路产生惩罚，减少其流量分配
-                    obj_expr -= 0.1 * balance_factor * flow_vars[workload_id] / len(tunnel)
-            
-            model.setObjective(obj_expr, GRB.MAXIMIZE)
+                    obj_coefs[workload_id] -= 0.1 * balance_factor / len(tunnel)
+
+            rows: list[np.ndarray] = []
+            coefs: list[np.ndarray] = []
+            rhs: list[float] = []
 
             # 链路容量约束与负载均衡
             for workload_id, workload in enumerate(job.workloads):
@@ -192,10 +270,9 @@ class NCFlow:
                 if bottleneck_bw < 0:
                     bottleneck_bw = 0
 
-                model.addConstr(
-                    flow_vars[workload_id] <= bottleneck_bw,
-                    name=f"link_capacity_{workload_id}"
-                )
+                rows.append(np.array([workload_id]))
+                coefs.append(np.ones(1))
+                rhs.append(bottleneck_bw)
             
             # 带宽需求约束
             for workload_id, workload in enumerate(job.workloads):
@@ -204,25 +281,29 @@ class NCFlow:
                 priority = self.job_priorities.get(job_id, 0.0)
                 adjusted_min_bw = workload.bw * min_guarantee * (1 + priority)
                 
-                # 添加最低保证带宽约束
-                model.addConstr(
-                    flow_vars[workload_id] >= min(adjusted_min_bw, workload.bw * 0.2), 
-                    name=f"min_guarantee_{workload_id}"
-                )
+                # 添加最低保证带宽约束：-flow <= -min_bw
+                rows.append(np.array([workload_id]))
+                coefs.append(-np.ones(1))
+                rhs.append(-min(adjusted_min_bw, workload.bw * 0.2))
                 
-                # 添加最大需求约束
-                model.addConstr(
-                    flow_vars[workload_id] <= workload.bw,
-                    name=f"bw_demand_{workload_id}"
-                )
+            # 最大需求约束作为变量上界
+            lp = build_lp(
+                c = obj_coefs,
+                rows = rows,
+                coefs = coefs,
+                b_ub = rhs,
+                lb = np.zeros(num_workloads),
+                ub = np.array([workload.bw for workload in job.workloads], dtype=float),
+                name = "TrafficScheduler"
+            )
 
             # 求解模型
-            model.optimize()
+            result = self.solver.solve(lp)
 
             # 检查是否找到可行解
-            if model.status in [GRB.OPTIMAL, GRB.SUBOPTIMAL, GRB.TIME_LIMIT, GRB.SOLUTION_LIMIT]:
+            if result.success:
                 for workload_id in range(len(job.workloads)):
-                    alloc_bw = flow_vars[workload_id].X
+                    alloc_bw = float(result.x[workload_id])
                     total_flow += alloc_bw
                     self.update_traffic_pattern(job_id, workload_id, alloc_bw)
             else:
@@ -236,8 +317,6 @@ class NCFlow:
                         total_flow += min_bw
                         self.update_traffic_pattern(job_id, workload_id, min_bw)
             
-            model.dispose()
-            
             # 在处理每个任务后更新瓶颈链路状态
             bottlenecks = self.get_bottleneck_links(0.9)
             if bottlenecks:
@@ -250,26 +329,22 @@ class NCFlow:
         if bottlenecks:
             for link_id in bottlenecks:
                 # 找出使用此链路的所有工作负载
-                affected_workloads = []
-                for job_id, job_schedule in self.schedules.items():
-                    for workload_id, tunnel in enumerate(job_schedule.tunnels):
-                        if any(link.link_id == link_id for link in tunnel):
-                            affected_workloads.append((job_id, workload_id))
+                affected_workloads = list(self.link_workloads.get(link_id, []))
                 
                 # 按优先级从低到高排序受影响的工作负载
                 affected_workloads.sort(key=lambda x: self.job_priorities.get(x[0], 0.0))
                 
                 # 尝试减少低优先级工作负载的带宽以缓解瓶颈
                 for job_id, workload_id in affected_workloads[:max(1, len(affected_workloads)//2)]:
-                    # 找到此工作负载在链路上的流量
-                    for traffic in self.link_traffic.get(link_id, []):
-                        if traffic.job_id == job_id:
-                            # 减少10%的带宽
-                            reduced_bw = traffic.bw * 0.9
-                            if reduced_bw > 0:
-                                # 更新流量，并调整总流量计数
-                                total_flow -= traffic.bw - reduced_bw
-                                traffic.bw = reduced_bw
+                    # 找到此工作负载的流量
+                    traffic = self.workload_traffic.get((job_id, workload_id))
+                    if traffic is not None:
+                        # 减少10%的带宽
+                        reduced_bw = traffic.bw * 0.9
+                        if reduced_bw > 0:
+                            # 更新流量，并调整总流量计数
+                            total_flow -= traffic.bw - reduced_bw
+                            traffic.bw = reduced_bw
 
         print("TE Total flow: ", total_flow)
         return total_flow
@@ -293,15 +368,7 @@ class NCFlow:
                 peak_bw = bw_now
                 
         # 查找链路容量
-        link_capacity = 0
-        # 从所有 edges 中找到对应 link_id 的链路
-        for src_node, links in self.network.edges.items():
-            for link in links:
-                if link.link_id == link_id:
-                    link_capacity = link.capacity
-                    break
-            if link_capacity > 0:
-                break
+        link_capacity = self.network.get_link(link_id).capacity if link_id < len(self.network.links) else 0
         
         # 如果找不到链路容量，使用默认值或探测网络中的最大链路容量
         if link_capacity <= 0:
@@ -381,6 +448,7 @@ class NCFlow:
         
         # 初始化数据结构
         self.link_traffic = {}
+        self.workload_traffic = {}
         self.change_points = {}
         self.link_peak_bw = {}
         self.link_utilization = {}
@@ -456,17 +524,7 @@ class NCFlow:
             workload = self.jobs[job_id].workloads[workload_id]
             
             # 计算已分配的带宽
-            allocated = 0
-            # 查找此工作负载的已分配带宽
-            for link_id, traffic_list in self.link_traffic.items():
-                for traffic in traffic_list:
-                    if (traffic.job_id == job_id and 
-                        traffic.t_s == workload.t_s and 
-                        traffic.t_e == workload.t_e):
-                        allocated = traffic.bw
-                        break
-                if allocated > 0:
-                    break
+            allocated = self.allocated_bw(job_id, workload_id)
             
             # 计算剩余需求
             remaining = max(0, workload.bw - allocated)
@@ -505,17 +563,7 @@ class NCFlow:
                         self.link_peak_bw[link_id] -= additional_bw
                 
                 # 查找此工作负载的现有流量记录
-                existing_traffic = None
-                for link_id, traffic_list in self.link_traffic.items():
-                    for traffic in traffic_list:
-                        if (traffic.job_id == job_id and 
-                            traffic.t_s == workload.t_s and 
-                            traffic.t_e == workload.t_e):
-                            # 找到现有流量记录
-                            existing_traffic = traffic
-                            break
-                    if existing_traffic:
-                        break
+                existing_traffic = self.workload_traffic.get((job_id, workload_id))
                 
                 if existing_traffic:
                     # 更新现有流量
@@ -531,4 +579,117 @@ class NCFlow:
             for workload in job.workloads:
                 total_workload_bw += workload.bw
 
-        return total_flow, total_workload_bw
\ No newline at end of file
+        return total_flow, total_workload_bw
+
+    def solve_subproblems(self, tasks: list[FlowSubproblem], workers: Optional[int] = None) -> list[tuple[np.ndarray, Optional[LPResult]]]:
+        if workers is None:
+            workers = min(len(tasks), os.cpu_count() or 1)
+        if workers <= 1 or len(tasks) <= 1:
+            return [solve_flow_subproblem(task) for task in tasks]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(solve_flow_subproblem, tasks))
+
+    def partitioned_schedule(self, workers: Optional[int] = None) -> tuple[float, float]:
+        """分区调度：先求解集群收缩后的跨集群问题，再并行求解各集群内子问题，最后在集群边界处对齐"""
+        self.link_traffic = {}
+        self.workload_traffic = {}
+        self.change_points = {}
+        self.link_peak_bw = {}
+        self.link_utilization = {}
+
+        # 两端属于同一集群的链路为集群内链路，其余（经过 CORE 的链路）为边界链路
+        cluster_of = cluster_topology(self.network)
+        link_cluster: dict[int, int] = {} # link_id -> cluster_id
+        for link in self.network.links:
+            cluster_id = cluster_of.get(link.src)
+            if cluster_id is not None and cluster_of.get(link.dst) == cluster_id:
+                link_cluster[link.link_id] = cluster_id
+
+        keys: list[tuple[int, int]] = [
+            (job_id, workload_id)
+            for job_id, job in self.jobs.items()
+            for workload_id in range(len(job.workloads))
+        ]
+        demand_bw = np.array([self.jobs[job_id].workloads[workload_id].bw for job_id, workload_id in keys], dtype=float)
+        windows: list[tuple[int, int, int, int]] = []
+        tunnels: list[tuple[int, ...]] = []
+        for job_id, workload_id in keys:
+            workload = self.jobs[job_id].workloads[workload_id]
+            windows.append((self.jobs[job_id].cycle, self.schedules[job_id].start_time, workload.t_s, workload.t_e))
+            tunnels.append(tuple(link.link_id for link in self.schedules[job_id].tunnels[workload_id]))
+        capacity = np.array([link.capacity for link in self.network.links], dtype=float)
+        backend = self.solver.backend
+
+        boundary_links = [tuple(link_id for link_id in tunnel if link_id not in link_cluster) for tunnel in tunnels]
+        clusters = [sorted({link_cluster[link_id] for link_id in tunnel if link_id in link_cluster}) for tunnel in tunnels]
+        inter = [index for index in range(len(keys)) if boundary_links[index] or len(clusters[index]) > 1]
+
+        # 第一步：收缩问题，每个集群收缩为一个节点，只对跨集群负载在边界链路上的容量建模
+        bound = demand_bw.copy()
+        if inter:
+            flows, result = solve_flow_subproblem(FlowSubproblem(
+                name = "NCFlowContracted",
+                windows = [windows[index] for index in inter],
+                tunnels = [boundary_links[index] for index in inter],
+                link_capacity = {link_id: capacity[link_id] for index in inter for link_id in boundary_links[index]},
+                ub = demand_bw[inter],
+                backend = backend,
+                time_limit = self.solver.time_limit
+            ))
+            if result is not None:
+                self.solver.record(result)
+            bound[inter] = flows
+
+        # 第二步：集群内子问题并行求解，跨集群负载在集群内的分配不超过收缩问题的结果
+        cluster_members: dict[int, list[int]] = {}
+        for index, workload_clusters in enumerate(clusters):
+            for cluster_id in workload_clusters:
+                cluster_members.setdefault(cluster_id, []).append(index)
+        tasks: list[FlowSubproblem] = []
+        for cluster_id, members in cluster_members.items():
+            cluster_tunnels = [tuple(link_id for link_id in tunnels[index] if link_cluster.get(link_id) == cluster_id) for index in members]
+            tasks.append(FlowSubproblem(
+                name = f"NCFlowCluster{cluster_id}",
+                windows = [windows[index] for index in members],
+                tunnels = cluster_tunnels,
+                link_capacity = {link_id: capacity[link_id] for tunnel in cluster_tunnels for link_id in tunnel},
+                ub = bound[members],
+                backend = backend,
+                time_limit = self.solver.time_limit
+            ))
+        results = self.solve_subproblems(tasks, workers)
+
+        # 第三步：边界对齐，跨集群负载取各集群分配的最小值，减少分配不会使任何链路超载
+        flows = bound.copy()
+        for members, (cluster_flows, result) in zip(cluster_members.values(), results):
+            if result is not None:
+                self.solver.record(result)
+            flows[members] = np.minimum(flows[members], cluster_flows)
+
+        # 第四步：对齐后释放的容量按紧急度顺序贪心补充
+        self.update_job_priorities()
+        order = sorted(
+            range(len(keys)),
+            key=lambda index: self.job_priorities.get(keys[index][0], 0.0) / max(1, windows[index][3] - windows[index][2]),
+            reverse=True
+        )
+        link_load = np.zeros((self.network.link_num, HORIZON))
+        epochs = [active_epochs(*window) for window in windows]
+        for index in range(len(keys)):
+            if flows[index] > 0:
+                link_load[np.ix_(tunnels[index], epochs[index])] += flows[index]
+        flows[order] += greedy_fill(
+            capacity,
+            [np.array(tunnels[index], dtype=int) for index in order],
+            [epochs[index] for index in order],
+            (demand_bw - flows)[order],
+            link_load
+        )
+
+        for index, (job_id, workload_id) in enumerate(keys):
+            if flows[index] > 0:
+                self.update_traffic_pattern(job_id, workload_id, float(flows[index]))
+        for link_id in range(self.network.link_num):
+            self.calculate_peak_bw(link_id)
+
+        return float(flows.sum()), float(demand_bw.sum())
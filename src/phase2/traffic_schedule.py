@@ -2,47 +2,105 @@ from network.graph import Graph
 from job.job_info import JobInfo
 from job.workload import Workload
 from phase1.admission_control import JobSchedule, Traffic, Tunnel
-from gurobipy import Model, GRB
+from network.timeline import active_mask, HORIZON
+from phase2.delta import WorkloadKey, WorkloadSignature, WorkloadDelta, workload_signatures, diff_workloads
+from phase2.bottleneck_cache import BottleneckCache
+from solver.lp_backend import LPSolver, LinearProgram, PersistentGurobiLP, build_lp
 from params import SCHEDULE_INTERVAL
+from typing import Optional
+import numpy as np
 
 # TODO: 这里为了方便直接设置成 SCHEDULE_INTERVAL，因为算出来的最小公倍数可能远远大于这个数。具体如何处理后续再考虑
 overlap_circle = SCHEDULE_INTERVAL
 
+def segment_capacity_rows(link_members: dict[int, list[int]], masks: np.ndarray, link_capacity: dict[int, float],
+                          demand_bw: np.ndarray, fixed_load: Optional[dict[int, np.ndarray]] = None) -> tuple[list[int], list[np.ndarray], list[float]]:
+    # masks 为 负载 × epoch 的活跃矩阵；返回每条约束所属链路、约束中的负载下标和右端项
+    row_links: list[int] = []
+    rows: list[np.ndarray] = []
+    rhs: list[float] = []
+    for link_id, members in link_members.items():
+        members = np.array(members)
+        # 逐 epoch 的活跃负载矩阵，相同活跃集合的时间段只需一条容量约束
+        segments, segment_index = np.unique(masks[members].T, axis=0, return_inverse=True)
+        segment_index = segment_index.reshape(-1)
+        if fixed_load is not None and link_id in fixed_load:
+            residual_bw = link_capacity[link_id] - fixed_load[link_id]
+        else:
+            residual_bw = np.full(HORIZON, link_capacity[link_id])
+        for index, segment in enumerate(segments):
+            active = members[segment]
+            # 同一活跃集合的所有 epoch 中，剩余容量最小的一个决定约束
+            segment_bw = max(0.0, float(residual_bw[segment_index == index].min()))
+            # 需求之和不超过剩余容量的时间段不会成为瓶颈，跳过
+            if demand_bw[active].sum() <= segment_bw:
+                continue
+            row_links.append(link_id)
+            rows.append(active)
+            rhs.append(segment_bw)
+
+    return row_links, rows, rhs
+
 class TrafficScheduler:
-    def __init__(self, network: Graph, jobs: dict[int, JobInfo], schedules: dict[int, JobSchedule]):
+    def __init__(self, network: Graph, jobs: dict[int, JobInfo], schedules: dict[int, JobSchedule], fast_path: bool = True, solver: Optional[LPSolver] = None, persistent: bool = False):
         self.network = network
         self.jobs = jobs
         self.schedules = schedules
 
+        # 每个约束只含一个变量时，用闭式解代替 LP 求解
+        self.fast_path = fast_path
+        # LP 求解后端（Gurobi / HiGHS）
+        self.solver = solver if solver is not None else LPSolver()
+        # 联合 LP 跨调度轮次保留同一个 Gurobi 模型，每轮只更新变化部分并热启动
+        self.persistent = persistent
+        self.persistent_model: Optional[PersistentGurobiLP] = None
+        self.persistent_rows: dict[int, set[tuple]] = {} # link_id -> 持久化模型中该链路的约束 key
+
         self.link_traffic: dict[int, list[Traffic]] = {} # 链路上经过的流量模式 link_id -> list[Traffic]
         # 链路所有流量变化的时间点
         self.change_points: dict[int, set[int]] = {} # link_id -> set[int]
         # 链路峰值带宽
         self.link_peak_bw: dict[int, float] = {} # link_id -> peak_bandwidth
+        # 链路版本号和瓶颈查询缓存
+        self.bottleneck_cache = BottleneckCache()
+
+        # 增量重调度状态：上一轮的分配结果、负载签名和链路负载时间线
+        self.allocation: dict[WorkloadKey, float] = {} # (job_id, workload_id) -> 分配带宽
+        self.workload_signatures: dict[WorkloadKey, WorkloadSignature] = {}
+        self.link_load: dict[int, np.ndarray] = {} # link_id -> 每个 epoch 的已分配带宽
+        self.link_workloads: dict[int, set[WorkloadKey]] = {} # link_id -> 经过该链路的负载
+        # 上一轮增量重调度的变化和重新分配的负载数
+        self.last_delta: Optional[WorkloadDelta] = None
+        self.last_affected = 0
 
     def update_traffic_pattern(self, job_id: int, workload_id: int, new_bw: float):
 
         tunnel: Tunnel = self.schedules[job_id].tunnels[workload_id]
         for link in tunnel:
-            if link.link_id not in self.link_traffic:
-                self.link_traffic[link.link_id] = []
-                self.change_points[link.link_id] = set()
-            self.link_traffic[link.link_id].append(
-                Traffic(
-                    job_id = job_id,
-                    cycle = self.jobs[job_id].cycle,
-                    t_s = self.jobs[job_id].workloads[workload_id].t_s,
-                    t_e = self.jobs[job_id].workloads[workload_id].t_e,
-                    bw = new_bw
-                )
+            self.add_link_traffic(link.link_id, job_id, workload_id, new_bw)
+
+    def add_link_traffic(self, link_id: int, job_id: int, workload_id: int, new_bw: float):
+
+        if link_id not in self.link_traffic:
+            self.link_traffic[link_id] = []
+            self.change_points[link_id] = set()
+        self.link_traffic[link_id].append(
+            Traffic(
+                job_id = job_id,
+                cycle = self.jobs[job_id].cycle,
+                t_s = self.jobs[job_id].workloads[workload_id].t_s,
+                t_e = self.jobs[job_id].workloads[workload_id].t_e,
+                bw = new_bw
             )
-            # 添加新流量的变化时间点
-            for circle_offset in range(0, overlap_circle, self.jobs[job_id].cycle):
-                start = (self.jobs[job_id].workloads[workload_id].t_s + circle_offset + self.schedules[job_id].start_time) % overlap_circle
-                end = (self.jobs[job_id].workloads[workload_id].t_e + circle_offset + self.schedules[job_id].start_time) % overlap_circle
-                            
-                self.change_points[link.link_id].add(start)
-                self.change_points[link.link_id].add(end)
+        )
+        # 添加新流量的变化时间点
+        for circle_offset in range(0, overlap_circle, self.jobs[job_id].cycle):
+            start = (self.jobs[job_id].workloads[workload_id].t_s + circle_offset + self.schedules[job_id].start_time) % overlap_circle
+            end = (self.jobs[job_id].workloads[workload_id].t_e + circle_offset + self.schedules[job_id].start_time) % overlap_circle
+                        
+            self.change_points[link_id].add(start)
+            self.change_points[link_id].add(end)
+        self.bottleneck_cache.bump(link_id)
 
     def calculate_bottleneck_bw(self, tunnel: Tunnel, job_id: int, workload_id: int) -> float:
         
@@ -54,23 +112,16 @@ class TrafficScheduler:
             t_s = (self.jobs[job_id].workloads[workload_id].t_s + self.schedules[job_id].start_time) % cycle
             t_e = (self.jobs[job_id].workloads[workload_id].t_e + self.schedules[job_id].start_time) % cycle
             
-            link_alloc_bw = 0.0
             if link.link_id not in self.link_traffic:
                 self.link_traffic[link.link_id] = []
                 self.change_points[link.link_id] = set()
 
-            # 在每个流量变化时间点计算总带宽
-            for time in sorted(list(self.change_points[link.link_id])):
-                if time % cycle >= t_s and time % cycle < t_e:
-                    # 计算当前时间点的带宽
-                    bw_now = 0.0
-                    for traffic in self.link_traffic[link.link_id]:
-                        traffic_job_id = traffic.job_id
-                        time_in_circle = (time + traffic.cycle - self.schedules[traffic_job_id].start_time) % traffic.cycle
-                        if time_in_circle >= traffic.t_s and time_in_circle < traffic.t_e:
-                            bw_now += traffic.bw
-                    if bw_now >= link_alloc_bw:
-                        link_alloc_bw = bw_now
+            # 链路流量未变化时直接使用缓存的窗口峰值
+            window = (cycle, t_s, t_e)
+            link_alloc_bw = self.bottleneck_cache.get(link.link_id, window)
+            if link_alloc_bw is None:
+                link_alloc_bw = self.window_alloc_bw(link.link_id, window)
+                self.bottleneck_cache.put(link.link_id, window, link_alloc_bw)
 
             # print("link_id: ", link.link_id, " link_capacity: ", link.capacity, " link_alloc_bw: ", link_alloc_bw)
             
@@ -80,77 +131,360 @@ class TrafficScheduler:
 
         return bottleneck_bw
 
+    def window_alloc_bw(self, link_id: int, window: tuple[int, int, int]) -> float:
+        cycle, t_s, t_e = window
+        link_alloc_bw = 0.0
+        # 在每个流量变化时间点计算总带宽
+        for time in sorted(list(self.change_points[link_id])):
+            if time % cycle >= t_s and time % cycle < t_e:
+                # 计算当前时间点的带宽
+                bw_now = 0.0
+                for traffic in self.link_traffic[link_id]:
+                    traffic_job_id = traffic.job_id
+                    time_in_circle = (time + traffic.cycle - self.schedules[traffic_job_id].start_time) % traffic.cycle
+                    if time_in_circle >= traffic.t_s and time_in_circle < traffic.t_e:
+                        bw_now += traffic.bw
+                if bw_now >= link_alloc_bw:
+                    link_alloc_bw = bw_now
+        return link_alloc_bw
+
+    def is_separable(self, job_id: int) -> bool:
+        # 每个负载只有一条隧道时，每个约束只含一个变量，模型可分离
+        # TODO: 后续输入多条隧道时，同一负载的多条流会耦合在需求约束中
+        return len(self.schedules[job_id].tunnels) == len(self.jobs[job_id].workloads)
+
+    def closed_form_alloc(self, job_id: int) -> np.ndarray:
+        # 可分离模型的最优解：flow = min(bw, max(0, bottleneck))
+        job = self.jobs[job_id]
+        bottleneck_bw = np.array([
+            self.calculate_bottleneck_bw(self.schedules[job_id].tunnels[workload_id], job_id, workload_id)
+            for workload_id in range(len(job.workloads))
+        ], dtype=float)
+        demand_bw = np.array([workload.bw for workload in job.workloads], dtype=float)
+        return np.minimum(demand_bw, np.maximum(0.0, bottleneck_bw))
+
+    def lp_alloc(self, job_id: int) -> np.ndarray:
+
+        job = self.jobs[job_id]
+        num_workloads = len(job.workloads)
+
+        # 变量：每个负载分配的流量大小
+        # TODO: 此时每个负载分配一条流，后续需要修改为多隧道
+        rows: list[np.ndarray] = []
+        coefs: list[np.ndarray] = []
+        rhs: list[float] = []
+
+        # 链路容量约束
+        # TODO: 为了简化，不考虑更新流之间的重叠（即每个约束只有一个变量）
+        # 可以通过减小数据集中更新的负载数来降低这个简化的负面效果，后续再修改
+        for workload_id, workload in enumerate(job.workloads):
+            tunnel: Tunnel = self.schedules[job_id].tunnels[workload_id]
+
+            # 计算瓶颈带宽
+            bottleneck_bw = self.calculate_bottleneck_bw(tunnel, job_id, workload_id)
+            if bottleneck_bw < 0:
+                bottleneck_bw = 0
+
+            rows.append(np.array([workload_id]))
+            coefs.append(np.ones(1))
+            rhs.append(bottleneck_bw)
+
+        # 带宽需求约束作为变量上界，目标函数：最大化总流量
+        lp: LinearProgram = build_lp(
+            c = np.ones(num_workloads),
+            rows = rows,
+            coefs = coefs,
+            b_ub = rhs,
+            lb = np.zeros(num_workloads),
+            ub = np.array([workload.bw for workload in job.workloads], dtype=float),
+            name = "TrafficScheduler"
+        )
+
+        # 求解模型
+        result = self.solver.solve(lp)
+        if not result.success:
+            raise ValueError(f"LP solver ({result.backend}) failed to find a feasible solution.")
+        return result.x
+
     def update_schedule(self) -> tuple[float, float]:
 
         total_flow = 0.0
         self.link_traffic = {}
         self.change_points = {}
         self.link_peak_bw = {}
+        self.bottleneck_cache.reset()
 
         total_workload_bw = 0.0
 
         for job_id, job in self.jobs.items():
 
-            # 创建 Gurobi 模型
-            model = Model("TrafficScheduler")
-            model.setParam('OutputFlag', 0)  # 关闭输出日志
-
-            # 添加变量：updated_workload 中每个负载分配的流量大小
-            # TODO: 此时每个负载分配一条流，后续需要修改为多隧道
-            flow_vars = {}
-            for workload_id, workload in enumerate(job.workloads):
-                flow_vars[workload_id] = model.addVar(
-                    vtype=GRB.CONTINUOUS,
-                    name=f"flow_{workload_id}",
-                    lb=0.0,
-                    ub=float("inf")
-                )
-                total_workload_bw += workload.bw
+            total_workload_bw += sum(workload.bw for workload in job.workloads)
 
-            # 设置目标函数：最大化总流量
-            model.setObjective(
-                sum(flow_vars[workload_id] for workload_id in range(len(job.workloads))),
-                GRB.MAXIMIZE
-            )
+            # 模型可分离时直接使用闭式解，跳过 Gurobi 建模
+            if self.fast_path and self.is_separable(job_id):
+                flows = self.closed_form_alloc(job_id)
+            else:
+                flows = self.lp_alloc(job_id)
 
-            # 链路容量约束
-            # TODO: 为了简化，不考虑更新流之间的重叠（即每个约束只有一个变量）
-            # 可以通过减小数据集中更新的负载数来降低这个简化的负面效果，后续再修改
-            for workload_id, workload in enumerate(job.workloads):
-                tunnel: Tunnel = self.schedules[job_id].tunnels[workload_id]
+            for workload_id in range(len(job.workloads)):
+                total_flow += float(flows[workload_id])
+                self.update_traffic_pattern(job_id, workload_id, float(flows[workload_id]))
 
-                # 计算瓶颈带宽
-                bottleneck_bw = self.calculate_bottleneck_bw(tunnel, job_id, workload_id)
-                if bottleneck_bw < 0:
-                    bottleneck_bw = 0
+        return total_flow, total_workload_bw
+    
+    def workload_mask(self, job_id: int, workload_id: int) -> np.ndarray:
+        workload = self.jobs[job_id].workloads[workload_id]
+        return active_mask(self.jobs[job_id].cycle, self.schedules[job_id].start_time, workload.t_s, workload.t_e)
 
-                model.addConstr(
-                    flow_vars[workload_id] <= bottleneck_bw,
-                    name=f"link_capacity_{workload_id}"
-                )
+    def build_joint_rows(self, keys: list[tuple[int, int]], demand_bw: np.ndarray,
+                         fixed_load: Optional[dict[int, np.ndarray]] = None) -> tuple[list[int], list[np.ndarray], list[float]]:
+        # fixed_load 非空时，只对 keys 中的负载建模，其余负载的分配作为链路上的固定负载
+        # 链路 -> 经过该链路的负载下标
+        link_members: dict[int, list[int]] = {}
+        link_capacity: dict[int, float] = {}
+        for index, (job_id, workload_id) in enumerate(keys):
+            for link in self.schedules[job_id].tunnels[workload_id]:
+                link_members.setdefault(link.link_id, []).append(index)
+                link_capacity[link.link_id] = link.capacity
 
-            # 带宽需求约束
-            for workload_id, workload in enumerate(job.workloads):
-                model.addConstr(
-                    flow_vars[workload_id] <= workload.bw,
-                    name=f"bw_demand_{workload_id}"
-                )
+        masks = np.stack([self.workload_mask(*key) for key in keys]) if keys else np.zeros((0, HORIZON), dtype=bool)
+        return segment_capacity_rows(link_members, masks, link_capacity, demand_bw, fixed_load)
+
+    def build_joint_lp(self, keys: list[tuple[int, int]], demand_bw: np.ndarray) -> LinearProgram:
+        _, rows, rhs = self.build_joint_rows(keys, demand_bw)
+        return build_lp(
+            c = np.ones(len(keys)),
+            rows = rows,
+            coefs = [np.ones(len(active)) for active in rows],
+            b_ub = rhs,
+            lb = np.zeros(len(keys)),
+            ub = demand_bw,
+            name = "JointTrafficScheduler"
+        )
+
+    def joint_schedule(self) -> tuple[float, float]:
+        # 对所有准入负载联合建模：每条链路在每个不同的负载时间段上有一条容量约束
+        # 同一轮更新的流之间的重叠被显式建模，分配结果与任务顺序无关
+        self.link_traffic = {}
+        self.change_points = {}
+        self.link_peak_bw = {}
+        self.bottleneck_cache.reset()
 
-            # 求解模型
-            model.optimize()
+        keys: list[tuple[int, int]] = [
+            (job_id, workload_id)
+            for job_id, job in self.jobs.items()
+            for workload_id in range(len(job.workloads))
+        ]
+        demand_bw = np.array([self.jobs[job_id].workloads[workload_id].bw for job_id, workload_id in keys], dtype=float)
+        total_workload_bw = float(demand_bw.sum())
 
-            # 检查是否找到可行解
-            if model.status in [GRB.OPTIMAL, GRB.SUBOPTIMAL, GRB.TIME_LIMIT, GRB.SOLUTION_LIMIT]:
-                for workload_id in range(len(job.workloads)):
-                    total_flow += flow_vars[workload_id].X
-                    self.update_traffic_pattern(job_id, workload_id, flow_vars[workload_id].X)
+        if self.persistent and self.solver.backend == "gurobi":
+            flows = self.persistent_solve(keys, demand_bw)
+        else:
+            lp = self.build_joint_lp(keys, demand_bw)
+
+            if lp.A_ub.shape[0] == 0:
+                # 没有可能超出容量的时间段，所有负载都满足需求
+                flows = demand_bw
             else:
-                raise ValueError("Gurobi failed to find a feasible solution.")
-            
-            model.dispose()
+                result = self.solver.solve(lp)
+                if not result.success:
+                    raise ValueError(f"LP solver ({result.backend}) failed to find a feasible solution.")
+                flows = result.x
+
+        total_flow = 0.0
+        for index, (job_id, workload_id) in enumerate(keys):
+            total_flow += float(flows[index])
+            self.update_traffic_pattern(job_id, workload_id, float(flows[index]))
+
+        self.record_allocation(keys, flows)
+        self.last_delta = None
+        self.last_affected = len(keys)
 
         return total_flow, total_workload_bw
-    
+
+    def record_allocation(self, keys: list[tuple[int, int]], flows: np.ndarray) -> None:
+        # 记录分配结果和链路负载时间线，作为下一轮增量重调度的基准
+        self.allocation = {}
+        self.link_load = {}
+        self.link_workloads = {}
+        self.workload_signatures = workload_signatures(self.jobs, self.schedules)
+        for index, key in enumerate(keys):
+            self.allocation[key] = float(flows[index])
+            self.add_load(key, self.workload_signatures[key], float(flows[index]))
+
+    def add_load(self, key: WorkloadKey, signature: WorkloadSignature, bw: float) -> None:
+        cycle, start_time, t_s, t_e, _, link_ids = signature
+        mask = active_mask(cycle, start_time, t_s, t_e)
+        for link_id in link_ids:
+            if link_id not in self.link_load:
+                self.link_load[link_id] = np.zeros(HORIZON)
+                self.link_workloads[link_id] = set()
+            self.link_load[link_id][mask] += bw
+            self.link_workloads[link_id].add(key)
+
+    def remove_load(self, key: WorkloadKey, signature: WorkloadSignature, bw: float) -> None:
+        cycle, start_time, t_s, t_e, _, link_ids = signature
+        mask = active_mask(cycle, start_time, t_s, t_e)
+        for link_id in link_ids:
+            self.link_load[link_id][mask] -= bw
+            self.link_workloads[link_id].discard(key)
+
+    def reschedule(self, jobs: dict[int, JobInfo], schedules: Optional[dict[int, JobSchedule]] = None) -> tuple[float, float]:
+        # 增量重调度：与上一轮对比，只重新分配与变化负载共享链路的负载，其余负载保持原分配
+        # 使用持久化 Gurobi 模型时，只把变化部分同步到模型并热启动求解
+        persistent = self.persistent and self.solver.backend == "gurobi"
+        if not self.workload_signatures or (persistent and self.persistent_model is None):
+            self.set_jobs(jobs, schedules)
+            return self.joint_schedule()
+
+        self.set_jobs(jobs, schedules)
+        new_signatures = workload_signatures(self.jobs, self.schedules)
+        delta = diff_workloads(self.workload_signatures, new_signatures)
+        if persistent:
+            return self.persistent_reschedule(new_signatures, delta)
+
+        # 受影响的负载：变化的负载，以及经过变化链路的所有负载
+        affected: set[WorkloadKey] = delta.added | delta.changed
+        for link_id in delta.touched_links:
+            affected |= self.link_workloads.get(link_id, set())
+
+        # 从链路负载时间线中移除受影响负载和已删除负载的旧分配
+        for key in affected | delta.removed:
+            if key in self.allocation:
+                self.remove_load(key, self.workload_signatures[key], self.allocation.pop(key))
+
+        keys = [key for key in new_signatures if key in affected]
+        demand_bw = np.array([new_signatures[key][4] for key in keys], dtype=float)
+
+        flows = demand_bw
+        if keys:
+            _, rows, rhs = self.build_joint_rows(keys, demand_bw, fixed_load=self.link_load)
+            if rows:
+                lp = build_lp(
+                    c = np.ones(len(keys)),
+                    rows = rows,
+                    coefs = [np.ones(len(active)) for active in rows],
+                    b_ub = rhs,
+                    lb = np.zeros(len(keys)),
+                    ub = demand_bw,
+                    name = "DeltaTrafficScheduler"
+                )
+                result = self.solver.solve(lp)
+                if not result.success:
+                    raise ValueError(f"LP solver ({result.backend}) failed to find a feasible solution.")
+                flows = result.x
+
+        rebuild_links: set[int] = set(delta.touched_links)
+        for index, key in enumerate(keys):
+            self.allocation[key] = float(flows[index])
+            self.add_load(key, new_signatures[key], float(flows[index]))
+            rebuild_links.update(new_signatures[key][5])
+        self.workload_signatures = new_signatures
+
+        self.rebuild_traffic(rebuild_links)
+        self.last_delta = delta
+        self.last_affected = len(keys)
+
+        total_flow = sum(self.allocation.values())
+        total_workload_bw = sum(signature[4] for signature in new_signatures.values())
+        return total_flow, total_workload_bw
+
+    def rebuild_traffic(self, link_ids: set[int]) -> None:
+        # 只重建受影响链路的流量模式
+        for link_id in link_ids:
+            self.link_traffic[link_id] = []
+            self.change_points[link_id] = set()
+            self.bottleneck_cache.bump(link_id)
+            for job_id, workload_id in self.link_workloads.get(link_id, set()):
+                self.add_link_traffic(link_id, job_id, workload_id, self.allocation[(job_id, workload_id)])
+
+    def persistent_rows_of(self, row_links: list[int], rows: list[np.ndarray], rhs: list[float],
+                           keys: list[WorkloadKey]) -> dict[tuple, tuple[tuple, tuple, float]]:
+        # 约束以 (链路, 活跃负载集合) 为键，成员按负载键排序，与建模时的负载顺序无关
+        persistent_rows: dict[tuple, tuple[tuple, tuple, float]] = {}
+        for link_id, active, capacity in zip(row_links, rows, rhs):
+            members = tuple(sorted(keys[index] for index in active))
+            persistent_rows[(link_id, members)] = (members, (1.0,) * len(members), capacity)
+            self.persistent_rows.setdefault(link_id, set()).add((link_id, members))
+        return persistent_rows
+
+    def persistent_solve(self, keys: list[tuple[int, int]], demand_bw: np.ndarray) -> np.ndarray:
+        # 跨轮次不变的约束保留在模型中
+        row_links, rows, rhs = self.build_joint_rows(keys, demand_bw)
+        self.persistent_rows = {}
+        persistent_rows = self.persistent_rows_of(row_links, rows, rhs, keys)
+
+        if self.persistent_model is None:
+            self.persistent_model = PersistentGurobiLP("JointTrafficScheduler", self.solver.time_limit)
+
+        result = self.persistent_model.solve(keys, np.ones(len(keys)), np.zeros(len(keys)), demand_bw, persistent_rows)
+        self.solver.record(result)
+        if not result.success:
+            raise ValueError(f"LP solver ({result.backend}) failed to find a feasible solution.")
+        return result.x
+
+    def persistent_reschedule(self, new_signatures: dict[WorkloadKey, WorkloadSignature], delta: WorkloadDelta) -> tuple[float, float]:
+        # 持久化模型的增量重调度：只修改变化负载的变量，只重建 delta.touched_links 上的约束，模型其余部分不遍历
+        # 全局 LP 热启动求解后其他负载的分配也可能变化，只重建分配变化的负载经过的链路的流量模式
+        for key in delta.removed | delta.changed:
+            self.remove_load(key, self.workload_signatures[key], self.allocation.pop(key))
+        # 新增和变化的负载先以 0 带宽登记到链路上，求解后再加上分配结果
+        for key in delta.added | delta.changed:
+            self.allocation[key] = 0.0
+            self.add_load(key, new_signatures[key], 0.0)
+        self.workload_signatures = new_signatures
+
+        # 受影响链路上的所有负载重新划分时间段
+        link_members: dict[int, list[int]] = {}
+        link_capacity: dict[int, float] = {}
+        row_keys = sorted({key for link_id in delta.touched_links for key in self.link_workloads.get(link_id, ())})
+        row_index = {key: index for index, key in enumerate(row_keys)}
+        for link_id in delta.touched_links:
+            if self.link_workloads.get(link_id):
+                link_members[link_id] = [row_index[key] for key in self.link_workloads[link_id]]
+                link_capacity[link_id] = self.network.get_link(link_id).capacity
+        masks = np.stack([active_mask(*new_signatures[key][:4]) for key in row_keys]) if row_keys else np.zeros((0, HORIZON), dtype=bool)
+        demand_bw = np.array([new_signatures[key][4] for key in row_keys], dtype=float)
+        row_links, rows, rhs = segment_capacity_rows(link_members, masks, link_capacity, demand_bw)
+        removed_rows: set[tuple] = set()
+        for link_id in delta.touched_links:
+            removed_rows |= self.persistent_rows.pop(link_id, set())
+        persistent_rows = self.persistent_rows_of(row_links, rows, rhs, row_keys)
+        removed_rows -= persistent_rows.keys()
+
+        keys = list(new_signatures)
+        bounds = {key: (0.0, new_signatures[key][4], 1.0) for key in delta.added | delta.changed}
+        result = self.persistent_model.solve_delta(keys, bounds, delta.removed, persistent_rows, removed_rows)
+        self.solver.record(result)
+        if not result.success:
+            raise ValueError(f"LP solver ({result.backend}) failed to find a feasible solution.")
+
+        rebuild_links: set[int] = set(delta.touched_links)
+        reallocated = 0
+        for index, key in enumerate(keys):
+            flow = float(result.x[index])
+            if flow != self.allocation[key]:
+                self.add_load(key, new_signatures[key], flow - self.allocation[key])
+                self.allocation[key] = flow
+                rebuild_links.update(new_signatures[key][5])
+                reallocated += 1
+        self.rebuild_traffic(rebuild_links)
+        self.last_delta = delta
+        self.last_affected = reallocated
+
+        total_flow = sum(self.allocation.values())
+        total_workload_bw = sum(signature[4] for signature in new_signatures.values())
+        return total_flow, total_workload_bw
+
+    def set_jobs(self, jobs: dict[int, JobInfo], schedules: Optional[dict[int, JobSchedule]] = None) -> None:
+        # 进入新的调度轮次：替换任务集合，保留持久化模型
+        self.jobs = jobs
+        if schedules is not None:
+            # 启动时间可能变化，缓存的窗口峰值全部失效
+            self.schedules = schedules
+            self.bottleneck_cache.reset()
+
     def calculate_peak_bw(self, link_id: int) -> float:
         if link_id not in self.change_points:
             return 0.0  
@@ -0,0 +1,318 @@
+from dataclasses import dataclass
+from typing import Optional, Hashable, Iterable
+import numpy as np
+import time
+from scipy.sparse import csr_matrix
+from scipy.optimize import linprog
+
+# 可选的求解后端
+BACKENDS = ["auto", "gurobi", "highs"]
+
+# 求解状态中可以读取解的状态
+SOLVED_STATUS = ["optimal", "suboptimal", "time_limit"]
+
+@dataclass
+class LinearProgram:
+    # max/min c^T x, s.t. A_ub x <= b_ub, lb <= x <= ub
+    c: np.ndarray
+    A_ub: csr_matrix
+    b_ub: np.ndarray
+    lb: np.ndarray
+    ub: np.ndarray
+    maximize: bool = True
+    name: str = "LinearProgram"
+
+    @property
+    def num_vars(self) -> int:
+        return len(self.c)
+
+@dataclass
+class LPResult:
+    status: str # optimal / suboptimal / time_limit / infeasible / unbounded / error
+    x: Optional[np.ndarray]
+    objective: float
+    backend: str
+    build_time: float # 后端建模时间（s）
+    solve_time: float # 后端求解时间（s）
+
+    @property
+    def success(self) -> bool:
+        return self.status in SOLVED_STATUS and self.x is not None
+
+@dataclass
+class BackendStats:
+    models: int = 0
+    build_time: float = 0.0 # (s)
+    solve_time: float = 0.0 # (s)
+
+def build_lp(c: np.ndarray, rows: list[np.ndarray], coefs: list[np.ndarray], b_ub: list[float],
+             lb: np.ndarray, ub: np.ndarray, maximize: bool = True, name: str = "LinearProgram") -> LinearProgram:
+    # 由稀疏行（变量下标、系数）一次性构建约束矩阵
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    if rows:
+        indptr[1:] = np.cumsum([len(row) for row in rows])
+        indices = np.concatenate(rows).astype(np.int64)
+        data = np.concatenate(coefs).astype(float)
+    else:
+        indices = np.zeros(0, dtype=np.int64)
+        data = np.zeros(0, dtype=float)
+    A_ub = csr_matrix((data, indices, indptr), shape=(len(rows), len(c)))
+    return LinearProgram(
+        c = np.asarray(c, dtype=float),
+        A_ub = A_ub,
+        b_ub = np.asarray(b_ub, dtype=float),
+        lb = np.asarray(lb, dtype=float),
+        ub = np.asarray(ub, dtype=float),
+        maximize = maximize,
+        name = name
+    )
+
+_gurobi_available: Optional[bool] = None
+
+def gurobi_available() -> bool:
+    # 检查 gurobipy 是否安装且有可用许可（只检查一次）
+    global _gurobi_available
+    if _gurobi_available is None:
+        try:
+            import gurobipy as gp
+            model = gp.Model()
+            model.dispose()
+            _gurobi_available = True
+        except Exception:
+            _gurobi_available = False
+    return _gurobi_available
+
+def gurobi_status(model_status: int) -> str:
+    from gurobipy import GRB
+
+    if model_status == GRB.OPTIMAL:
+        return "optimal"
+    elif model_status == GRB.SUBOPTIMAL:
+        return "suboptimal"
+    elif model_status in [GRB.TIME_LIMIT, GRB.SOLUTION_LIMIT]:
+        return "time_limit"
+    elif model_status in [GRB.INFEASIBLE, GRB.INF_OR_UNBD]:
+        return "infeasible"
+    elif model_status == GRB.UNBOUNDED:
+        return "unbounded"
+    return "error"
+
+class LPSolver:
+
+    def __init__(self, backend: str = "auto", time_limit: Optional[float] = None):
+
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown LP backend: {backend}")
+        # auto：有 Gurobi 许可时使用 Gurobi，否则使用 SciPy 自带的 HiGHS
+        if backend == "auto":
+            backend = "gurobi" if gurobi_available() else "highs"
+        self.backend = backend
+        self.time_limit = time_limit # 单个模型的求解时间限制（s）
+
+        # 各后端的建模与求解耗时统计
+        self.stats: dict[str, BackendStats] = {}
+
+    def solve(self, lp: LinearProgram) -> LPResult:
+        if self.backend == "gurobi":
+            result = self.solve_gurobi(lp)
+        else:
+            result = self.solve_highs(lp)
+
+        self.record(result)
+        return result
+
+    def record(self, result: LPResult) -> None:
+        stats = self.stats.setdefault(result.backend, BackendStats())
+        stats.models += 1
+        stats.build_time += result.build_time
+        stats.solve_time += result.solve_time
+
+    def solve_gurobi(self, lp: LinearProgram) -> LPResult:
+        import gurobipy as gp
+        from gurobipy import GRB
+
+        build_start = time.time()
+        model = gp.Model(lp.name)
+        model.setParam('OutputFlag', 0)  # 关闭输出日志
+        if self.time_limit is not None:
+            model.setParam('TimeLimit', self.time_limit)
+        x = model.addMVar(lp.num_vars, lb=lp.lb, ub=lp.ub, vtype=GRB.CONTINUOUS, name="x")
+        model.setObjective(lp.c @ x, GRB.MAXIMIZE if lp.maximize else GRB.MINIMIZE)
+        if lp.A_ub.shape[0] > 0:
+            model.addMConstr(lp.A_ub, x, GRB.LESS_EQUAL, lp.b_ub, name="c")
+        model.update()
+        build_time = time.time() - build_start
+
+        solve_start = time.time()
+        model.optimize()
+        solve_time = time.time() - solve_start
+
+        status = gurobi_status(model.status)
+
+        solution = None
+        objective = 0.0
+        if status in SOLVED_STATUS and model.SolCount > 0:
+            solution = np.array(x.X, dtype=float)
+            objective = float(model.ObjVal)
+        model.dispose()
+
+        return LPResult(status, solution, objective, "gurobi", build_time, solve_time)
+
+    def solve_highs(self, lp: LinearProgram) -> LPResult:
+
+        build_start = time.time()
+        c = -lp.c if lp.maximize else lp.c
+        bounds = np.column_stack([lp.lb, lp.ub])
+        A_ub = lp.A_ub if lp.A_ub.shape[0] > 0 else None
+        b_ub = lp.b_ub if lp.A_ub.shape[0] > 0 else None
+        options = {}
+        if self.time_limit is not None:
+            options['time_limit'] = self.time_limit
+        build_time = time.time() - build_start
+
+        solve_start = time.time()
+        res = linprog(c, A_ub=A_ub, b_ub=b_ub, bounds=bounds, method="highs", options=options)
+        solve_time = time.time() - solve_start
+
+        # linprog 状态：0 最优，1 达到迭代/时间限制，2 不可行，3 无界，4 数值问题
+        status = {0: "optimal", 1: "time_limit", 2: "infeasible", 3: "unbounded"}.get(res.status, "error")
+
+        solution = None
+        objective = 0.0
+        if status in SOLVED_STATUS and res.x is not None:
+            solution = np.array(res.x, dtype=float)
+            objective = float(lp.c @ solution)
+
+        return LPResult(status, solution, objective, "highs", build_time, solve_time)
+
+    def report(self) -> str:
+        lines = []
+        for backend, stats in self.stats.items():
+            lines.append(
+                f"{backend}: models = {stats.models}, "
+                f"build = {stats.build_time * 1000:.2f} ms, solve = {stats.solve_time * 1000:.2f} ms"
+            )
+        return "\n".join(lines)
+
+class PersistentGurobiLP:
+    # 跨调度轮次保留的 Gurobi 模型：变量和约束按键索引，每轮只修改变化的上下界、系数和约束，
+    # 重新求解时 Gurobi 从上一轮的基出发（热启动）
+
+    def __init__(self, name: str = "PersistentLP", time_limit: Optional[float] = None):
+        import gurobipy as gp
+
+        self.model = gp.Model(name)
+        self.model.setParam('OutputFlag', 0)  # 关闭输出日志
+        if time_limit is not None:
+            self.model.setParam('TimeLimit', time_limit)
+        self.model.ModelSense = -1 # 最大化
+
+        # 变量：key -> (Var, (lb, ub, obj))
+        self.vars: dict[Hashable, tuple] = {}
+        # 约束：key -> (Constr, members, coefs, rhs)
+        self.constrs: dict[Hashable, tuple] = {}
+
+        # 上一轮修改的变量/约束数量
+        self.last_changes = 0
+
+    def sync(self, var_keys: list[Hashable], c: np.ndarray, lb: np.ndarray, ub: np.ndarray,
+             rows: dict[Hashable, tuple[tuple, tuple, float]]) -> int:
+        # 全量同步：rows 为约束 key -> (变量 key 元组, 系数元组, 右端项)，模型中其余的变量和约束删除
+        var_set = set(var_keys)
+        removed_rows = [key for key, (_, members, _, _) in self.constrs.items() if key not in rows or rows[key][0] != members]
+        removed_vars = [key for key in self.vars if key not in var_set]
+        bounds = {key: (float(lb[index]), float(ub[index]), float(c[index])) for index, key in enumerate(var_keys)}
+        return self.update(bounds, removed_vars, rows, removed_rows)
+
+    def update(self, bounds: dict[Hashable, tuple[float, float, float]], removed_vars: Iterable[Hashable],
+               rows: dict[Hashable, tuple[tuple, tuple, float]], removed_rows: Iterable[Hashable]) -> int:
+        # 增量同步：只删除、新增或修改给定的变量和约束，模型中其余部分不遍历
+        # bounds: 变量 key -> (lb, ub, obj)
+        import gurobipy as gp
+        from gurobipy import GRB
+
+        changes = 0
+
+        # 删除约束（成员发生变化的约束以新的 key 重新加入）
+        for key in removed_rows:
+            if key in self.constrs:
+                self.model.remove(self.constrs.pop(key)[0])
+                changes += 1
+
+        # 删除变量
+        for key in removed_vars:
+            if key in self.vars:
+                self.model.remove(self.vars.pop(key)[0])
+                changes += 1
+
+        # 新增变量，或只更新变化的上下界和目标系数
+        for key, bound in bounds.items():
+            if key not in self.vars:
+                var = self.model.addVar(lb=bound[0], ub=bound[1], obj=bound[2], vtype=GRB.CONTINUOUS)
+                self.vars[key] = (var, bound)
+                changes += 1
+                continue
+            var, old_bound = self.vars[key]
+            if old_bound != bound:
+                var.LB, var.UB, var.Obj = bound
+                self.vars[key] = (var, bound)
+                changes += 1
+        self.model.update()
+
+        # 新增约束，或只更新变化的系数和右端项
+        for key, (members, coefs, rhs) in rows.items():
+            if key not in self.constrs:
+                expr = gp.LinExpr(list(coefs), [self.vars[member][0] for member in members])
+                constr = self.model.addLConstr(expr, GRB.LESS_EQUAL, rhs)
+                self.constrs[key] = (constr, members, coefs, rhs)
+                changes += 1
+                continue
+            constr, old_members, old_coefs, old_rhs = self.constrs[key]
+            if old_coefs != coefs:
+                for member, coef, old_coef in zip(members, coefs, old_coefs):
+                    if coef != old_coef:
+                        self.model.chgCoeff(constr, self.vars[member][0], coef)
+                changes += 1
+            if old_rhs != rhs:
+                constr.RHS = rhs
+                changes += 1
+            self.constrs[key] = (constr, members, coefs, rhs)
+
+        self.last_changes = changes
+        return changes
+
+    def solve(self, var_keys: list[Hashable], c: np.ndarray, lb: np.ndarray, ub: np.ndarray,
+              rows: dict[Hashable, tuple[tuple, tuple, float]]) -> LPResult:
+
+        build_start = time.time()
+        self.sync(var_keys, c, lb, ub, rows)
+        self.model.update()
+        return self.optimize(var_keys, time.time() - build_start)
+
+    def solve_delta(self, var_keys: list[Hashable], bounds: dict[Hashable, tuple[float, float, float]],
+                    removed_vars: Iterable[Hashable], rows: dict[Hashable, tuple[tuple, tuple, float]],
+                    removed_rows: Iterable[Hashable]) -> LPResult:
+        # 只应用调用方给出的变化后求解，var_keys 为返回解的变量顺序
+        build_start = time.time()
+        self.update(bounds, removed_vars, rows, removed_rows)
+        self.model.update()
+        return self.optimize(var_keys, time.time() - build_start)
+
+    def optimize(self, var_keys: list[Hashable], build_time: float) -> LPResult:
+        solve_start = time.time()
+        self.model.optimize()
+        solve_time = time.time() - solve_start
+
+        status = gurobi_status(self.model.status)
+        solution = None
+        objective = 0.0
+        if status in SOLVED_STATUS and self.model.SolCount > 0:
+            solution = np.array(self.model.getAttr("X", [self.vars[key][0] for key in var_keys]), dtype=float)
+            objective = float(self.model.ObjVal)
+
+        return LPResult(status, solution, objective, "gurobi", build_time, solve_time)
+
+    def dispose(self) -> None:
+        self.model.dispose()
+        self.vars = {}
+        self.constrs = {}
@@ -1,28 +1,32 @@
-import json
 import os
 import pandas as pd
 import time
 import argparse  # 添加 argparse 模块
+from typing import Optional
 
 # 将父目录（即 src）添加到包导入搜索路径中
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from network.graph import Graph, Link
+from network.graph import Graph
 from phase1.admission_control import AdmissionController, JobSchedule
+from phase1.schedule_io import save_job_schedules, load_job_schedules
 from phase1.aequitas import Aequitas
 from phase1.seawall import Seawall
+from phase1.start_time_optimizer import StartTimeOptimizer, OptimizeResult
 from phase2.traffic_schedule import TrafficScheduler
 from phase2.greedy import Greedy
 from phase2.ncflow import NCFlow
 from phase2.igr import IGR
-from job.job_info import JobInfo, EPOCH
-from job.workload import Workload
+from job.job_info import JobInfo
+from job.job_io import load_jobs
 from workload_fluctuate import random_fluctuate
 from params import SCHEDULE_INTERVAL
 from baseline.admission_control_bl import FCFS
+from solver.lp_backend import LPSolver, BackendStats, BACKENDS
 
 measure_runtime: list[int] = []
+schedule_runtime: list[int] = []
 
 # Phase 1
 admit_rate: list[float] = []
@@ -41,32 +45,42 @@ TRAFFIC_SCHEDULE_RESULT_FILE = 'result/traffic_schedule_result.txt'
 # 网络拓扑
 network: Graph = None
 
-def run_admission_control(jobs_file: str, scenario: str, strategy: str) -> None:
+# LP 求解后端及各后端的建模、求解耗时
+lp_backend: str = "auto"
+solver_stats: dict[str, BackendStats] = {}
+# 并行求解使用的进程数（NCFlow-P 的集群子问题、IGR 的流量组配置减少）
+# 为空时 NCFlow-P 按 CPU 核数并行，IGR 串行
+workers: Optional[int] = None
+
+# 局部调整的时间预算（秒），为空时不限制
+adjust_budget: Optional[float] = None
+
+# 两次准入之间全局启动时间优化的时间上限（秒），为空时不优化
+optimize_budget: Optional[float] = None
+
+# 是否缓存被拒绝任务的准入决策
+decision_cache: bool = False
+
+# 是否开启抢占准入（Ours），任务优先级按总带宽确定，带宽越小优先级越高
+preempt: bool = False
+
+# 是否将 Phase 1 调度结果保存到 result/<testcase>/phase1_job_schedules.txt
+save_schedules: bool = False
+
+def schedule_file(jobs_file: str) -> str:
+    testcase_name = os.path.splitext(os.path.basename(jobs_file))[0]
+    return os.path.join("result", testcase_name, "phase1_job_schedules.txt")
+
+def run_admission_control(jobs_file: str, scenario: str, strategy: str) -> tuple[list[JobInfo], dict[int, JobSchedule]]:
     
     # 加载任务
-    with open(jobs_file, 'r') as f:
-        jobs_data = json.load(f)
-    jobs: list[JobInfo] = []
-    for job in jobs_data:
-        job_id = job['job_id']
-        cycle = (job['cycle(ms)'] + EPOCH - 1) // EPOCH # 向上取整
-        workloads = []
-        for workload in job['workloads']:
-            src = workload['src_rank']
-            dst = workload['dst_rank']
-            t_s = workload['start_timestamp(ms)'] // EPOCH # 向下取整
-            t_e = (workload['end_timestamp(ms)'] + EPOCH - 1) // EPOCH # 向上取整
-            bw = workload['bandwidth(Gbps)']
-            workload = Workload(src, dst, t_s, t_e, bw)
-            workloads.append(workload)
-        job_info = JobInfo(job_id, cycle, workloads)
-        jobs.append(job_info)
+    jobs = load_jobs(jobs_file)
 
     print(f"Admission Control {jobs_file}: {scenario} {strategy}")
     start_time = time.time()
 
     # 输出：a_j = {0, 1}，任务 j 是否准入
-    a = [0] * len(jobs_data)
+    a = [0] * len(jobs)
 
     if scenario == "FCFS":
         None
@@ -75,18 +89,46 @@ def run_admission_control(jobs_file: str, scenario: str, strategy: str) -> None:
 
     # 准入策略
     if strategy == "Ours":
-        admission_controller = AdmissionController(network)
+        admission_controller = AdmissionController(network, preemption=preempt, adjust_budget=adjust_budget,
+                                                   decision_cache=decision_cache)
         adjust_time = 0 # 局部调整次数
+        optimizer = StartTimeOptimizer(admission_controller, optimize_budget) if optimize_budget is not None else None
+        optimize_results: list[OptimizeResult] = []
         
         for job_id, job in enumerate(jobs):
-            # Step 1：直接部署
-            a[job_id] = admission_controller.direct_deploy(job)
-            # Step 2: 局部调整
-            if a[job_id] == 0:
-                a[job_id] = admission_controller.local_adjust(job)
-                adjust_time += 1
+            priority = sum(w.bw for w in job.workloads)
+            # 相同签名的任务在链路未变化时直接使用缓存的拒绝结果
+            cached = admission_controller.lookup_decision(job, priority)
+            if cached is not None:
+                a[job_id] = cached
+            else:
+                # Step 1：直接部署
+                a[job_id] = admission_controller.direct_deploy(job, priority=priority)
+                # Step 2: 局部调整
+                if a[job_id] == 0:
+                    a[job_id] = admission_controller.local_adjust(job)
+                    adjust_time += 1
+                # Step 3: 抢占准入
+                if a[job_id] == 0 and preempt:
+                    a[job_id] = admission_controller.preempt_deploy(job)
+                admission_controller.record_decision(job, a[job_id])
             print(f"{job_id}/{len(jobs)} admit = {a[job_id]}")
+            # 两次准入之间优化已准入任务的启动时间
+            if optimizer is not None:
+                optimize_results.append(optimizer.optimize())
         
+        print(admission_controller.adjust_stats.report())
+        if decision_cache:
+            print(admission_controller.decision_cache_stats.report())
+        if optimize_results:
+            print(f"Start time optimizer: moves = {sum(result.moves for result in optimize_results)}, "
+                  f"commits = {sum(result.committed for result in optimize_results)}, "
+                  f"time = {sum(result.time for result in optimize_results) * 1000:.2f} ms, "
+                  f"final peak utilization = {optimize_results[-1].final:.4f}")
+        if preempt:
+            # 被驱逐的任务不再计入准入
+            a = [admission_controller.job_schedules[job.job_id].admit for job in jobs]
+            print(admission_controller.preemption_stats.report())
         adjust_rate.append(adjust_time/len(jobs))
 
         os.makedirs(os.path.dirname(ADMISSION_RESULT_FILE), exist_ok=True)
@@ -111,8 +153,9 @@ def run_admission_control(jobs_file: str, scenario: str, strategy: str) -> None:
                         admission_controller.link_peak_bw[link.link_id] = 0.0
                     f.write(f"{admission_controller.link_peak_bw[link.link_id] / link.capacity}\n")
 
-    elif strategy == "Aequitas":
-        admission_controller = Aequitas(network)
+    elif strategy in ("Aequitas", "Aequitas-C"):
+        # Aequitas-C：按优先级分层计算剩余带宽
+        admission_controller = Aequitas(network, class_aware=(strategy == "Aequitas-C"))
         a = admission_controller.deploy(jobs)
 
         os.makedirs(os.path.dirname(ADMISSION_RESULT_FILE), exist_ok=True)
@@ -147,69 +190,29 @@ def run_admission_control(jobs_file: str, scenario: str, strategy: str) -> None:
     # 保留小数点后 4 位
     admit_rate.append(sum(a) / len(jobs))
 
-    # 生成每个测例的调度结果目录
-    # testcase_name = os.path.splitext(os.path.basename(jobs_file))[0]
-    # result_dir = os.path.join("result", testcase_name)
-    # os.makedirs(result_dir, exist_ok=True)
-    # 保存调度结果
-    # with open(result_dir + '/phase1_job_schedules.txt', 'w') as f:
-    #     f.write(json.dumps(admission_controller.job_schedules, default=lambda x: x.__dict__, indent=4))
+    # 保存调度结果（紧凑格式，隧道只保存链路编号）
+    if save_schedules:
+        os.makedirs(os.path.dirname(schedule_file(jobs_file)), exist_ok=True)
+        save_job_schedules(schedule_file(jobs_file), admission_controller.job_schedules)
 
     # 保存所有测例的准入结果到文件
     # os.makedirs(os.path.dirname(ADMISSION_RESULT_FILE), exist_ok=True)
     # with open(ADMISSION_RESULT_FILE, 'a') as f:
-    #     f.write(f"{os.path.basename(jobs_file)}: {sum(a)} / {len(jobs_data)} = {sum(a) / len(jobs_data):.2f}\n")
+    #     f.write(f"{os.path.basename(jobs_file)}: {sum(a)} / {len(jobs)} = {sum(a) / len(jobs):.2f}\n")
 
-def run_traffic_schedule(jobs_file: str, strategy: str) -> None:
+    return jobs, admission_controller.job_schedules
 
-    # 加载任务
-    with open(jobs_file, 'r') as f:
-        jobs_data = json.load(f)
-    jobs: list[JobInfo] = []
-    for job in jobs_data:
-        job_id = job['job_id']
-        cycle = (job['cycle(ms)'] + EPOCH - 1) // EPOCH # 向上取整
-        workloads = []
-        for workload in job['workloads']:
-            src = workload['src_rank']
-            dst = workload['dst_rank']
-            t_s = workload['start_timestamp(ms)'] // EPOCH # 向下取整
-            t_e = (workload['end_timestamp(ms)'] + EPOCH - 1) // EPOCH # 向上取整
-            bw = workload['bandwidth(Gbps)']
-            workload = Workload(src, dst, t_s, t_e, bw)
-            workloads.append(workload)
-        job_info = JobInfo(job_id, cycle, workloads)
-        jobs.append(job_info)
+def run_traffic_schedule(jobs_file: str, strategy: str,
+                         jobs: list[JobInfo] = None, schedules: dict[int, JobSchedule] = None) -> None:
+    # jobs 与 schedules 为空时从文件加载；否则直接使用内存中的 Phase 1 结果，隧道与拓扑共享 Link 对象
+    if jobs is None:
+        jobs = load_jobs(jobs_file)
     
     print(f"Traffic Scheduling {jobs_file}: {strategy}")
 
     # 从文件中读取 Phase 1 调度结果
-    testcase_name = os.path.splitext(os.path.basename(jobs_file))[0]
-    result_dir = os.path.join("result", testcase_name)
-    schedules: dict[int, JobSchedule] = {}
-    with open(result_dir + '/phase1_job_schedules.txt', 'r') as f:
-        schedules_data = json.load(f)
-    # 将调度结果转换为 JobSchedule 对象
-    for job_id, schedule in schedules_data.items():
-        job_id = int(job_id)
-        tunnels: list[list[Link]] = []
-        for tunnel_data in schedule['tunnels']:
-            tunnel: list[Link] = []
-            for link_data in tunnel_data:
-                link = Link(
-                    link_id = link_data['link_id'],
-                    src = link_data['src'],
-                    dst = link_data['dst'],
-                    capacity = link_data['capacity']
-                )
-                tunnel.append(link)
-            tunnels.append(tunnel)
-        schedules[job_id] = JobSchedule(
-            admit = int(schedule['admit']),
-            start_time = int(schedule['start_time']),
-            tunnels = tunnels,
-            bw_alloc = list(map(float, schedule['bw_alloc']))
-        )
+    if schedules is None:
+        schedules = load_job_schedules(schedule_file(jobs_file), network)
         # NOTE：这里jobs[job_id].cycle可能index报错，因为jobs是list，之后可以改成dict，key是job_id
         # if schedules[job_id].admit == 1:
         #     job_start_time.append(schedules[job_id].start_time / jobs[job_id].cycle)
@@ -225,9 +228,10 @@ def run_traffic_schedule(jobs_file: str, strategy: str) -> None:
 
     if strategy == "Ours":
 
-        traffic_scheduler = TrafficScheduler(network, new_jobs, schedules)
+        traffic_scheduler = TrafficScheduler(network, new_jobs, schedules, solver=LPSolver(lp_backend))
         flow, total_workload_bw = traffic_scheduler.update_schedule()
         print("Allocated Total Flow: ", flow)
+        print(traffic_scheduler.bottleneck_cache.report())
         total_flow.append(flow)
         traffic_rate.append(flow / total_workload_bw)    
 
@@ -237,6 +241,20 @@ def run_traffic_schedule(jobs_file: str, strategy: str) -> None:
                     peak_bw = traffic_scheduler.calculate_peak_bw(link.link_id)
                     f.write(f"{peak_bw / link.capacity}\n") 
     
+    elif strategy == "Joint":
+
+        traffic_scheduler = TrafficScheduler(network, new_jobs, schedules, solver=LPSolver(lp_backend))
+        flow, total_workload_bw = traffic_scheduler.joint_schedule()
+        print("Allocated Total Flow: ", flow)
+        total_flow.append(flow)
+        traffic_rate.append(flow / total_workload_bw)
+
+        with open(TRAFFIC_SCHEDULE_RESULT_FILE, 'a') as f:
+            for node in network.nodes:
+                for link in network.edges[node]:
+                    peak_bw = traffic_scheduler.calculate_peak_bw(link.link_id)
+                    f.write(f"{peak_bw / link.capacity}\n") 
+
     elif strategy == "Greedy":
     
         traffic_scheduler = Greedy(network, new_jobs, schedules)
@@ -252,10 +270,14 @@ def run_traffic_schedule(jobs_file: str, strategy: str) -> None:
                     peak_bw = traffic_scheduler.link_peak_bw[link.link_id]
                     f.write(f"{peak_bw / link.capacity}\n") 
 
-    elif strategy == "NCFlow":
+    elif strategy in ("NCFlow", "NCFlow-P"):
 
-        traffic_scheduler = NCFlow(network, new_jobs, schedules)
-        flow, total_workload_bw = traffic_scheduler.schedule()
+        traffic_scheduler = NCFlow(network, new_jobs, schedules, solver=LPSolver(lp_backend, time_limit=2))
+        if strategy == "NCFlow":
+            flow, total_workload_bw = traffic_scheduler.schedule()
+        else:
+            # 按 CORE 划分集群，集群内子问题在多个进程中并行求解
+            flow, total_workload_bw = traffic_scheduler.partitioned_schedule(workers)
         print("Allocated Total Flow: ", flow)
         total_flow.append(flow)
         traffic_rate.append(flow / total_workload_bw)
@@ -269,7 +291,7 @@ def run_traffic_schedule(jobs_file: str, strategy: str) -> None:
     
     elif strategy == "IGR":
 
-        traffic_scheduler = IGR(network, new_jobs, schedules)
+        traffic_scheduler = IGR(network, new_jobs, schedules, solver=LPSolver(lp_backend), workers=workers if workers is not None else 1)
         flow, total_workload_bw = traffic_scheduler.schedule()
         print("Allocated Total Flow: ", flow)
         total_flow.append(flow)
@@ -283,7 +305,15 @@ def run_traffic_schedule(jobs_file: str, strategy: str) -> None:
                     f.write(f"{peak_bw / link.capacity}\n") 
 
     end_time = time.time()
-    measure_runtime.append(int((end_time - start_time) * 1000 / len(new_jobs)))
+    schedule_runtime.append(int((end_time - start_time) * 1000 / len(new_jobs)))
+
+    # 累计 LP 后端耗时
+    if hasattr(traffic_scheduler, 'solver'):
+        for backend, stats in traffic_scheduler.solver.stats.items():
+            total_stats = solver_stats.setdefault(backend, BackendStats())
+            total_stats.models += stats.models
+            total_stats.build_time += stats.build_time
+            total_stats.solve_time += stats.solve_time
 
     # 保存流量总和到文件
     # with open(TRAFFIC_SCHEDULE_RESULT_FILE, 'a') as f:
@@ -293,18 +323,41 @@ if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description="Run test with different strategies.")
     parser.add_argument("--phase", type=int, default=1,
-                        choices=[1, 2], 
-                        help="Phase to Run (1 or 2, default: 1)")
+                        choices=[1, 2, 3], 
+                        help="Phase to Run (1, 2, or 3 = Phase 1 + Phase 2 in memory, default: 1)")
     parser.add_argument("--scenario", type=str, default="FCFS", 
                     choices=["FCFS", "SJF"], 
                     help="Admission Control Scenario (default: FCFS)")
     parser.add_argument("--strategy1", type=str, default="Ours", 
-                        choices=["Ours", "BATE", "Aequitas", "Seawall"], 
+                        choices=["Ours", "BATE", "Aequitas", "Aequitas-C", "Seawall"], 
                         help="Admission Control Strategy (default: Ours)")
     parser.add_argument("--strategy2", type=str, default="Ours",
-                        choices=["Ours", "Greedy", "NCFlow", "IGR"], 
+                        choices=["Ours", "Joint", "Greedy", "NCFlow", "NCFlow-P", "IGR"], 
                         help="Traffic Scheduling Strategy (default: Ours)")
+    parser.add_argument("--lp-backend", type=str, default="auto",
+                        choices=BACKENDS,
+                        help="LP Solver Backend for Phase 2 (default: auto, Gurobi if licensed else HiGHS)")
+    parser.add_argument("--save-schedules", action="store_true",
+                        help="Save Phase 1 schedules for a later --phase 2 run")
+    parser.add_argument("--adjust-budget", type=float, default=None,
+                        help="Wall-clock budget per job for local adjustment in ms (Ours, default: unlimited)")
+    parser.add_argument("--optimize-start", type=float, default=None,
+                        help="Re-optimize start times of admitted jobs between admissions, time limit in ms (Ours)")
+    parser.add_argument("--decision-cache", action="store_true",
+                        help="Answer resubmitted jobs from the admission decision cache when their links are unchanged (Ours)")
+    parser.add_argument("--preempt", action="store_true",
+                        help="Evict lower-priority (larger) admitted jobs when a job is rejected (Ours)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for NCFlow-P subproblems and IGR group reduction "
+                             "(default: one per CPU for NCFlow-P, serial IGR)")
     args = parser.parse_args()
+    lp_backend = args.lp_backend
+    workers = args.workers
+    save_schedules = args.save_schedules
+    preempt = args.preempt
+    decision_cache = args.decision_cache
+    optimize_budget = None if args.optimize_start is None else args.optimize_start / 1000
+    adjust_budget = None if args.adjust_budget is None else args.adjust_budget / 1000
 
     # 加载拓扑
     topology_file = 'data/topology/link_list_tmp.csv'
@@ -320,6 +373,9 @@ if __name__ == '__main__':
                     run_admission_control(jobs_file, args.scenario, args.strategy1)
                 elif args.phase == 2:
                     run_traffic_schedule(jobs_file, args.strategy2)
+                elif args.phase == 3:
+                    jobs, schedules = run_admission_control(jobs_file, args.scenario, args.strategy1)
+                    run_traffic_schedule(jobs_file, args.strategy2, jobs, schedules)
             except Exception as e:
                 print(f"Error processing testcase {i}: {str(e)}")
         else:
@@ -330,7 +386,7 @@ if __name__ == '__main__':
     # run_admission_control(job_file, args.scenario, args.strategy1)
     # run_traffic_schedule(job_file, args.strategy2)
 
-    if args.phase == 1:
+    if args.phase in (1, 3):
         print(f"Phase 1: {args.scenario} {args.strategy1}")
         # 准入率
         print(f"Admit Rate: {[round(rate, 4) for rate in admit_rate]}")
@@ -340,13 +396,16 @@ if __name__ == '__main__':
         print("Average runtime:", sum(measure_runtime) / len(measure_runtime))
         if args.strategy1 == "Ours":
             print("Average adjust rate:", sum(adjust_rate) / len(adjust_rate))
-    elif args.phase == 2:
+    if args.phase in (2, 3):
         print(job_start_time)
         print(f"Phase 2: {args.strategy2}")
-        print("Runtime:", measure_runtime)
-        print("Average Runtime:", sum(measure_runtime) / len(measure_runtime))
+        print("Runtime:", schedule_runtime)
+        print("Average Runtime:", sum(schedule_runtime) / len(schedule_runtime))
         print("Total Flow:", total_flow)
         print("Average Total Flow:", sum(total_flow) / len(total_flow))
         print("Traffic Rate:", traffic_rate)
         print("Average Traffic Rate:", sum(traffic_rate) / len(traffic_rate))
+        for backend, stats in solver_stats.items():
+            print(f"LP Backend {backend}: models = {stats.models}, "
+                  f"build = {stats.build_time * 1000:.2f} ms, solve = {stats.solve_time * 1000:.2f} ms")
 
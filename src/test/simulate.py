@@ -0,0 +1,132 @@
+import os
+import random
+import pandas as pd
+import time
+import argparse
+
+# 将父目录（即 src）添加到包导入搜索路径中
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from network.graph import Graph
+from phase1.admission_control import AdmissionController
+from phase2.traffic_schedule import TrafficScheduler
+from job.job_info import JobInfo
+from job.job_io import load_jobs
+from workload_fluctuate import random_fluctuate
+from params import SCHEDULE_INTERVAL
+from solver.lp_backend import LPSolver, BACKENDS
+
+# 在线仿真：准入任务后，每隔 SCHEDULE_INTERVAL 个 epoch 负载发生波动，并进行一次增量流量调度
+# 控制器状态（准入结果、链路负载、LP 模型）在各轮之间常驻内存
+
+def admit_jobs(network: Graph, jobs: list[JobInfo], scenario: str) -> AdmissionController:
+
+    if scenario == "SJF":
+        jobs = sorted(jobs, key=lambda x: sum(w.bw for w in x.workloads))
+
+    admission_controller = AdmissionController(network)
+    for job in jobs:
+        # Step 1：直接部署；Step 2: 局部调整
+        if admission_controller.direct_deploy(job) == 0:
+            admission_controller.local_adjust(job)
+    return admission_controller
+
+def trace_rounds(trace_dir: str) -> list[str]:
+    # 轨迹目录中每个任务文件对应一轮，按文件名顺序回放
+    return [os.path.join(trace_dir, name) for name in sorted(os.listdir(trace_dir)) if name.endswith('.json')]
+
+def simulate(network: Graph, jobs_file: str, scenario: str, rounds: int, trace_dir: str, backend: str, persistent: bool) -> None:
+
+    jobs = load_jobs(jobs_file)
+
+    # Phase 1：准入
+    start_time = time.time()
+    admission_controller = admit_jobs(network, jobs, scenario)
+    admission_ms = (time.time() - start_time) * 1000
+
+    admitted: dict[int, JobInfo] = {
+        job.job_id: job for job in jobs
+        if admission_controller.job_schedules[job.job_id].admit == 1
+    }
+    print(f"Admitted jobs / Total jobs = {len(admitted)} / {len(jobs)}, admission time = {admission_ms:.2f} ms")
+    if not admitted:
+        return
+
+    traffic_scheduler = TrafficScheduler(
+        network, admitted, admission_controller.job_schedules,
+        solver=LPSolver(backend), persistent=persistent
+    )
+
+    traces = trace_rounds(trace_dir) if trace_dir else []
+    if traces:
+        rounds = min(rounds, len(traces))
+
+    round_latency: list[float] = []
+    round_rate: list[float] = []
+
+    current_jobs = admitted
+    for round_id in range(rounds + 1):
+
+        # 第 0 轮为初始调度，之后每轮为一次负载波动
+        if round_id > 0:
+            if traces:
+                trace_jobs = {job.job_id: job for job in load_jobs(traces[round_id - 1])}
+                # 轨迹只能改变已准入任务的负载时间窗口和带宽，隧道沿用 Phase 1 的结果
+                current_jobs = {
+                    job_id: trace_jobs[job_id] for job_id in admitted
+                    if job_id in trace_jobs and len(trace_jobs[job_id].workloads) == len(admitted[job_id].workloads)
+                }
+            else:
+                current_jobs = {job.job_id: job for job in random_fluctuate(list(current_jobs.values()))}
+
+        start_time = time.time()
+        flow, total_workload_bw = traffic_scheduler.reschedule(current_jobs)
+        latency_ms = (time.time() - start_time) * 1000
+
+        rate = flow / total_workload_bw if total_workload_bw > 0 else 1.0
+        round_latency.append(latency_ms)
+        round_rate.append(rate)
+        print(f"Round {round_id} (t = {round_id * SCHEDULE_INTERVAL} epoch): "
+              f"latency = {latency_ms:.2f} ms, flow = {flow:.2f} / {total_workload_bw:.2f} = {rate:.4f}, "
+              f"rescheduled workloads = {traffic_scheduler.last_affected} / {len(traffic_scheduler.allocation)}")
+
+    print("Round latency (ms):", [round(latency, 2) for latency in round_latency])
+    print("Traffic rate:", [round(rate, 4) for rate in round_rate])
+    if len(round_latency) > 1:
+        # 去掉初始调度，统计稳态重调度开销
+        steady = round_latency[1:]
+        print("Average steady-state latency (ms):", sum(steady) / len(steady))
+    print("Average traffic rate:", sum(round_rate) / len(round_rate))
+    print(traffic_scheduler.solver.report())
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Run online multi-round simulation.")
+    parser.add_argument("--jobs", type=str, default="data/jobs/testcase10.json",
+                        help="Jobs file to admit")
+    parser.add_argument("--topology", type=str, default="data/topology/link_list_tmp.csv",
+                        help="Path to the topology CSV file")
+    parser.add_argument("--scenario", type=str, default="FCFS",
+                        choices=["FCFS", "SJF"],
+                        help="Admission Control Scenario (default: FCFS)")
+    parser.add_argument("--rounds", type=int, default=10,
+                        help="Number of SCHEDULE_INTERVAL ticks to simulate")
+    parser.add_argument("--trace", type=str, default=None,
+                        help="Directory of per-round jobs files to replay instead of random_fluctuate")
+    parser.add_argument("--lp-backend", type=str, default="auto",
+                        choices=BACKENDS,
+                        help="LP Solver Backend (default: auto)")
+    parser.add_argument("--persistent", action="store_true",
+                        help="Keep a warm-started Gurobi model across rounds")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Random seed for reproducibility")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    topology_df = pd.read_csv(args.topology)
+    network: Graph = Graph.from_dataframe(topology_df)
+
+    simulate(network, args.jobs, args.scenario, args.rounds, args.trace, args.lp_backend, args.persistent)